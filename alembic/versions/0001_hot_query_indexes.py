@@ -0,0 +1,66 @@
+"""Indexes for the hot trading, settlement and listing queries
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 09:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tables are still created by Base.metadata.create_all, which also
+    # creates these indexes on fresh databases; hence if_not_exists.
+    op.create_index(
+        "ix_shares_user_id_event_id",
+        "shares",
+        ["user_id", "event_id"],
+        if_not_exists=True,
+    )
+    op.create_index("ix_shares_event_id", "shares", ["event_id"], if_not_exists=True)
+    op.create_index(
+        "ix_shares_limit_price",
+        "shares",
+        ["limit_price"],
+        sqlite_where=sa.text("limit_price IS NOT NULL"),
+        postgresql_where=sa.text("limit_price IS NOT NULL"),
+        if_not_exists=True,
+    )
+    op.create_index(
+        "ix_events_match_id_resolved",
+        "events",
+        ["match_id", "resolved"],
+        if_not_exists=True,
+    )
+    op.create_index(
+        "ix_events_unresolved_match_id",
+        "events",
+        ["match_id"],
+        sqlite_where=sa.text("resolved = 0"),
+        postgresql_where=sa.text("resolved = false"),
+        if_not_exists=True,
+    )
+    op.create_index(
+        "ix_matches_bet_end_time", "matches", ["bet_end_time"], if_not_exists=True
+    )
+    op.create_index(
+        "ix_matches_match_time", "matches", ["match_time"], if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_index("ix_matches_match_time", table_name="matches")
+    op.drop_index("ix_matches_bet_end_time", table_name="matches")
+    op.drop_index("ix_events_unresolved_match_id", table_name="events")
+    op.drop_index("ix_events_match_id_resolved", table_name="events")
+    op.drop_index("ix_shares_limit_price", table_name="shares")
+    op.drop_index("ix_shares_event_id", table_name="shares")
+    op.drop_index("ix_shares_user_id_event_id", table_name="shares")
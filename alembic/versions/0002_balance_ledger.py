@@ -0,0 +1,87 @@
+"""Integer balances with an append-only ledger and balance snapshots
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 11:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+ID_TYPE = sa.BigInteger().with_variant(sa.Integer, "sqlite")
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    user_columns = {column["name"] for column in inspector.get_columns("users")}
+
+    if "balance_minor" not in user_columns:
+        op.add_column(
+            "users",
+            sa.Column("balance_minor", sa.BigInteger, nullable=False, server_default="0"),
+        )
+    if "sweeps_points" in user_columns:
+        op.execute(
+            "UPDATE users SET balance_minor = "
+            "CAST(ROUND(COALESCE(sweeps_points, 0) * 100) AS BIGINT)"
+        )
+
+    tables = inspector.get_table_names()
+    if "ledger_entries" not in tables:
+        op.create_table(
+            "ledger_entries",
+            sa.Column("id", ID_TYPE, primary_key=True),
+            sa.Column("user_id", sa.String, sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("amount_minor", sa.BigInteger, nullable=False),
+            sa.Column("balance_after", sa.BigInteger, nullable=False),
+            sa.Column("kind", sa.String, nullable=False),
+            sa.Column("reference", sa.String, nullable=True),
+            sa.Column(
+                "created_at", sa.DateTime, server_default=sa.func.now(), nullable=False
+            ),
+        )
+        op.create_index(
+            "ix_ledger_entries_user_id_id", "ledger_entries", ["user_id", "id"]
+        )
+    if "balance_snapshots" not in tables:
+        op.create_table(
+            "balance_snapshots",
+            sa.Column("id", ID_TYPE, primary_key=True),
+            sa.Column("user_id", sa.String, sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("balance_minor", sa.BigInteger, nullable=False),
+            sa.Column("last_entry_id", sa.BigInteger, nullable=False),
+            sa.Column(
+                "taken_at", sa.DateTime, server_default=sa.func.now(), nullable=False
+            ),
+        )
+        op.create_index(
+            "ix_balance_snapshots_user_id_id", "balance_snapshots", ["user_id", "id"]
+        )
+
+    # Opening snapshot of every migrated balance
+    op.execute(
+        "INSERT INTO balance_snapshots (user_id, balance_minor, last_entry_id, taken_at) "
+        "SELECT id, balance_minor, 0, CURRENT_TIMESTAMP FROM users"
+    )
+
+
+def downgrade():
+    op.drop_index("ix_balance_snapshots_user_id_id", table_name="balance_snapshots")
+    op.drop_table("balance_snapshots")
+    op.drop_index("ix_ledger_entries_user_id_id", table_name="ledger_entries")
+    op.drop_table("ledger_entries")
+
+    user_columns = {
+        column["name"] for column in sa.inspect(op.get_bind()).get_columns("users")
+    }
+    if "sweeps_points" in user_columns:
+        op.execute("UPDATE users SET sweeps_points = balance_minor / 100.0")
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.drop_column("balance_minor")
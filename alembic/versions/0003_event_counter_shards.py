@@ -0,0 +1,42 @@
+"""Sharded event yes/no counters
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if "event_counter_shards" in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        "event_counter_shards",
+        sa.Column("event_id", sa.Integer, sa.ForeignKey("events.id"), primary_key=True),
+        sa.Column("shard", sa.Integer, primary_key=True),
+        sa.Column("yes_delta", sa.Integer, nullable=False, server_default="0"),
+        sa.Column("no_delta", sa.Integer, nullable=False, server_default="0"),
+    )
+
+
+def downgrade():
+    # Fold outstanding shards into the events rows before dropping them
+    op.execute(
+        "UPDATE events SET "
+        "total_yes_bets = COALESCE(total_yes_bets, 0) + COALESCE(("
+        "SELECT SUM(yes_delta) FROM event_counter_shards s WHERE s.event_id = events.id"
+        "), 0), "
+        "total_no_bets = COALESCE(total_no_bets, 0) + COALESCE(("
+        "SELECT SUM(no_delta) FROM event_counter_shards s WHERE s.event_id = events.id"
+        "), 0)"
+    )
+    op.drop_table("event_counter_shards")
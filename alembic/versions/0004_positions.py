@@ -0,0 +1,60 @@
+"""Materialized net positions per user and event
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 13:00:00
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if "positions" not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            "positions",
+            sa.Column(
+                "user_id", sa.String, sa.ForeignKey("users.id"), primary_key=True
+            ),
+            sa.Column(
+                "event_id", sa.Integer, sa.ForeignKey("events.id"), primary_key=True
+            ),
+            sa.Column("outcome", sa.String, nullable=False),
+            sa.Column("net_shares", sa.Float, nullable=False, server_default="0"),
+            sa.Column("avg_cost", sa.Float, nullable=False, server_default="0"),
+            sa.Column(
+                "realized_pnl_minor", sa.BigInteger, nullable=False, server_default="0"
+            ),
+            sa.Column(
+                "updated_at", sa.DateTime, server_default=sa.func.now(), nullable=False
+            ),
+        )
+        op.create_index("ix_positions_event_id", "positions", ["event_id"])
+
+    # Backfill from the open lots. Realized PnL before this point is not
+    # recoverable from the lots and starts at zero.
+    op.execute(
+        "INSERT INTO positions "
+        "(user_id, event_id, outcome, net_shares, avg_cost, realized_pnl_minor, updated_at) "
+        "SELECT user_id, event_id, MAX(outcome), "
+        "SUM(CASE WHEN bet_type = 'buy' THEN amount ELSE -amount END), "
+        "SUM(amount * share_price) / SUM(amount), 0, CURRENT_TIMESTAMP "
+        "FROM shares "
+        "WHERE amount > 0 AND user_id IS NOT NULL "
+        "AND NOT EXISTS (SELECT 1 FROM positions p "
+        "WHERE p.user_id = shares.user_id AND p.event_id = shares.event_id) "
+        "GROUP BY user_id, event_id"
+    )
+
+
+def downgrade():
+    op.drop_index("ix_positions_event_id", table_name="positions")
+    op.drop_table("positions")
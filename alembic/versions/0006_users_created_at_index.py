@@ -0,0 +1,26 @@
+"""Index for keyset pagination of the user listing
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 18:00:00
+
+"""
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_users_created_at_id", "users", ["created_at", "id"], if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_index("ix_users_created_at_id", table_name="users")
@@ -0,0 +1,57 @@
+"""Per-user trading summary counters
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 19:00:00
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if "user_stats" not in sa.inspect(op.get_bind()).get_table_names():
+        op.create_table(
+            "user_stats",
+            sa.Column(
+                "user_id", sa.String, sa.ForeignKey("users.id"), primary_key=True
+            ),
+            sa.Column("bets_placed", sa.Integer, nullable=False, server_default="0"),
+            sa.Column(
+                "volume_minor", sa.BigInteger, nullable=False, server_default="0"
+            ),
+            sa.Column(
+                "realized_pnl_minor", sa.BigInteger, nullable=False, server_default="0"
+            ),
+            sa.Column("last_trade_at", sa.DateTime, nullable=True),
+        )
+
+    # Backfill from the open lots and the positions. Closed lots are deleted,
+    # so orders before this point are only counted while their lots are open.
+    op.execute(
+        "INSERT INTO user_stats "
+        "(user_id, bets_placed, volume_minor, realized_pnl_minor, last_trade_at) "
+        "SELECT users.id, COALESCE(lots.bets, 0), COALESCE(lots.volume, 0), "
+        "COALESCE(pnl.realized, 0), lots.last_trade_at "
+        "FROM users "
+        "LEFT JOIN (SELECT user_id, COUNT(*) AS bets, "
+        "CAST(ROUND(SUM(amount * share_price)) AS BIGINT) AS volume, "
+        "MAX(created_at) AS last_trade_at FROM shares GROUP BY user_id) lots "
+        "ON lots.user_id = users.id "
+        "LEFT JOIN (SELECT user_id, SUM(realized_pnl_minor) AS realized "
+        "FROM positions GROUP BY user_id) pnl ON pnl.user_id = users.id "
+        "WHERE (lots.user_id IS NOT NULL OR pnl.user_id IS NOT NULL) "
+        "AND NOT EXISTS (SELECT 1 FROM user_stats s WHERE s.user_id = users.id)"
+    )
+
+
+def downgrade():
+    op.drop_table("user_stats")
@@ -0,0 +1,69 @@
+"""Append-only trade history
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 20:00:00
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if "trades" in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        "trades",
+        sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column("user_id", sa.String, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("event_id", sa.Integer, sa.ForeignKey("events.id"), nullable=False),
+        sa.Column("outcome", sa.String, nullable=False),
+        sa.Column("bet_type", sa.String, nullable=False),
+        sa.Column("shares", sa.Float, nullable=False),
+        sa.Column("price", sa.Float, nullable=False),
+        sa.Column(
+            "realized_pnl_minor", sa.BigInteger, nullable=False, server_default="0"
+        ),
+        sa.Column("source", sa.String, nullable=False),
+        sa.Column(
+            "created_at", sa.DateTime, server_default=sa.func.now(), nullable=False
+        ),
+    )
+    op.create_index(
+        "ix_trades_user_history",
+        "trades",
+        [
+            "user_id",
+            "created_at",
+            "id",
+            "event_id",
+            "outcome",
+            "bet_type",
+            "shares",
+            "price",
+            "realized_pnl_minor",
+        ],
+    )
+
+    # Seed with the lots still open; closed lots were deleted and are lost
+    op.execute(
+        "INSERT INTO trades "
+        "(user_id, event_id, outcome, bet_type, shares, price, realized_pnl_minor, "
+        "source, created_at) "
+        "SELECT user_id, event_id, outcome, bet_type, amount, share_price, 0, "
+        "'trade', created_at FROM shares "
+        "WHERE amount > 0 AND user_id IS NOT NULL ORDER BY created_at, id"
+    )
+
+
+def downgrade():
+    op.drop_index("ix_trades_user_history", table_name="trades")
+    op.drop_table("trades")
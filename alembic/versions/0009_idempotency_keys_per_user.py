@@ -0,0 +1,64 @@
+"""Scope Idempotency-Keys by user
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 21:00:00
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def create_table(primary_key):
+    op.create_table(
+        "idempotency_keys",
+        *primary_key,
+        sa.Column("request_hash", sa.String, nullable=False),
+        sa.Column("response", sa.JSON, nullable=False),
+        sa.Column(
+            "created_at", sa.DateTime, server_default=sa.func.now(), nullable=False
+        ),
+    )
+    op.create_index(
+        "ix_idempotency_keys_created_at", "idempotency_keys", ["created_at"]
+    )
+
+
+def drop_table():
+    op.drop_index("ix_idempotency_keys_created_at", table_name="idempotency_keys")
+    op.drop_table("idempotency_keys")
+
+
+def upgrade():
+    columns = sa.inspect(op.get_bind()).get_columns("idempotency_keys")
+    if "user_id" in {column["name"] for column in columns}:
+        return
+    # The table only holds responses for replays within
+    # IDEMPOTENCY_TTL_SECONDS, none of which can be matched to a user, so
+    # it is recreated with the new primary key instead of migrated.
+    drop_table()
+    create_table(
+        [
+            sa.Column("endpoint", sa.String, primary_key=True),
+            sa.Column("user_id", sa.String, primary_key=True),
+            sa.Column("key", sa.String, primary_key=True),
+        ]
+    )
+
+
+def downgrade():
+    drop_table()
+    create_table(
+        [
+            sa.Column("endpoint", sa.String, primary_key=True),
+            sa.Column("key", sa.String, primary_key=True),
+        ]
+    )
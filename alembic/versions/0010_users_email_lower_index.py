@@ -0,0 +1,27 @@
+"""Index for case-insensitive email lookups
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-19 22:00:00
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        "ix_users_email_lower", "users", [sa.text("lower(email)")], if_not_exists=True
+    )
+
+
+def downgrade():
+    op.drop_index("ix_users_email_lower", table_name="users")
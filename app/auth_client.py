@@ -0,0 +1,194 @@
+"""
+Identity-provider calls for the auth endpoints, kept off the event loop.
+
+The provider's user-management calls (`create_user`, `get_user`,
+`update_user`, ...) are blocking HTTP requests to Firebase. `AuthClient`
+runs them on its own bounded thread pool, so they never block the event
+loop in async handlers, and a sync endpoint holds its worker thread (shared
+with trading) for at most AUTH_CLIENT_TIMEOUT seconds. A call still queued
+when it times out is cancelled; one already running finishes in the
+background, and since the pool is bounded at most AUTH_CLIENT_WORKERS of
+those exist.
+
+A circuit breaker counts timeouts and service failures (not bad requests
+such as an unknown user). After AUTH_CIRCUIT_FAILURES in a row it opens and
+calls fail at once with `AuthUnavailableError` for AUTH_CIRCUIT_RESET
+seconds; then one trial call is let through, which closes the circuit if it
+succeeds. The endpoints answer both kinds of failure with 503, so a slow
+or failing provider costs the auth endpoints a quick error and nothing else.
+"""
+
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from .auth_providers import (
+    AuthProvider,
+    AuthProviderError,
+    AuthServiceError,
+    AuthUser,
+    auth_provider,
+)
+
+AUTH_CLIENT_WORKERS = int(os.getenv("AUTH_CLIENT_WORKERS", "8"))
+AUTH_CLIENT_TIMEOUT = float(os.getenv("AUTH_CLIENT_TIMEOUT_SECONDS", "10"))
+AUTH_CIRCUIT_FAILURES = int(os.getenv("AUTH_CIRCUIT_FAILURES", "5"))
+AUTH_CIRCUIT_RESET = float(os.getenv("AUTH_CIRCUIT_RESET_SECONDS", "30"))
+# Batch imports hash up to IMPORT_BATCH_SIZE passwords before their request
+AUTH_IMPORT_TIMEOUT = float(os.getenv("AUTH_IMPORT_TIMEOUT_SECONDS", "120"))
+
+
+class AuthUnavailableError(AuthServiceError):
+    """Raised when a call timed out or the circuit to the provider is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures. Once `reset_timeout`
+    has passed, one trial call is allowed (and the timer restarted, so a lost
+    trial is retried later); its success closes the circuit.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def allow(self) -> bool:
+        """Whether a call may go through now."""
+        with self._lock:
+            state = self.state
+            if state == "half-open":
+                self.opened_at = time.monotonic()
+            return state != "open"
+
+    def success(self):
+        with self._lock:
+            if self.opened_at is not None:
+                logging.info("Auth provider circuit closed")
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logging.info(
+                        f"Auth provider circuit opened after {self.failures} failures"
+                    )
+                self.opened_at = time.monotonic()
+
+
+class AuthClient:
+    """The provider's user-management calls on a bounded pool, with timeouts."""
+
+    def __init__(
+        self,
+        provider: AuthProvider = auth_provider,
+        workers: int = AUTH_CLIENT_WORKERS,
+        timeout: float = AUTH_CLIENT_TIMEOUT,
+        breaker: CircuitBreaker = None,
+    ):
+        self.provider = provider
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker(
+            AUTH_CIRCUIT_FAILURES, AUTH_CIRCUIT_RESET
+        )
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="auth-client"
+        )
+
+    def _submit(self, method: str, args, kwargs) -> concurrent.futures.Future:
+        if not self.breaker.allow():
+            raise AuthUnavailableError("The identity provider is unavailable.")
+        return self._executor.submit(getattr(self.provider, method), *args, **kwargs)
+
+    def _settle(self, future: concurrent.futures.Future):
+        """The call's result, feeding its outcome to the circuit breaker."""
+        try:
+            result = future.result(timeout=0)
+        except AuthServiceError:
+            self.breaker.failure()
+            raise
+        except AuthProviderError:
+            # The provider answered; the request was wrong
+            self.breaker.success()
+            raise
+        except Exception as e:
+            self.breaker.failure()
+            raise AuthServiceError(str(e)) from e
+        self.breaker.success()
+        return result
+
+    def _timed_out(self, method: str, timeout: float):
+        self.breaker.failure()
+        return AuthUnavailableError(
+            f"The identity provider did not answer {method} within {timeout:g}s."
+        )
+
+    async def call(self, method: str, *args, timeout: Optional[float] = None, **kwargs):
+        """
+        Run a provider method on the pool and await it, for at most `timeout`
+        seconds (AUTH_CLIENT_TIMEOUT by default).
+
+        Raises:
+            AuthUnavailableError: The circuit is open or the call timed out.
+            AuthProviderError: The provider rejected or failed the call.
+        """
+        timeout = timeout or self.timeout
+        future = self._submit(method, args, kwargs)
+        try:
+            await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out(method, timeout) from None
+        except Exception:
+            pass  # Raised again by _settle
+        return self._settle(future)
+
+    def call_sync(self, method: str, *args, timeout: Optional[float] = None, **kwargs):
+        """`call` for sync endpoints, which already run on a worker thread."""
+        timeout = timeout or self.timeout
+        future = self._submit(method, args, kwargs)
+        try:
+            future.exception(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise self._timed_out(method, timeout) from None
+        return self._settle(future)
+
+    async def create_user(self, email: str, password: str, **fields) -> AuthUser:
+        return await self.call("create_user", email, password, **fields)
+
+    async def get_user(self, uid: str) -> AuthUser:
+        return await self.call("get_user", uid)
+
+    async def get_user_by_email(self, email: str) -> AuthUser:
+        return await self.call("get_user_by_email", email)
+
+    async def update_user(self, uid: str, **fields) -> AuthUser:
+        return await self.call("update_user", uid, **fields)
+
+    async def import_users(self, users: List[dict]) -> Dict[int, str]:
+        return await self.call("import_users", users, timeout=AUTH_IMPORT_TIMEOUT)
+
+    async def delete_users(self, uids: List[str]):
+        return await self.call("delete_users", uids, timeout=AUTH_IMPORT_TIMEOUT)
+
+
+auth_client = AuthClient()
@@ -0,0 +1,407 @@
+"""
+Identity providers behind registration, login and profile changes.
+
+The endpoints talk to `auth_provider`, selected with AUTH_PROVIDER:
+
+- "firebase" (default): Firebase Authentication through firebase_admin,
+  with ID tokens checked by app.token_verifier.
+- "local": an in-process stand-in with its own user store that signs JWTs
+  itself (HS256 with LOCAL_AUTH_SECRET, or RS256 with the key in
+  LOCAL_AUTH_PRIVATE_KEY). It needs no network or firebase.json, so
+  benchmarks can register and authenticate tens of thousands of users
+  offline. Users live only as long as the process. Without a configured
+  secret or key each process makes up its own, which only verifies the
+  tokens that process signed, so startup fails if WEB_CONCURRENCY says
+  there is more than one worker.
+"""
+
+import asyncio
+import hashlib
+import os
+import secrets
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import jwt
+from firebase_admin import auth as firebase_auth
+from firebase_admin import exceptions as firebase_exceptions
+
+from .firebase import initialize_firebase
+from .token_verifier import TokenExpiredError, TokenVerificationError, token_verifier
+
+AUTH_PROVIDER = os.getenv("AUTH_PROVIDER", "firebase")
+LOCAL_AUTH_ALGORITHM = os.getenv("LOCAL_AUTH_ALGORITHM", "HS256")
+LOCAL_AUTH_SECRET = os.getenv("LOCAL_AUTH_SECRET")  # HS256
+LOCAL_AUTH_PRIVATE_KEY = os.getenv("LOCAL_AUTH_PRIVATE_KEY")  # PEM file, RS256
+LOCAL_AUTH_TOKEN_TTL = int(os.getenv("LOCAL_AUTH_TOKEN_TTL_SECONDS", "3600"))
+# Cheap on purpose: the stand-in is for load tests, not for real passwords
+LOCAL_AUTH_HASH_ITERATIONS = int(os.getenv("LOCAL_AUTH_HASH_ITERATIONS", "1000"))
+LOCAL_AUTH_ISSUER = "tradex-local-auth"
+# API worker processes, as passed to uvicorn or gunicorn (both read it)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+# Most users Firebase accepts in one import_users call
+IMPORT_BATCH_SIZE = 1000
+# PBKDF2-SHA256 rounds for the password hashes of imported users
+AUTH_IMPORT_HASH_ROUNDS = int(os.getenv("AUTH_IMPORT_HASH_ROUNDS", "10000"))
+
+# Firebase errors that mean the service failed, not that the request was bad
+SERVICE_ERRORS = (
+    firebase_exceptions.UnavailableError,
+    firebase_exceptions.DeadlineExceededError,
+    firebase_exceptions.InternalError,
+    firebase_exceptions.UnknownError,
+    firebase_exceptions.ResourceExhaustedError,
+)
+
+
+class AuthProviderError(Exception):
+    """Raised when the identity provider rejects or fails a request."""
+
+
+class AuthUserNotFoundError(AuthProviderError):
+    """Raised when the provider has no user with the given uid or email."""
+
+
+class AuthServiceError(AuthProviderError):
+    """Raised when the provider itself failed (unreachable, overloaded, internal)."""
+
+
+class AuthUser:
+    """A user record as returned by the provider."""
+
+    def __init__(self, uid: str, email: str, display_name: Optional[str] = None):
+        self.uid = uid
+        self.email = email
+        self.display_name = display_name
+
+
+def new_uid() -> str:
+    """A random uid shaped like Firebase's (28 URL-safe characters)."""
+    return secrets.token_urlsafe(21)
+
+
+class AuthProvider(ABC):
+    """Interface of an identity provider."""
+
+    name = ""
+
+    def initialize(self):
+        """Set up the provider when the app starts."""
+
+    @abstractmethod
+    def create_user(
+        self, email: str, password: str, display_name: Optional[str] = None
+    ) -> AuthUser:
+        """Create a user with a new uid."""
+
+    @abstractmethod
+    def get_user(self, uid: str) -> AuthUser:
+        """The user with `uid`, or AuthUserNotFoundError."""
+
+    @abstractmethod
+    def get_user_by_email(self, email: str) -> AuthUser:
+        """The user with `email`, or AuthUserNotFoundError."""
+
+    @abstractmethod
+    def update_user(self, uid: str, **fields) -> AuthUser:
+        """Change a user's email and/or password."""
+
+    @abstractmethod
+    def import_users(self, users: List[dict]) -> Dict[int, str]:
+        """
+        Create up to IMPORT_BATCH_SIZE users in one request.
+
+        Args:
+            users (list): Dicts with "uid", "email", "password" and optionally
+                "display_name".
+
+        Returns:
+            dict: The reason each user that was not created failed, by its
+                index in `users`.
+        """
+
+    @abstractmethod
+    def delete_users(self, uids: List[str]):
+        """Delete up to IMPORT_BATCH_SIZE users; unknown uids are ignored."""
+
+    @abstractmethod
+    def verify_token(self, token: str) -> dict:
+        """
+        Verify an ID token.
+
+        Returns:
+            dict: The token's claims, with the user's id under "uid".
+
+        Raises:
+            TokenExpiredError: The token has expired.
+            TokenVerificationError: The token is invalid.
+        """
+
+    async def verify_token_async(self, token: str) -> dict:
+        return self.verify_token(token)
+
+
+class FirebaseAuthProvider(AuthProvider):
+    """Firebase Authentication."""
+
+    name = "firebase"
+
+    def initialize(self):
+        initialize_firebase()
+
+    @contextmanager
+    def _errors(self):
+        """Raise firebase_admin's errors as this module's."""
+        try:
+            yield
+        except firebase_auth.UserNotFoundError as e:
+            raise AuthUserNotFoundError(str(e)) from e
+        except SERVICE_ERRORS as e:
+            raise AuthServiceError(str(e)) from e
+        except (firebase_exceptions.FirebaseError, ValueError) as e:
+            raise AuthProviderError(str(e)) from e
+
+    def _call(self, method, *args, **kwargs) -> AuthUser:
+        with self._errors():
+            record = getattr(firebase_auth, method)(*args, **kwargs)
+        return AuthUser(record.uid, record.email, record.display_name)
+
+    def create_user(self, email, password, display_name=None):
+        if display_name:
+            return self._call(
+                "create_user", email=email, password=password, display_name=display_name
+            )
+        return self._call("create_user", email=email, password=password)
+
+    def get_user(self, uid):
+        return self._call("get_user", uid)
+
+    def get_user_by_email(self, email):
+        return self._call("get_user_by_email", email)
+
+    def update_user(self, uid, **fields):
+        return self._call("update_user", uid, **fields)
+
+    def import_users(self, users):
+        # Firebase only imports hashed passwords, so hash them here
+        records = []
+        for user in users:
+            salt = os.urandom(16)
+            records.append(
+                firebase_auth.ImportUserRecord(
+                    uid=user["uid"],
+                    email=user["email"],
+                    display_name=user.get("display_name") or None,
+                    password_hash=hashlib.pbkdf2_hmac(
+                        "sha256",
+                        user["password"].encode(),
+                        salt,
+                        AUTH_IMPORT_HASH_ROUNDS,
+                    ),
+                    password_salt=salt,
+                )
+            )
+        with self._errors():
+            result = firebase_auth.import_users(
+                records,
+                hash_alg=firebase_auth.UserImportHash.pbkdf2_sha256(
+                    rounds=AUTH_IMPORT_HASH_ROUNDS
+                ),
+            )
+        return {error.index: error.reason for error in result.errors}
+
+    def delete_users(self, uids):
+        with self._errors():
+            firebase_auth.delete_users(uids)
+
+    def verify_token(self, token):
+        return token_verifier.verify(token)
+
+    async def verify_token_async(self, token):
+        return await token_verifier.verify_async(token)
+
+
+class LocalAuthProvider(AuthProvider):
+    """In-process users and self-signed tokens, for offline load testing."""
+
+    name = "local"
+
+    def __init__(self, algorithm: str = LOCAL_AUTH_ALGORITHM):
+        self.algorithm = algorithm
+        self._users: Dict[str, dict] = {}
+        self._uids_by_email: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        if algorithm == "RS256":
+            self._signing_key, self._verifying_key = self._rsa_keys()
+            self.configured_key = bool(LOCAL_AUTH_PRIVATE_KEY)
+        else:
+            secret = LOCAL_AUTH_SECRET or secrets.token_hex(32)
+            self._signing_key = self._verifying_key = secret
+            self.configured_key = bool(LOCAL_AUTH_SECRET)
+
+    def initialize(self):
+        if WEB_CONCURRENCY > 1 and not self.configured_key:
+            setting = {"RS256": "LOCAL_AUTH_PRIVATE_KEY"}.get(
+                self.algorithm, "LOCAL_AUTH_SECRET"
+            )
+            raise ValueError(
+                f"AUTH_PROVIDER=local with WEB_CONCURRENCY={WEB_CONCURRENCY} needs "
+                f"{setting}: a key made up by one worker does not verify the "
+                "tokens another worker signed."
+            )
+
+    @staticmethod
+    def _rsa_keys():
+        from cryptography.hazmat.primitives.asymmetric import rsa
+        from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
+        if LOCAL_AUTH_PRIVATE_KEY:
+            with open(LOCAL_AUTH_PRIVATE_KEY, "rb") as pem:
+                private_key = load_pem_private_key(pem.read(), password=None)
+        else:
+            private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        return private_key, private_key.public_key()
+
+    @staticmethod
+    def _hash(password: str, salt: bytes) -> bytes:
+        return hashlib.pbkdf2_hmac(
+            "sha256", password.encode(), salt, LOCAL_AUTH_HASH_ITERATIONS
+        )
+
+    def _record(self, uid: str) -> AuthUser:
+        user = self._users.get(uid)
+        if user is None:
+            raise AuthUserNotFoundError(f"No user record found for uid {uid!r}.")
+        return AuthUser(uid, user["email"], user["display_name"])
+
+    def _add(self, uid: str, email: str, password: str, display_name=None):
+        if len(password) < 6:
+            raise AuthProviderError("Password must be at least 6 characters long.")
+        salt = os.urandom(16)
+        password_hash = self._hash(password, salt)
+        with self._lock:
+            if email in self._uids_by_email:
+                raise AuthProviderError(f"A user with email {email} already exists.")
+            if uid in self._users:
+                raise AuthProviderError(f"A user with uid {uid} already exists.")
+            self._users[uid] = {
+                "email": email,
+                "display_name": display_name,
+                "salt": salt,
+                "password_hash": password_hash,
+            }
+            self._uids_by_email[email] = uid
+
+    def create_user(self, email, password, display_name=None):
+        uid = new_uid()
+        self._add(uid, email, password, display_name)
+        return AuthUser(uid, email, display_name)
+
+    def get_user(self, uid):
+        return self._record(uid)
+
+    def get_user_by_email(self, email):
+        uid = self._uids_by_email.get(email)
+        if uid is None:
+            raise AuthUserNotFoundError(f"No user record found for email {email}.")
+        return self._record(uid)
+
+    def update_user(self, uid, **fields):
+        with self._lock:
+            user = self._users.get(uid)
+            if user is None:
+                raise AuthUserNotFoundError(f"No user record found for uid {uid!r}.")
+            if "email" in fields and fields["email"] != user["email"]:
+                if fields["email"] in self._uids_by_email:
+                    raise AuthProviderError("The email address is already in use.")
+                del self._uids_by_email[user["email"]]
+                self._uids_by_email[fields["email"]] = uid
+                user["email"] = fields["email"]
+            if "password" in fields:
+                user["salt"] = os.urandom(16)
+                user["password_hash"] = self._hash(fields["password"], user["salt"])
+            if "display_name" in fields:
+                user["display_name"] = fields["display_name"]
+        return self._record(uid)
+
+    def import_users(self, users):
+        errors = {}
+        for index, user in enumerate(users):
+            try:
+                self._add(
+                    user["uid"],
+                    user["email"],
+                    user["password"],
+                    user.get("display_name"),
+                )
+            except AuthProviderError as e:
+                errors[index] = str(e)
+        return errors
+
+    def delete_users(self, uids):
+        with self._lock:
+            for uid in uids:
+                user = self._users.pop(uid, None)
+                if user is not None:
+                    del self._uids_by_email[user["email"]]
+
+    def issue_token(self, uid: str, expires_in: int = LOCAL_AUTH_TOKEN_TTL) -> str:
+        """Sign an ID token for a user of the store."""
+        user = self._record(uid)
+        now = int(time.time())
+        claims = {
+            "iss": LOCAL_AUTH_ISSUER,
+            "aud": LOCAL_AUTH_ISSUER,
+            "sub": uid,
+            "email": user.email,
+            "iat": now,
+            "exp": now + expires_in,
+        }
+        return jwt.encode(claims, self._signing_key, algorithm=self.algorithm)
+
+    def sign_in(self, email: str, password: str) -> str:
+        """Check a user's password and return a new ID token."""
+        uid = self._uids_by_email.get(email)
+        user = self._users.get(uid) if uid else None
+        if user is None or not secrets.compare_digest(
+            self._hash(password, user["salt"]), user["password_hash"]
+        ):
+            raise AuthProviderError("Invalid email or password.")
+        return self.issue_token(uid)
+
+    def verify_token(self, token):
+        try:
+            claims = jwt.decode(
+                token,
+                self._verifying_key,
+                algorithms=[self.algorithm],
+                audience=LOCAL_AUTH_ISSUER,
+                issuer=LOCAL_AUTH_ISSUER,
+                options={"require": ["exp", "iat", "sub"]},
+            )
+        except jwt.ExpiredSignatureError as e:
+            raise TokenExpiredError(str(e)) from e
+        except jwt.PyJWTError as e:
+            raise TokenVerificationError(str(e)) from e
+        claims["uid"] = claims["sub"]
+        return claims
+
+    async def verify_token_async(self, token):
+        if self.algorithm == "HS256":
+            return self.verify_token(token)  # A few microseconds: not worth a thread
+        return await asyncio.to_thread(self.verify_token, token)
+
+
+PROVIDERS = {
+    provider.name: provider for provider in (FirebaseAuthProvider, LocalAuthProvider)
+}
+
+if AUTH_PROVIDER not in PROVIDERS:
+    raise ValueError(
+        f"Unknown AUTH_PROVIDER {AUTH_PROVIDER!r}; expected one of {sorted(PROVIDERS)}"
+    )
+
+auth_provider: AuthProvider = PROVIDERS[AUTH_PROVIDER]()
@@ -0,0 +1,201 @@
+"""
+Backtest the AI bot's betting strategy against resolved events.
+
+Usage:
+    python -m app.backtest --workers 8 --top 20 --csv backtest.csv
+"""
+
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Sequence
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from . import counters, pricing
+from .db_config import get_db
+from .helper import predict_matchups
+from .models import Event, Match
+
+# Strategy parameters, in the column order used by `simulate`. The live bot
+# in `size_ai_bet` corresponds to (0.8, 0.6, 0.5, 0.75, base_bet).
+PARAMETERS = ["high_threshold", "mid_threshold", "high_scale", "mid_scale", "base_bet"]
+
+
+def load_history(db: Session) -> Dict[str, np.ndarray]:
+    """
+    Load resolved events with a winner and the model's predictions for them.
+
+    The market price the bot would have paid is taken from the event's
+    final yes/no totals. Draws, unresolved events and match-ups with teams
+    missing from the stats dataset are left out.
+
+    Returns:
+        dict: Arrays aligned by event: event_id, prob_team1, prob_team2,
+        yes_price, no_price and yes_won.
+    """
+    rows = (
+        db.query(Event, Match)
+        .join(Match, Event.match_id == Match.id)
+        .filter(
+            Event.resolved == True,
+            or_(Event.winner == Match.team1, Event.winner == Match.team2),
+        )
+        .all()
+    )
+
+    prob_team1, prob_team2 = predict_matchups([(m.team1, m.team2) for _, m in rows])
+    totals = counters.get_totals_many(db, [event.id for event, _ in rows])
+    yes_totals, no_totals = (
+        np.array([totals[event.id] for event, _ in rows], dtype=float).reshape(-1, 2).T
+    )
+    prices = np.column_stack(pricing.engine.quote(yes_totals, no_totals, "buy"))
+
+    known = ~(np.isnan(prob_team1) | np.isnan(prob_team2))
+    return {
+        "event_id": np.array([event.id for event, _ in rows], dtype=np.int64)[known],
+        "prob_team1": prob_team1[known],
+        "prob_team2": prob_team2[known],
+        "yes_price": prices[known, 0],
+        "no_price": prices[known, 1],
+        # "yes" corresponds to team1 winning in calculate_results_for_event
+        "yes_won": np.array(
+            [event.winner == m.team1 for event, m in rows], dtype=bool
+        )[known],
+    }
+
+
+def parameter_grid(
+    high_thresholds: Sequence[float],
+    mid_thresholds: Sequence[float],
+    high_scales: Sequence[float],
+    mid_scales: Sequence[float],
+    base_bets: Sequence[int],
+) -> np.ndarray:
+    """
+    Build every combination of the given parameter values.
+
+    Combinations where the mid threshold is above the high threshold are
+    dropped. Returns an array of shape (n_configs, len(PARAMETERS)).
+    """
+    grid = np.array(
+        np.meshgrid(
+            high_thresholds, mid_thresholds, high_scales, mid_scales, base_bets, indexing="ij"
+        ),
+        dtype=float,
+    ).reshape(len(PARAMETERS), -1).T
+    return grid[grid[:, 1] <= grid[:, 0]]
+
+
+def simulate(history: Dict[str, np.ndarray], configs: np.ndarray) -> np.ndarray:
+    """
+    Replay the history through every strategy configuration at once.
+
+    Mirrors `size_ai_bet`: the bot backs the outcome opposite the favourite's
+    side, scales the base bet down by the probability gap and buys at the
+    market price. Settlement follows `calculate_results_for_event`.
+
+    Returns:
+        np.ndarray: Shape (n_configs, 4) with pnl, bets, hits and staked.
+    """
+    high, mid, high_scale, mid_scale, base_bet = (
+        configs[:, i, None] for i in range(len(PARAMETERS))
+    )
+
+    prob_team1, prob_team2 = history["prob_team1"], history["prob_team2"]
+    bet_yes = prob_team1 <= prob_team2
+    diff = np.abs(prob_team1 - prob_team2)
+    price = np.where(bet_yes, history["yes_price"], history["no_price"])
+    won = bet_yes == history["yes_won"]
+
+    # (n_configs, n_events) share counts, truncated like int(bet_size)
+    scale = np.where(diff > high, high_scale, np.where(diff > mid, mid_scale, 1.0))
+    shares = np.floor(base_bet * scale)
+
+    pnl = np.where(won, shares * (100 - price) / 100, -shares * price / 100)
+    placed = shares > 0
+
+    return np.column_stack(
+        [
+            pnl.sum(axis=1),
+            placed.sum(axis=1),
+            (placed & won).sum(axis=1),
+            (shares * price / 100).sum(axis=1),
+        ]
+    )
+
+
+def run_backtest(
+    history: Dict[str, np.ndarray], configs: np.ndarray, workers: int = None, chunk_size: int = 2048
+) -> pd.DataFrame:
+    """
+    Simulate all configurations across a process pool and summarise them.
+
+    Returns:
+        pd.DataFrame: One row per configuration with its parameters, pnl,
+        bets, hits, hit_rate, staked and roi, sorted by pnl.
+    """
+    chunks = [configs[i : i + chunk_size] for i in range(0, len(configs), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(simulate, [history] * len(chunks), chunks))
+
+    stats = np.vstack(results) if results else np.empty((0, 4))
+    report = pd.DataFrame(configs, columns=PARAMETERS)
+    report["pnl"] = stats[:, 0].round(2)
+    report["bets"] = stats[:, 1].astype(int)
+    report["hits"] = stats[:, 2].astype(int)
+    report["hit_rate"] = np.divide(
+        stats[:, 2], stats[:, 1], out=np.zeros(len(stats)), where=stats[:, 1] > 0
+    ).round(4)
+    report["staked"] = stats[:, 3].round(2)
+    report["roi"] = np.divide(
+        stats[:, 0], stats[:, 3], out=np.zeros(len(stats)), where=stats[:, 3] > 0
+    ).round(4)
+    return report.sort_values("pnl", ascending=False, ignore_index=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest the AI betting strategy.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--top", type=int, default=20, help="Configurations to print")
+    parser.add_argument("--csv", help="Write the full report to this CSV file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    db = next(get_db())
+    try:
+        history = load_history(db)
+    finally:
+        db.close()
+
+    if len(history["event_id"]) == 0:
+        logging.warning("No resolved events with a winner to backtest against.")
+        return
+
+    configs = parameter_grid(
+        high_thresholds=np.linspace(0.3, 0.9, 13),
+        mid_thresholds=np.linspace(0.1, 0.8, 15),
+        high_scales=np.linspace(0.25, 1.5, 6),
+        mid_scales=np.linspace(0.25, 1.5, 6),
+        base_bets=np.arange(1, 11),
+    )
+
+    started = time.perf_counter()
+    report = run_backtest(history, configs, workers=args.workers)
+    logging.info(
+        f"Backtested {len(configs)} configurations over {len(history['event_id'])} "
+        f"events in {time.perf_counter() - started:.2f}s"
+    )
+
+    print(report.head(args.top).to_string(index=False))
+    if args.csv:
+        report.to_csv(args.csv, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,8 +7,15 @@ from .helper import calculate_results_for_event  # Ensure this is imported corre
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
 import logging
+import time
 from .models import Match, Event, Share
-from .helper import calculate_share_price, ai_place_bet
+from .helper import calculate_share_price, plan_ai_bets
+from .sequencer import trade_sequencer
+from .trading import execute_buy, execute_sell, submit_orders, validate_order
+from .schemas import BuyShareRequest, SellShareRequest
+from .db_config import savepoint
+from fastapi import HTTPException
+from . import counters, idempotency, ledger, positions
 
 
 logging.basicConfig(level=logging.INFO)
@@ -58,82 +65,148 @@ def check_and_process_results():
 
 
 def execute_stop_orders():
-    """Check for limit conditions and execute stop orders."""
+    """
+    Fill triggered stop orders. Each event's orders are checked and filled
+    on the trade sequencer actor that owns the event, ordered with the
+    event's other trades.
+    """
     db: Session = next(get_db())
+    try:
+        # Events with pending shares that have a limit price
+        event_ids = [
+            event_id
+            for (event_id,) in db.query(Share.event_id)
+            .filter(Share.limit_price != None)
+            .distinct()
+        ]
+    finally:
+        db.close()
 
-    # Fetch all pending shares with a limit price
-    pending_shares = db.query(Share).filter(Share.limit_price != None).all()
+    for event_id in event_ids:
+        try:
+            filled = trade_sequencer.submit_threadsafe(
+                event_id,
+                lambda session, event_id=event_id: fill_stop_orders(session, event_id),
+            )
+            if filled:
+                logging.info(f"Stop orders: {filled} filled on event ID {event_id}")
+        except Exception as e:
+            logging.error(f"Error filling stop orders of event ID {event_id}: {str(e)}")
 
-    for share in pending_shares:
-        # Determine the type (buy or sell) for share price retrieval
-        bet_type = "buy" if share.bet_type == "buy" else "sell"
 
-        # Retrieve the current share prices
-        market_prices = calculate_share_price(share.event_id, bet_type, db)
-        yes_price = market_prices["yes_price"]
-        no_price = market_prices["no_price"]
+def fill_stop_orders(db: Session, event_id: int) -> int:
+    """
+    Fill the event's stop orders whose limit the market price has reached,
+    without committing.
+
+    Returns:
+        int: The number of orders filled.
+    """
+    pending_shares = (
+        db.query(Share)
+        .filter(Share.event_id == event_id, Share.limit_price != None)
+        .all()
+    )
+
+    filled = 0
+    for share in pending_shares:
+        # Prices move with every fill, so each order is checked against the
+        # current market
+        market_prices = calculate_share_price(share.event_id, share.bet_type, db)
 
         # Determine the market price to check against
         if share.outcome == "yes":
-            market_price = yes_price
+            market_price = market_prices["yes_price"]
         elif share.outcome == "no":
-            market_price = no_price
+            market_price = market_prices["no_price"]
         else:
             continue  # Skip invalid outcomes
 
         # Check limit conditions
-        if share.bet_type == "buy" and market_price <= share.limit_price:
-            # Execute the buy trade
-            execute_trade(share, market_price, db)
+        if (share.bet_type == "buy" and market_price <= share.limit_price) or (
+            share.bet_type == "sell" and market_price >= share.limit_price
+        ):
+            filled += execute_trade(share, market_price, db)
 
-        elif share.bet_type == "sell" and market_price >= share.limit_price:
-            # Execute the sell trade
-            execute_trade(share, market_price, db)
+    return filled
 
-    db.commit()
 
+def execute_trade(share, market_price, db) -> bool:
+    """
+    Fill a stop order at the market price: the resting lot is replaced by an
+    order through `execute_buy`/`execute_sell`, which validate, risk-check,
+    move the balance and update the position, history and event counters.
+    A rejected order is left resting.
 
-def execute_trade(share, market_price, db):
-    """Execute the trade based on the share and market price."""
-    user = share.user
+    Returns:
+        bool: Whether the order was filled.
+    """
+    fields = dict(
+        user_id=share.user_id,
+        event_id=share.event_id,
+        outcome=share.outcome,
+        bet_type=share.bet_type,
+        shareCount=share.amount,
+        share_price=market_price,
+    )
+    try:
+        if share.bet_type == "sell":
+            order, execute = SellShareRequest(**fields), execute_sell
+        else:
+            order, execute = BuyShareRequest(**fields), execute_buy
+        detail = validate_order(order)
+    except ValueError as e:  # A fractional lot cannot be sent as an order
+        detail = str(e)
+    if detail:
+        logging.warning(
+            f"Stop order {share.id} of user {share.user_id} is invalid: {detail}"
+        )
+        return False
 
-    if share.bet_type == "buy":
-        # Deduct the total cost from the user's balance
-        total_cost = market_price * share.amount / 100
-        if user.sweeps_points < total_cost:
-            print(f"User {user.id} has insufficient balance to execute buy trade.")
-            return
-        user.sweeps_points -= total_cost
-    elif share.bet_type == "sell":
-        # Add the total revenue to the user's balance
-        total_revenue = market_price * share.amount / 100
-        user.sweeps_points += total_revenue
+    try:
+        with savepoint(db):
+            # Remove the resting order, then trade it
+            positions.remove_lot(db, share)
+            db.delete(share)
+            execute(order, db, source="stop_order")
+    except HTTPException as e:
+        logging.warning(
+            f"Stop order {share.id} of user {share.user_id} not filled: {e.detail}"
+        )
+        return False
+    return True
 
-    # Remove the share from the database after executing the trade
-    db.delete(share)
-    db.commit()
 
 def run_ai_betting():
     """
-    Periodically checks for eligible events and places bets as the AI bot.
+    Periodically plans the AI bot's bets for all open events and places
+    them as one multi-order transaction.
     """
     db = next(get_db())
     try:
-        # Get current time
-        current_time = datetime.utcnow()
+        started = time.perf_counter()
+        orders = plan_ai_bets(db)
+        planned = time.perf_counter()
+
+        if not orders:
+            logging.info(
+                f"AI betting: nothing to bet on (planning took {planned - started:.3f}s)"
+            )
+            return
 
-        # Find eligible events where betting is still open
-        eligible_events = (
-            db.query(Event)
-            .join(Match)
-            .filter(Match.bet_end_time > current_time)  # Betting still open
-            .all()
+        # Sequenced with the API's trades on the same events
+        results = trade_sequencer.run_threadsafe(submit_orders(orders))
+        finished = time.perf_counter()
+
+        executed = sum(1 for result in results if result["status"] == "executed")
+        for result in results:
+            if result["status"] != "executed":
+                logging.warning(f"AI bot bet rejected: {result}")
+        logging.info(
+            f"AI betting: {executed}/{len(orders)} bets placed "
+            f"(planning {planned - started:.3f}s, execution {finished - planned:.3f}s)"
         )
 
-        # Place bets for each eligible event
-        for event in eligible_events:
-            ai_place_bet(event.id, db)
-
     except Exception as e:
         logging.error(f"Error in AI betting: {str(e)}")
     finally:
@@ -141,6 +214,49 @@ def run_ai_betting():
 
 
 
+def run_balance_snapshots():
+    """Snapshot moved balances and check them against the ledger."""
+    db: Session = next(get_db())
+    try:
+        snapshots = ledger.take_snapshots(db)
+        mismatches = ledger.audit_balances(db)
+        logging.info(f"Balance snapshots taken: {snapshots}")
+        for mismatch in mismatches:
+            logging.error(f"Balance does not match ledger: {mismatch}")
+    except Exception as e:
+        logging.error(f"Error taking balance snapshots: {str(e)}")
+    finally:
+        db.close()
+
+
+def run_counter_compaction():
+    """Fold sharded event counters back into the events rows."""
+    db: Session = next(get_db())
+    try:
+        folded = counters.compact(db)
+        if folded:
+            logging.info(f"Folded {folded} event counter shards.")
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Error compacting event counters: {str(e)}")
+    finally:
+        db.close()
+
+
+def run_idempotency_purge():
+    """Delete stored Idempotency-Key responses past their time-to-live."""
+    db: Session = next(get_db())
+    try:
+        purged = idempotency.purge_expired(db)
+        if purged:
+            logging.info(f"Purged {purged} expired idempotency keys.")
+    except Exception as e:
+        db.rollback()
+        logging.error(f"Error purging idempotency keys: {str(e)}")
+    finally:
+        db.close()
+
+
 def start_scheduler():
     scheduler = BackgroundScheduler()
 
@@ -168,4 +284,25 @@ def start_scheduler():
     )
 
 
+    scheduler.add_job(
+        run_balance_snapshots,
+        IntervalTrigger(hours=1),
+        id="balance_snapshot_scheduler",
+        replace_existing=True,
+    )
+
+    scheduler.add_job(
+        run_counter_compaction,
+        IntervalTrigger(minutes=1),
+        id="counter_compaction_scheduler",
+        replace_existing=True,
+    )
+
+    scheduler.add_job(
+        run_idempotency_purge,
+        IntervalTrigger(hours=1),
+        id="idempotency_purge_scheduler",
+        replace_existing=True,
+    )
+
     scheduler.start()
\ No newline at end of file
@@ -0,0 +1,236 @@
+"""
+Event yes/no bet totals that hot markets can update without contention.
+
+Trades never read-modify-write `Event.total_yes_bets`/`total_no_bets` in
+Python. By default they issue one atomic increment on the events row. With
+EVENT_COUNTER_SHARDS=N the increment goes to one of N rows of
+event_counter_shards for the event instead, so concurrent trades on the same
+market take different row locks; the totals are the events row plus the sum
+of the shards, and `compact` periodically folds the shards back in.
+
+Readers (prices, listings) go through `get_totals`/`get_totals_many`, which
+serve the folded totals from a per-process cache. Committed trades from this
+process update the cache immediately; trades from other workers show up once
+the entry expires (EVENT_TOTALS_TTL_SECONDS).
+"""
+
+import os
+import random
+import threading
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import delete, func, select, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.util import identity_key
+
+from .db_config import after_commit
+from .models import Event, EventCounterShard
+
+EVENT_COUNTER_SHARDS = int(os.getenv("EVENT_COUNTER_SHARDS", "0"))
+EVENT_TOTALS_TTL = float(os.getenv("EVENT_TOTALS_TTL_SECONDS", "2"))
+
+# Event ids this session changed but has not committed yet
+PENDING_KEY = "pending_event_counters"
+
+UPSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+Totals = Tuple[int, int]
+
+
+class TotalsCache:
+    """Thread-safe (yes, no) totals per event with a time-to-live."""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._entries: Dict[int, Tuple[float, int, int]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, event_id: int) -> Optional[Totals]:
+        entry = self._entries.get(event_id)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1], entry[2]
+
+    def put(self, event_id: int, totals: Totals):
+        with self._lock:
+            self._entries[event_id] = (time.monotonic() + self.ttl, *totals)
+
+    def add(self, event_id: int, yes: int, no: int):
+        """Apply a committed increment to a cached entry, if there is one."""
+        with self._lock:
+            entry = self._entries.get(event_id)
+            if entry is not None:
+                self._entries[event_id] = (entry[0], entry[1] + yes, entry[2] + no)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+totals_cache = TotalsCache(EVENT_TOTALS_TTL)
+
+
+def add_bets(db: Session, event_id: int, yes: int = 0, no: int = 0, shards=None):
+    """
+    Add to an event's yes/no totals inside the current transaction.
+
+    Args:
+        db (Session): The database session; nothing is committed.
+        event_id (int): The event traded on.
+        yes (int): Change to the yes total (negative to subtract).
+        no (int): Change to the no total (negative to subtract).
+        shards (int): Overrides EVENT_COUNTER_SHARDS; 0 updates the events row.
+    """
+    if not yes and not no:
+        return
+    shards = EVENT_COUNTER_SHARDS if shards is None else shards
+
+    if shards:
+        upsert = UPSERTS[db.get_bind().dialect.name](EventCounterShard).values(
+            event_id=event_id,
+            shard=random.randrange(shards),
+            yes_delta=yes,
+            no_delta=no,
+        )
+        db.execute(
+            upsert.on_conflict_do_update(
+                index_elements=["event_id", "shard"],
+                set_={
+                    "yes_delta": EventCounterShard.yes_delta
+                    + upsert.excluded.yes_delta,
+                    "no_delta": EventCounterShard.no_delta + upsert.excluded.no_delta,
+                },
+            )
+        )
+    else:
+        db.execute(
+            update(Event)
+            .where(Event.id == event_id)
+            .values(
+                total_yes_bets=func.coalesce(Event.total_yes_bets, 0) + yes,
+                total_no_bets=func.coalesce(Event.total_no_bets, 0) + no,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        # A loaded Event reloads the totals on next access
+        event = db.identity_map.get(identity_key(Event, event_id))
+        if event is not None:
+            db.expire(event, ["total_yes_bets", "total_no_bets"])
+
+    pending = db.info.setdefault(PENDING_KEY, set())
+    pending.add(event_id)
+
+    def apply():
+        pending.discard(event_id)
+        totals_cache.add(event_id, yes, no)
+
+    after_commit(db, apply)
+
+
+def get_totals_many(db: Session, event_ids: Iterable[int]) -> Dict[int, Totals]:
+    """
+    Folded (yes, no) totals for several events, loading cache misses with one
+    query.
+
+    Events this session has changed but not committed are always read from
+    the database, so a transaction sees its own trades.
+
+    Returns:
+        dict: (yes, no) per event id; unknown events are left out.
+    """
+    pending = db.info.get(PENDING_KEY, ())
+    totals: Dict[int, Totals] = {}
+    missing = []
+    for event_id in set(event_ids):
+        cached = None if event_id in pending else totals_cache.get(event_id)
+        if cached is None:
+            missing.append(event_id)
+        else:
+            totals[event_id] = cached
+
+    if missing:
+        shard_sums = (
+            select(
+                EventCounterShard.event_id,
+                func.sum(EventCounterShard.yes_delta).label("yes_delta"),
+                func.sum(EventCounterShard.no_delta).label("no_delta"),
+            )
+            .where(EventCounterShard.event_id.in_(missing))
+            .group_by(EventCounterShard.event_id)
+            .subquery()
+        )
+        rows = db.execute(
+            select(
+                Event.id,
+                func.coalesce(Event.total_yes_bets, 0)
+                + func.coalesce(shard_sums.c.yes_delta, 0),
+                func.coalesce(Event.total_no_bets, 0)
+                + func.coalesce(shard_sums.c.no_delta, 0),
+            )
+            .outerjoin(shard_sums, shard_sums.c.event_id == Event.id)
+            .where(Event.id.in_(missing))
+        ).all()
+        for event_id, yes, no in rows:
+            totals[event_id] = (int(yes), int(no))
+            if event_id not in pending:
+                totals_cache.put(event_id, totals[event_id])
+
+    return totals
+
+
+def get_totals(db: Session, event_id: int) -> Optional[Totals]:
+    """Folded (yes, no) totals of one event, or None if it does not exist."""
+    return get_totals_many(db, [event_id]).get(event_id)
+
+
+def compact(db: Session) -> int:
+    """
+    Fold every counter shard into its events row and delete it, then commit.
+
+    The shard rows are locked while they are folded, so increments landing
+    on them wait and are applied to a fresh shard afterwards; nothing is
+    counted twice or lost. The folded totals do not change.
+
+    Returns:
+        int: The number of shard rows folded.
+    """
+    shards = db.execute(
+        select(
+            EventCounterShard.event_id,
+            EventCounterShard.shard,
+            EventCounterShard.yes_delta,
+            EventCounterShard.no_delta,
+        ).with_for_update()
+    ).all()
+    if not shards:
+        db.rollback()
+        return 0
+
+    folded: Dict[int, Totals] = {}
+    for event_id, _, yes, no in shards:
+        folded_yes, folded_no = folded.get(event_id, (0, 0))
+        folded[event_id] = (folded_yes + yes, folded_no + no)
+
+    for event_id, (yes, no) in folded.items():
+        db.execute(
+            update(Event)
+            .where(Event.id == event_id)
+            .values(
+                total_yes_bets=func.coalesce(Event.total_yes_bets, 0) + yes,
+                total_no_bets=func.coalesce(Event.total_no_bets, 0) + no,
+            )
+            .execution_options(synchronize_session=False)
+        )
+    db.execute(
+        delete(EventCounterShard)
+        .where(
+            tuple_(EventCounterShard.event_id, EventCounterShard.shard).in_(
+                [(event_id, shard) for event_id, shard, _, _ in shards]
+            )
+        )
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return len(shards)
@@ -1,11 +1,103 @@
-from sqlalchemy import create_engine
+import os
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+
+load_dotenv(os.path.join(os.path.dirname(__file__), ".env"))
 
 # Database setup
-DATABASE_URL = "sqlite:///./test.db"
-engine = create_engine(DATABASE_URL)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+
+# Production SQLite profile: WAL lets readers run alongside the writer,
+# NORMAL sync is durable at every checkpoint under WAL, and busy_timeout
+# makes concurrent writers wait for the lock instead of failing with
+# "database is locked".
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-64000")),  # Negative = KiB
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+}
+
+# Postgres profile: a sized pool shared by the API workers and scheduler jobs
+POSTGRES_POOL = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "10")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "20")),
+    "pool_timeout": int(os.getenv("DB_POOL_TIMEOUT", "30")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": True,
+}
+
+# Async drivers used for the same database by the async endpoints
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def to_async_url(url: str) -> str:
+    """Point a sync database URL at the matching async driver."""
+    url = make_url(url)
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()]).render_as_string(
+        hide_password=False
+    )
+
+
+def engine_options(url: str) -> dict:
+    """Keyword arguments for create_engine/create_async_engine for this backend."""
+    backend = make_url(url).get_backend_name()
+    if backend == "sqlite":
+        return {
+            "connect_args": {
+                "check_same_thread": False,
+                "timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000,
+            }
+        }
+    if backend == "postgresql":
+        return dict(POSTGRES_POOL)
+    return {}
+
+
+def apply_sqlite_pragmas(engine):
+    """Set the SQLite pragmas on every new connection of `engine`."""
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def build_engines(url: str):
+    """
+    Create the sync and async engines for a database URL.
+
+    Returns:
+        tuple: The (engine, async_engine) pair.
+    """
+    sync_engine = create_engine(url, **engine_options(url))
+    async_url = to_async_url(url)
+    async_engine = create_async_engine(async_url, **engine_options(async_url))
+
+    if make_url(url).get_backend_name() == "sqlite":
+        apply_sqlite_pragmas(sync_engine)
+        apply_sqlite_pragmas(async_engine.sync_engine)
+
+    return sync_engine, async_engine
+
+
+engine, async_engine = build_engines(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
 
 Base = declarative_base()
 target_metadata = Base.metadata
@@ -18,3 +110,54 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+# Dependency to get an async DB session for `async def` endpoints
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+# In-memory state (caches, counters) must only change once the database
+# change behind it is durable. Code that updates such state registers a
+# callback with `after_commit`; it runs when the session commits and is
+# dropped if the transaction (or the `savepoint` it ran in) rolls back.
+# A callback dropped by a savepoint has its `discard()` method called, if it
+# has one, so it can undo any per-session bookkeeping done on its behalf.
+AFTER_COMMIT_KEY = "after_commit_callbacks"
+
+
+def after_commit(db: Session, callback):
+    """Run `callback()` after `db`'s current transaction commits."""
+    db.info.setdefault(AFTER_COMMIT_KEY, []).append(callback)
+
+
+@contextmanager
+def savepoint(db: Session):
+    """begin_nested() that also discards callbacks registered inside it on failure."""
+    callbacks = db.info.setdefault(AFTER_COMMIT_KEY, [])
+    mark = len(callbacks)
+    try:
+        with db.begin_nested():
+            yield
+    except Exception:
+        for callback in reversed(callbacks[mark:]):
+            discard = getattr(callback, "discard", None)
+            if discard is not None:
+                discard()
+        del callbacks[mark:]
+        raise
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit_callbacks(session):
+    for callback in session.info.pop(AFTER_COMMIT_KEY, []):
+        callback()
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _drop_after_commit_callbacks(session, transaction):
+    # after_rollback also fires for savepoints, whose callbacks `savepoint`
+    # already dropped; only the end of the outermost transaction drops all.
+    if transaction.parent is None:
+        session.info.pop(AFTER_COMMIT_KEY, None)
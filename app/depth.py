@@ -0,0 +1,174 @@
+"""
+Market depth: resting limit orders aggregated per event, outcome, side and
+price level.
+
+Resting limit orders are the Share lots with a `limit_price`. The book is
+loaded with one GROUP BY at startup and then kept up to date from the
+session: every flush that writes, shrinks or deletes such a lot records the
+change in quantity, and the change is applied once the transaction commits
+(changes in a rolled-back transaction or savepoint are dropped). Reading the
+depth of an event therefore never touches the database.
+
+Each event carries a version that increases with every change to its book,
+so pollers can send it back as an ETag and get a 304 while nothing moved.
+Only commits made by this process are seen; with several API workers each
+one rebuilds its book on startup.
+"""
+
+import logging
+import os
+import threading
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session, object_session
+
+from .db_config import after_commit
+from .models import Share
+
+# Price levels are keyed on the limit price rounded to this many decimals
+DEPTH_PRICE_DECIMALS = int(os.getenv("DEPTH_PRICE_DECIMALS", "2"))
+
+# Book key: (outcome, side), where side is the lot's bet_type
+Side = Tuple[str, str]
+
+
+class DepthBook:
+    """Thread-safe aggregated quantity per price level for every event."""
+
+    def __init__(self):
+        self._levels: Dict[int, Dict[Side, Dict[float, float]]] = {}
+        self._versions: Dict[int, int] = defaultdict(int)
+        self._snapshots: Dict[int, dict] = {}
+        self._lock = threading.Lock()
+        self.loaded = False
+        # Distinguishes versions handed out before and after a restart
+        self.epoch = uuid.uuid4().hex[:8]
+
+    def rebuild(self, db: Session):
+        """Load the whole book from the resting limit orders."""
+        rows = db.execute(
+            select(
+                Share.event_id,
+                Share.outcome,
+                Share.bet_type,
+                Share.limit_price,
+                func.sum(Share.amount),
+            )
+            .where(Share.limit_price.isnot(None), Share.amount > 0)
+            .group_by(Share.event_id, Share.outcome, Share.bet_type, Share.limit_price)
+        ).all()
+
+        levels = {}
+        for event_id, outcome, side, price, amount in rows:
+            book = levels.setdefault(event_id, {})
+            level = book.setdefault((outcome, side), {})
+            price = round(price, DEPTH_PRICE_DECIMALS)
+            level[price] = level.get(price, 0) + amount
+
+        with self._lock:
+            for event_id in set(self._levels) | set(levels):
+                self._versions[event_id] += 1
+            self._levels = levels
+            self._snapshots.clear()
+            self.loaded = True
+        logging.info(f"Depth book loaded: {len(rows)} price levels")
+
+    def apply(self, changes: List[Tuple[int, str, str, float, float]]):
+        """Apply committed (event_id, outcome, side, price, quantity) changes."""
+        if not self.loaded:
+            return  # The startup rebuild will read them from the database
+        with self._lock:
+            for event_id, outcome, side, price, quantity in changes:
+                level = self._levels.setdefault(event_id, {}).setdefault(
+                    (outcome, side), {}
+                )
+                price = round(price, DEPTH_PRICE_DECIMALS)
+                remaining = level.get(price, 0) + quantity
+                if remaining > 1e-9:
+                    level[price] = remaining
+                else:
+                    level.pop(price, None)
+                self._versions[event_id] += 1
+                self._snapshots.pop(event_id, None)
+
+    def clear_event(self, event_id: int):
+        """Drop an event's book (its lots were all removed at settlement)."""
+        with self._lock:
+            if self._levels.pop(event_id, None) is not None:
+                self._versions[event_id] += 1
+            self._snapshots.pop(event_id, None)
+
+    def etag(self, event_id: int, version: int = None) -> str:
+        """HTTP entity tag of an event's book at `version` (default: current)."""
+        if version is None:
+            version = self._versions[event_id]
+        return f'"{self.epoch}-{version}"'
+
+    def snapshot(self, event_id: int) -> dict:
+        """
+        The depth of an event's book.
+
+        Returns:
+            dict: For each outcome, "bids" (resting buy orders, best price
+            first) and "asks" (resting sell orders, best price first) as
+            [price, quantity] pairs, plus the book's version.
+        """
+        with self._lock:
+            snapshot = self._snapshots.get(event_id)
+            if snapshot is None:
+                book = self._levels.get(event_id, {})
+                snapshot = {"event_id": event_id, "version": self._versions[event_id]}
+                for outcome in ("yes", "no"):
+                    bids = book.get((outcome, "buy"), {})
+                    asks = book.get((outcome, "sell"), {})
+                    snapshot[outcome] = {
+                        "bids": [[p, bids[p]] for p in sorted(bids, reverse=True)],
+                        "asks": [[p, asks[p]] for p in sorted(asks)],
+                    }
+                self._snapshots[event_id] = snapshot
+            return snapshot
+
+
+depth_book = DepthBook()
+
+
+def _committed_amount(share: Share) -> float:
+    history = inspect(share).attrs.amount.history
+    if history.deleted:
+        return history.deleted[0] or 0
+    return share.amount or 0
+
+
+def _record(share: Share, quantity: float):
+    """Apply a lot's change in quantity to the book when its session commits."""
+    if share.limit_price is None or not quantity:
+        return
+    change = (
+        share.event_id,
+        share.outcome,
+        share.bet_type,
+        share.limit_price,
+        quantity,
+    )
+    after_commit(object_session(share), lambda: depth_book.apply([change]))
+
+
+# Mapper events fire once per row actually written, so partial flushes such
+# as db.flush([position]) neither skip nor double count a lot.
+@event.listens_for(Share, "after_insert")
+def _lot_inserted(mapper, connection, share):
+    _record(share, max(share.amount or 0, 0))
+
+
+@event.listens_for(Share, "after_update")
+def _lot_updated(mapper, connection, share):
+    if inspect(share).attrs.amount.history.has_changes():
+        _record(share, (share.amount or 0) - _committed_amount(share))
+
+
+@event.listens_for(Share, "after_delete")
+def _lot_deleted(mapper, connection, share):
+    _record(share, -_committed_amount(share))
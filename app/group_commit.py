@@ -0,0 +1,147 @@
+"""
+Group commit for trades.
+
+Committing every trade on its own costs one fsync per order, which caps
+throughput far below what the CPU can do. The `GroupCommitter` collects
+trades submitted by concurrent requests for up to GROUP_COMMIT_MAX_WAIT_MS
+or GROUP_COMMIT_MAX_BATCH trades, whichever comes first. It runs them in
+one transaction, each in its own savepoint, and commits once. Every
+submitter is answered only after the commit of its batch returns, so an
+acknowledged trade is durable.
+
+A longer wait or larger batch amortises the commit over more trades at the
+cost of per-trade latency; GROUP_COMMIT_MAX_BATCH=1 commits every trade on
+its own.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Any, Callable, List, Tuple
+
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session
+
+from .db_config import AsyncSessionLocal, savepoint
+
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "256"))
+GROUP_COMMIT_MAX_WAIT_MS = float(os.getenv("GROUP_COMMIT_MAX_WAIT_MS", "2"))
+GROUP_COMMIT_RETRIES = int(os.getenv("GROUP_COMMIT_RETRIES", "2"))
+
+Work = Callable[[Session], Any]
+
+
+def apply_batch(db: Session, batch: List[Tuple[Work, asyncio.Future]]):
+    """
+    Run each submitted piece of work in its own savepoint.
+
+    Returns:
+        list: (succeeded, result or exception) per piece of work.
+    """
+    outcomes = []
+    for work, _ in batch:
+        try:
+            with savepoint(db):
+                outcomes.append((True, work(db)))
+        except Exception as e:
+            outcomes.append((False, e))
+    return outcomes
+
+
+class GroupCommitter:
+    """Batches work from concurrent callers into shared commits."""
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        max_batch: int = GROUP_COMMIT_MAX_BATCH,
+        max_wait_ms: float = GROUP_COMMIT_MAX_WAIT_MS,
+        name: str = "trades",
+    ):
+        self.session_factory = session_factory
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.name = name
+        self._queue = None
+        self._task = None
+        self._loop = None
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            # First use, or first use on a new event loop (tests, reloads)
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+    async def submit(self, work: Work):
+        """
+        Run `work(session)` in the next batch and wait until it is committed.
+
+        Returns:
+            The value returned by `work`.
+
+        Raises:
+            Whatever `work` raised (only its savepoint is rolled back), or the
+            error that made the batch's commit fail.
+        """
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait((work, future))
+        return await future
+
+    async def _collect(self):
+        """Wait for the first submission, then gather more until full or timed out."""
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            for attempt in range(GROUP_COMMIT_RETRIES + 1):
+                try:
+                    await self._commit(batch)
+                    break
+                except DBAPIError as e:
+                    # Deadlocks and lock timeouts against other writers roll
+                    # the whole batch back; nothing was applied, so rerun it.
+                    if attempt < GROUP_COMMIT_RETRIES:
+                        logging.warning(
+                            f"Group commit ({self.name}) retrying after: {str(e)}"
+                        )
+                        continue
+                    self._fail(batch, e)
+                except Exception as e:
+                    self._fail(batch, e)
+                    break
+
+    def _fail(self, batch, error: Exception):
+        logging.error(f"Group commit ({self.name}) failed: {str(error)}")
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    async def _commit(self, batch):
+        async with self.session_factory() as db:
+            outcomes = await db.run_sync(lambda session: apply_batch(session, batch))
+            await db.commit()
+
+        for (_, future), (succeeded, value) in zip(batch, outcomes):
+            if future.done():
+                continue  # The caller went away
+            if succeeded:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
@@ -9,19 +9,25 @@ from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from bs4 import BeautifulSoup
 import time as t
-from typing import List
+from typing import List, Tuple
 import pytz
-from .models import Match, Event, Share, User
+from .models import Match, Event, Position, Share, User
 from .schemas import BuyShareRequest
+from .training import features, load_artifacts
+from . import counters, ledger, positions, pricing, user_stats
+from .db_config import after_commit
+from .depth import depth_book
+from .sequencer import trade_sequencer
+from .ledger import to_minor
 import os
 import requests
-from sqlalchemy import func
+from sqlalchemy import func, select
 from dotenv import load_dotenv
 from bs4 import BeautifulSoup
 from difflib import SequenceMatcher
 from fastapi import HTTPException
-import joblib
 import pandas as pd
+import numpy as np
 from random import randint
 import logging
 
@@ -234,43 +240,18 @@ def calculate_share_price(event_id: int, bet_type: str, db: Session):
             status_code=400, detail="Invalid bet type. Must be 'buy' or 'sell'."
         )
 
-    # Retrieve the event details
-    event = db.query(Event).filter(Event.id == event_id).first()
-    if not event:
+    # Retrieve the event's current totals
+    totals = counters.get_totals(db, event_id)
+    if totals is None:
         raise HTTPException(status_code=404, detail="Event not found.")
 
-    # Calculate the total shares for both outcomes
-    total_shares = event.total_yes_bets + event.total_no_bets
-
-    # Set a fixed spread value
-    spread_value = 2  # Fixed spread value
-
-    # Avoid division by zero if no shares exist
-    if total_shares == 0:
-        yes_price = 50  # Base price
-        no_price = 50
-    else:
-        # Calculate share prices as percentages
-        yes_price = (event.total_yes_bets / total_shares) * 100
-        no_price = (event.total_no_bets / total_shares) * 100
-
-    # Adjust prices based on bet type
-    if bet_type == "buy":
-        yes_price += spread_value
-        no_price += spread_value
-    elif bet_type == "sell":
-        yes_price -= spread_value
-        no_price -= spread_value
-
-    # Ensure prices don't fall below 0
-    yes_price = max(0, yes_price)
-    no_price = max(0, no_price)
+    yes_price, no_price = pricing.engine.quote(*totals, bet_type)
 
     return {
         "event_id": event_id,
         "bet_type": bet_type,
-        "yes_price": round(yes_price, 2),
-        "no_price": round(no_price, 2),
+        "yes_price": yes_price,
+        "no_price": no_price,
     }
 
 
@@ -420,194 +401,66 @@ def calculate_results_for_event(event_id: int, db: Session):
     )
     winner = match.team1 if match_result == 1 else match.team2 if match_result == -1 else "draw"
 
-    # Fetch all shares for the event
-    shares = db.query(Share).filter(Share.event_id == event_id).all()
-
-    for share in shares:
-        # Skip processing for draw as no bets are resolved
-        if winning_outcome == "draw":
-            continue
-
-        # Calculate profit/loss for the user
-        user = db.query(User).filter(User.id == share.user_id).first()
-        if not user:
-            continue
-
-        if share.outcome == winning_outcome:
-            # Winning bet
-            if share.bet_type == "buy":
-                profit = share.amount * (100 - share.share_price) / 100
-                user.sweeps_points += profit
-            elif share.bet_type == "sell":
-                profit = share.amount * (share.share_price) / 100
-                user.sweeps_points += profit
-        else:
-            # Losing bet
-            if share.bet_type == "buy":
-                loss = share.amount * (share.share_price) / 100
-                user.sweeps_points -= loss
-            elif share.bet_type == "sell":
-                loss = share.amount * (100 - share.share_price) / 100
-                user.sweeps_points -= loss
-
-        # Remove resolved shares
-        db.delete(share)
-
-    event.resolved = True
-    event.winner = winner
-    db.add(event)
-
-    # Commit changes
-    db.commit()
+    # Settlement writes the event's positions, balances and shares, so it
+    # runs on the event's trade sequencer actor, ordered with its trades
+    trade_sequencer.submit_threadsafe(
+        event_id,
+        lambda session: settle_event(session, event_id, winning_outcome, winner),
+    )
     return {"message": "Results calculated successfully for the event."}
 
 
-def buy_share(request: BuyShareRequest, db):
-    user = db.query(User).filter(User.id == request.user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+def settle_event(db: Session, event_id: int, winning_outcome: str, winner: str):
+    """
+    Pay out an event's open positions, remove its shares and mark it
+    resolved, without committing. An event already resolved is left as is.
 
-    if request.bet_type not in ["buy", "sell"]:
-        raise HTTPException(
-            status_code=400, detail="Invalid bet type. Must be 'buy' or 'sell'."
-        )
-    if request.outcome not in ["yes", "no"]:
-        raise HTTPException(
-            status_code=400, detail="Invalid outcome. Must be 'yes' or 'no'."
+    Args:
+        db (Session): The database session.
+        event_id (int): The event to settle.
+        winning_outcome (str): "yes", "no" or "draw" (nothing is paid out).
+        winner (str): The winning team, or "draw".
+    """
+    event = db.query(Event).filter(Event.id == event_id).first()
+    if event is None or event.resolved:
+        return
+
+    # Skip processing for draw as no bets are resolved
+    if winning_outcome != "draw":
+        # One open position per user, only for users that still exist
+        open_positions = (
+            db.query(Position)
+            .join(User, User.id == Position.user_id)
+            .filter(Position.event_id == event_id, Position.net_shares != 0)
+            .all()
         )
 
-    event = db.query(Event).filter(Event.id == request.event_id).first()
-    if not event:
-        raise HTTPException(status_code=404, detail="Event not found")
-
-    existing_shares = (
-        db.query(Share)
-        .filter(Share.user_id == user.id, Share.event_id == request.event_id)
-        .all()
-    )
-
-    for share in existing_shares:
-        if share.outcome != request.outcome:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Conflicting outcome detected. Existing position is {share.outcome}.",
+        payouts = {}
+        for position in open_positions:
+            payout_minor = to_minor(
+                positions.settlement_payout(position, winning_outcome)
             )
-
-    opposing_shares = [
-        share
-        for share in existing_shares
-        if share.bet_type != request.bet_type and share.amount > 0
-    ]
-    remaining_shares = request.shareCount
-    total_profit_or_loss = 0
-
-    for share in opposing_shares:
-        trade_price = request.share_price
-        if share.amount >= remaining_shares:
-            trade_amount = remaining_shares
-            total_profit_or_loss += trade_amount * (
-                request.share_price / 100 - share.share_price / 100
-            )
-            share.amount -= remaining_shares
-            remaining_shares = 0
-            db.add(share)
-            break
-        else:
-            trade_amount = share.amount
-            total_profit_or_loss += trade_amount * (
-                request.share_price / 100 - share.share_price / 100
+            ledger.post(
+                db, position.user_id, payout_minor, "settlement", f"event:{event_id}"
             )
-            remaining_shares -= trade_amount
-            db.delete(share)
-
-    user.sweeps_points += total_profit_or_loss
-
-    if remaining_shares > 0:
-        total_cost = (request.share_price / 100) * remaining_shares
-        if user.sweeps_points < total_cost:
-            raise HTTPException(
-                status_code=400, detail="Insufficient balance for the trade."
-            )
-        user.sweeps_points -= total_cost
-
-        new_share = Share(
-            user_id=user.id,
-            event_id=request.event_id,
-            amount=remaining_shares,
-            bet_type=request.bet_type,
-            outcome=request.outcome,
-            share_price=request.share_price,
-            limit_price=request.limit_price,
-        )
-        db.add(new_share)
-
-    if request.outcome == "yes":
-        if request.bet_type == "buy":
-            event.total_yes_bets += request.shareCount
-        else:
-            event.total_yes_bets -= request.shareCount
-    elif request.outcome == "no":
-        if request.bet_type == "buy":
-            event.total_no_bets += request.shareCount
-        else:
-            event.total_no_bets -= request.shareCount
-
-    db.commit()
-    return {
-        "message": "Trade executed successfully",
-        "profit_or_loss": round(total_profit_or_loss, 2),
-    }
-
-
-def get_share_price(eventId: int, type: str, db):
-    # Validate the type parameter
-    if type not in ["buy", "sell"]:
-        raise HTTPException(
-            status_code=400, detail="Invalid type. Must be 'buy' or 'sell'."
-        )
+            position.realized_pnl_minor += payout_minor
+            position.net_shares = 0
+            position.avg_cost = 0
+            payouts[position.user_id] = payout_minor
+        user_stats.record_settlement(db, payouts)
 
-    # Retrieve the match details for the given event ID
-    match = db.query(Event).filter(Event.id == eventId).first()
-    if not match:
-        raise HTTPException(status_code=404, detail="Event not found.")
-
-    # Calculate the total shares bought for both outcomes
-    total_shares = match.total_yes_bets + match.total_no_bets
-
-    # Set a fixed spread value
-    spread_value = 2  # Fixed spread value
-
-    # Avoid division by zero if there are no shares bought yet
-    if total_shares == 0:
-        yes_price = 50  # Set a base price of 50 when no shares have been bought
-        no_price = 50
-    else:
-        # Calculate share price as a percentage of total shares bought for each outcome
-        yes_price = (match.total_yes_bets / total_shares) * 100
-        no_price = (match.total_no_bets / total_shares) * 100
-
-    # Adjust prices based on the type (buy or sell)
-    if type == "buy":
-        yes_price += spread_value
-        no_price += spread_value
-    elif type == "sell":
-        yes_price -= spread_value
-        no_price -= spread_value
-
-    # Ensure prices don't go below 0
-    yes_price = max(0, yes_price)
-    no_price = max(0, no_price)
+        # Remove resolved shares
+        db.query(Share).filter(
+            Share.event_id == event_id, Share.user_id.in_(select(User.id))
+        ).delete(synchronize_session=False)
+        after_commit(db, lambda: depth_book.clear_event(event_id))
 
-    return {
-        "eventId": eventId,
-        "type": type,
-        "yes_price": round(yes_price, 2),
-        "no_price": round(no_price, 2),
-    }
+    event.resolved = True
+    event.winner = winner
+    db.add(event)
 
 
-model = joblib.load("app/team_matchup_predictor.pkl")
-scaler = joblib.load("app/scaler.pkl")
+model, scaler = load_artifacts()
 stats_df = pd.read_excel('app/team_stats_data.xlsx')
 
 def get_team_stats(team_name: str):
@@ -615,10 +468,6 @@ def get_team_stats(team_name: str):
     Extract stats for a specific team based on required features.
     """
 
-    features = [
-    "ADJ OE", "ADJ DE", "EFG", "EFG D", "FT RATE", "FT RATE D", 
-    "TOV%", "TOV% D", "O REB%", "OP OREB%", "2P %", "2P % D.", "3P %", "3P % D."
-    ]
     try:
         # Filter the dataset for the specific team
         team_stats = stats_df.loc[stats_df['TEAM'] == team_name, features]
@@ -669,68 +518,131 @@ def predict(team1: str, team2: str):
         raise HTTPException(status_code=400, detail=str(e))
 
 
-def ai_place_bet(event_id: int, db):
+def predict_matchups(matchups: List[Tuple[str, str]]):
+    """
+    Predict win probabilities for many match-ups with a single model call.
+
+    Stats for every team are scaled and scored together instead of calling
+    `predict` once per match. Match-ups with a team missing from the dataset
+    get NaN probabilities.
+
+    Returns:
+        tuple: Arrays (team1_prob, team2_prob), aligned with `matchups`.
     """
-    AI Bot places bets for a given event intelligently.
-    - Predicts probabilities for the two teams using the trained model.
-    - Bets on the outcome with a higher probability.
-    - Saves the bet in the database under the AI user.
+    team_stats = stats_df.drop_duplicates("TEAM").set_index("TEAM")[features]
+    teams = np.array([team for matchup in matchups for team in matchup], dtype=object)
+    known = np.isin(teams, team_stats.index.values)
+
+    win_rates = np.full(len(teams), np.nan)
+    if known.any():
+        scaled = scaler.transform(team_stats.loc[teams[known]].values)
+        win_rates[known] = model.predict(scaled)
+
+    team1_rate, team2_rate = win_rates[0::2], win_rates[1::2]
+    total = team1_rate + team2_rate
+    return team1_rate / total, team2_rate / total
+
+
+# AI bot user ID
+AI_BOT_USER_ID = "ts0Q2DAo9UVORtL2yKu6b3LPIcH3"
+
+# Number of shares the bot aims to hold per event; once reached, later
+# betting cycles leave the event alone instead of stacking more bets on it.
+AI_BOT_TARGET_SHARES = int(os.getenv("AI_BOT_TARGET_SHARES", "10"))
+
+
+def size_ai_bet(prob_team1: float, prob_team2: float, base_bet: int):
     """
-    try:
-        # AI user ID
-        bot_user_id = "ts0Q2DAo9UVORtL2yKu6b3LPIcH3"
-
-        # Fetch the event and match details
-        event = db.query(Event).filter(Event.id == event_id).first()
-        if not event:
-            raise ValueError(f"Event with ID {event_id} not found.")
-
-        match = db.query(Match).filter(Match.id == event.match_id).first()
-        if not match:
-            raise ValueError(f"Match associated with event ID {event_id} not found.")
-
-        # Predict probabilities for the two teams
-        team1 = match.team1
-        team2 = match.team2
-        prob_team1, prob_team2 = predict(team1, team2)
-
-        # Log probabilities for debugging
-        logging.info(f"Probabilities for event {event_id}: {team1} ({prob_team1}), {team2} ({prob_team2})")
-
-        # Determine the outcome to bet on
-        if prob_team1 > prob_team2:
-            outcome = "no"  # Assume "yes" corresponds to Team1
-            probability_diff = prob_team1 - prob_team2
-        else:
-            outcome = "yes"  # Assume "no" corresponds to Team2
-            probability_diff = prob_team2 - prob_team1
-
-        # Adjust bet size based on probability difference
-        base_bet = randint(1, 10)  # Base number of shares to bet
-        if probability_diff > 0.8:  # Large difference
-            bet_size = base_bet * 0.5  # Smaller bet to avoid bias
-        elif probability_diff > 0.6:  # Moderate difference
-            bet_size = base_bet * 0.75
-        else:
-            bet_size = base_bet  # Normal bet for close probabilities
-
-        # Get the current share price for the outcome
-        share_price_response = get_share_price(eventId=event_id, type="buy", db=db)
-        share_price = share_price_response["yes_price"] if outcome == "yes" else share_price_response["no_price"]
-
-        # Prepare the buy request payload
-        buy_request = BuyShareRequest(
-            user_id=bot_user_id,
-            event_id=event_id,
-            outcome=outcome,
-            bet_type="buy",
-            shareCount=int(bet_size),
-            share_price=share_price
+    Choose the outcome and number of shares the AI bot bets on a match-up.
+
+    Returns:
+        tuple: The (outcome, bet_size) pair.
+    """
+    # Determine the outcome to bet on
+    if prob_team1 > prob_team2:
+        outcome = "no"  # Assume "yes" corresponds to Team1
+        probability_diff = prob_team1 - prob_team2
+    else:
+        outcome = "yes"  # Assume "no" corresponds to Team2
+        probability_diff = prob_team2 - prob_team1
+
+    # Adjust bet size based on probability difference
+    if probability_diff > 0.8:  # Large difference
+        bet_size = base_bet * 0.5  # Smaller bet to avoid bias
+    elif probability_diff > 0.6:  # Moderate difference
+        bet_size = base_bet * 0.75
+    else:
+        bet_size = base_bet  # Normal bet for close probabilities
+
+    return outcome, bet_size
+
+
+def plan_ai_bets(db: Session):
+    """
+    Plan the AI bot's bets for every event that is still open for betting.
+
+    Events, predictions, prices and the bot's current positions are all
+    computed up front in bulk. Events where the bot already holds
+    `AI_BOT_TARGET_SHARES` shares (or an opposite position) are skipped, so
+    running the cycle repeatedly does not keep adding to the same events.
+
+    Returns:
+        list: The BuyShareRequest orders to submit.
+    """
+    current_time = datetime.utcnow()
+
+    # Find eligible events where betting is still open
+    rows = (
+        db.query(Event, Match)
+        .join(Match, Event.match_id == Match.id)
+        .filter(Match.bet_end_time > current_time, Event.resolved == False)
+        .all()
+    )
+    if not rows:
+        return []
+
+    # Current bot positions per event, in one query
+    bot_positions = {
+        event_id: (outcome, held)
+        for event_id, outcome, held in (
+            db.query(Position.event_id, Position.outcome, Position.net_shares)
+            .filter(
+                Position.user_id == AI_BOT_USER_ID,
+                Position.event_id.in_([event.id for event, _ in rows]),
+                Position.net_shares != 0,
+            )
+            .all()
         )
+    }
 
-        # Call the buy API to place the bet
-        buy_response = buy_share(buy_request, db)
-        logging.info(f"AI bot placed bet: {buy_response}")
+    prob_team1, prob_team2 = predict_matchups([(m.team1, m.team2) for _, m in rows])
+    totals = counters.get_totals_many(db, [event.id for event, _ in rows])
 
-    except Exception as e:
-        logging.error(f"Error in AI bot betting for event {event_id}: {str(e)}")
+    orders = []
+    for (event, match), p1, p2 in zip(rows, prob_team1, prob_team2):
+        if np.isnan(p1) or np.isnan(p2):
+            logging.warning(f"AI bot skipped event {event.id}: teams not in dataset.")
+            continue
+
+        outcome, bet_size = size_ai_bet(p1, p2, randint(1, 10))
+
+        held_outcome, held = bot_positions.get(event.id, (outcome, 0))
+        if held_outcome != outcome:
+            continue  # The bot already holds the opposite outcome
+        shares = min(int(bet_size), AI_BOT_TARGET_SHARES - int(held))
+        if shares <= 0:
+            continue  # Target position already reached
+
+        yes_price, no_price = pricing.engine.quote(*totals[event.id], "buy")
+        orders.append(
+            BuyShareRequest(
+                user_id=AI_BOT_USER_ID,
+                event_id=event.id,
+                outcome=outcome,
+                bet_type="buy",
+                shareCount=shares,
+                share_price=yes_price if outcome == "yes" else no_price,
+            )
+        )
+
+    return orders
@@ -0,0 +1,213 @@
+"""
+Idempotency-Key support for endpoints that move money.
+
+A client that retries a request after a timeout sends the same
+Idempotency-Key header as the first attempt. Keys are scoped by endpoint and
+by the user the request acts for, so two users can never replay each
+other's responses by choosing the same key. The first successful attempt
+stores its response in the idempotency_keys table in the same transaction
+as the trade or balance change, so the response is recorded if and only if
+the change is. Replays get the stored response back without the change
+running again. Failed attempts are not stored and may be retried.
+
+Recent responses are also kept in a bounded per-process LRU cache with a
+time-to-live, so most replays are answered without touching the database
+or the trade queue; the table makes replays work across workers. Reusing a
+key with a different request body is rejected with 422, and a replay that
+arrives while the first attempt is still running gets 409.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from .db_config import after_commit
+from .models import IdempotencyKey
+
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+
+# (endpoint, user_id, key): the primary key of a stored response
+Scope = Tuple[str, str, str]
+
+
+class DuplicateKeyError(Exception):
+    """Raised when another attempt already recorded a response under the key."""
+
+
+class ResponseCache:
+    """Thread-safe LRU of (request_hash, response) with a time-to-live."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Scope, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, scope: Scope) -> Optional[Tuple[str, dict]]:
+        with self._lock:
+            entry = self._entries.get(scope)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[scope]
+                return None
+            self._entries.move_to_end(scope)
+            return entry[1], entry[2]
+
+    def put(self, scope: Scope, request_hash: str, response: dict):
+        with self._lock:
+            self._entries[scope] = (
+                time.monotonic() + self.ttl,
+                request_hash,
+                response,
+            )
+            self._entries.move_to_end(scope)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache(IDEMPOTENCY_CACHE_SIZE, IDEMPOTENCY_TTL)
+
+
+def request_hash(payload: dict) -> str:
+    """Fingerprint of a request body, to detect a key reused for another request."""
+    return hashlib.sha256(
+        json.dumps(payload, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def _replay(fingerprint: str, stored_hash: str, response: dict) -> dict:
+    if stored_hash != fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used for a different request.",
+        )
+    return response
+
+
+def cached(endpoint: str, user_id: str, key: str, payload: dict) -> Optional[dict]:
+    """The stored response from this process's cache, without a query."""
+    entry = response_cache.get((endpoint, user_id, key))
+    if entry is None:
+        return None
+    return _replay(request_hash(payload), *entry)
+
+
+def lookup(
+    db: Session, endpoint: str, user_id: str, key: str, payload: dict
+) -> Optional[dict]:
+    """
+    The stored response for a user's key, from the cache or the database.
+
+    Returns:
+        dict: The response to replay, or None if the key is new (or expired).
+
+    Raises:
+        HTTPException: 422 if the key was used for a different request body.
+    """
+    scope = (endpoint, user_id, key)
+    fingerprint = request_hash(payload)
+    entry = response_cache.get(scope)
+    if entry is not None:
+        return _replay(fingerprint, *entry)
+
+    row = db.get(IdempotencyKey, scope)
+    if row is None:
+        return None
+    if row.created_at < datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_TTL):
+        # Expired but not purged yet: the key is free again
+        db.delete(row)
+        db.flush([row])
+        return None
+    response_cache.put(scope, row.request_hash, row.response)
+    return _replay(fingerprint, row.request_hash, row.response)
+
+
+def record(
+    db: Session,
+    endpoint: str,
+    user_id: str,
+    key: str,
+    payload: dict,
+    response: dict,
+):
+    """
+    Store a response in the current transaction; it is cached once committed.
+
+    Raises:
+        DuplicateKeyError: A concurrent attempt with the same key stored its
+            response first. The session must be rolled back.
+    """
+    # Flush the change itself first, so its own errors surface as they are
+    db.flush()
+
+    fingerprint = request_hash(payload)
+    row = IdempotencyKey(
+        endpoint=endpoint,
+        user_id=user_id,
+        key=key,
+        request_hash=fingerprint,
+        response=response,
+    )
+    db.add(row)
+    try:
+        db.flush([row])
+    except IntegrityError as e:
+        raise DuplicateKeyError(key) from e
+    scope = (endpoint, user_id, key)
+    after_commit(db, lambda: response_cache.put(scope, fingerprint, response))
+
+
+def run_once(
+    db: Session,
+    endpoint: str,
+    user_id: str,
+    key: Optional[str],
+    payload: dict,
+    work: Callable[[], dict],
+) -> dict:
+    """
+    Run `work()` and record its response under the user's `key`, or replay
+    the response recorded for it. Without a key the work simply runs.
+    """
+    if not key:
+        return work()
+    stored = lookup(db, endpoint, user_id, key, payload)
+    if stored is not None:
+        return stored
+    response = work()
+    record(db, endpoint, user_id, key, payload, response)
+    return response
+
+
+def in_progress() -> HTTPException:
+    """The error for a replay racing the first attempt (`DuplicateKeyError`)."""
+    return HTTPException(
+        status_code=409,
+        detail="A request with this Idempotency-Key is already being processed.",
+    )
+
+
+def purge_expired(db: Session) -> int:
+    """Delete stored responses older than IDEMPOTENCY_TTL_SECONDS and commit."""
+    cutoff = datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_TTL)
+    purged = db.execute(
+        delete(IdempotencyKey).where(IdempotencyKey.created_at < cutoff)
+    ).rowcount
+    db.commit()
+    return purged
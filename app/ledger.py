@@ -0,0 +1,190 @@
+from sqlalchemy import func, select, update, insert
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.util import identity_key
+from decimal import Decimal, ROUND_HALF_UP
+from typing import List, Optional
+from .models import User, LedgerEntry, BalanceSnapshot, MINOR_UNITS
+
+
+class InsufficientBalanceError(ValueError):
+    """Raised when a debit would take a balance below zero."""
+
+
+def to_minor(amount: float) -> int:
+    """Convert Sweeps Points to minor units, rounding half up."""
+    return int(
+        (Decimal(str(amount)) * MINOR_UNITS).quantize(Decimal(1), rounding=ROUND_HALF_UP)
+    )
+
+
+def from_minor(amount_minor: int) -> float:
+    """Convert minor units back to Sweeps Points."""
+    return amount_minor / MINOR_UNITS
+
+
+def post(
+    db: Session,
+    user_id: str,
+    amount_minor: int,
+    kind: str,
+    reference: Optional[str] = None,
+    allow_overdraft: bool = True,
+) -> int:
+    """
+    Apply a signed balance movement and record it in the ledger.
+
+    The balance is changed with a single UPDATE ... RETURNING, so there is no
+    read-modify-write in Python and concurrent movements cannot overwrite
+    each other. Debits with `allow_overdraft=False` only apply while the
+    balance covers them.
+
+    Args:
+        db (Session): The database session; nothing is committed.
+        user_id (str): The user whose balance changes.
+        amount_minor (int): Minor units to add (negative to subtract).
+        kind (str): What caused the movement, e.g. "trade" or "settlement".
+        reference (str): Optional pointer to the cause, e.g. "event:12".
+        allow_overdraft (bool): Whether a debit may leave a negative balance.
+
+    Returns:
+        int: The balance after the movement, in minor units.
+    """
+    stmt = update(User).where(User.id == user_id)
+    if amount_minor < 0 and not allow_overdraft:
+        stmt = stmt.where(User.balance_minor >= -amount_minor)
+    stmt = (
+        stmt.values(balance_minor=User.balance_minor + amount_minor)
+        .returning(User.balance_minor)
+        .execution_options(synchronize_session=False)
+    )
+
+    balance_after = db.execute(stmt).scalar_one_or_none()
+    if balance_after is None:
+        if db.get(User, user_id) is None:
+            raise ValueError(f"User {user_id} not found.")
+        raise InsufficientBalanceError("Insufficient balance.")
+
+    # Keep an already loaded User in step without another SELECT
+    user = db.identity_map.get(identity_key(User, user_id))
+    if user is not None:
+        set_committed_value(user, "balance_minor", balance_after)
+
+    db.add(
+        LedgerEntry(
+            user_id=user_id,
+            amount_minor=amount_minor,
+            balance_after=balance_after,
+            kind=kind,
+            reference=reference,
+        )
+    )
+    return balance_after
+
+
+def credit(db: Session, user_id: str, amount_minor: int, kind: str, reference=None) -> int:
+    """Add `amount_minor` to a user's balance. See `post`."""
+    return post(db, user_id, amount_minor, kind, reference)
+
+
+def debit(
+    db: Session,
+    user_id: str,
+    amount_minor: int,
+    kind: str,
+    reference=None,
+    allow_overdraft: bool = False,
+) -> int:
+    """
+    Subtract `amount_minor` from a user's balance. See `post`.
+
+    Raises:
+        InsufficientBalanceError: If the balance does not cover the debit.
+    """
+    return post(db, user_id, -amount_minor, kind, reference, allow_overdraft)
+
+
+def take_snapshots(db: Session) -> int:
+    """
+    Snapshot the balance of every user whose balance moved since their last
+    snapshot (or who has none yet), and commit.
+
+    Returns:
+        int: The number of snapshots written.
+    """
+    latest = (
+        select(
+            BalanceSnapshot.user_id,
+            func.max(BalanceSnapshot.last_entry_id).label("last_entry_id"),
+        )
+        .group_by(BalanceSnapshot.user_id)
+        .subquery()
+    )
+    moved = (
+        select(LedgerEntry.id)
+        .where(
+            LedgerEntry.user_id == User.id,
+            LedgerEntry.id > func.coalesce(latest.c.last_entry_id, 0),
+        )
+        .exists()
+    )
+    # Each user's own latest entry, read by the same statement as the balance,
+    # so both come from one snapshot of the database (on Postgres, under the
+    # default READ COMMITTED, a statement sees a single snapshot)
+    last_entry_id = (
+        select(func.coalesce(func.max(LedgerEntry.id), 0))
+        .where(LedgerEntry.user_id == User.id)
+        .scalar_subquery()
+    )
+    changed_users = (
+        select(User.id, User.balance_minor, last_entry_id, func.now())
+        .outerjoin(latest, latest.c.user_id == User.id)
+        .where(latest.c.user_id.is_(None) | moved)
+    )
+
+    result = db.execute(
+        insert(BalanceSnapshot).from_select(
+            ["user_id", "balance_minor", "last_entry_id", "taken_at"], changed_users
+        )
+    )
+    db.commit()
+    return result.rowcount
+
+
+def audit_balances(db: Session) -> List[dict]:
+    """
+    Check every balance against its latest snapshot plus the ledger entries
+    recorded after it, without replaying the full history.
+
+    Returns:
+        list: One dict per user whose stored balance does not match.
+    """
+    latest = (
+        select(
+            BalanceSnapshot.user_id,
+            func.max(BalanceSnapshot.id).label("snapshot_id"),
+        )
+        .group_by(BalanceSnapshot.user_id)
+        .subquery()
+    )
+    since_snapshot = (
+        select(func.coalesce(func.sum(LedgerEntry.amount_minor), 0))
+        .where(
+            LedgerEntry.user_id == User.id,
+            LedgerEntry.id > BalanceSnapshot.last_entry_id,
+        )
+        .scalar_subquery()
+    )
+    expected = BalanceSnapshot.balance_minor + since_snapshot
+
+    rows = db.execute(
+        select(User.id, User.balance_minor, expected)
+        .join(latest, latest.c.user_id == User.id)
+        .join(BalanceSnapshot, BalanceSnapshot.id == latest.c.snapshot_id)
+        .where(User.balance_minor != expected)
+    ).all()
+
+    return [
+        {"user_id": user_id, "balance_minor": balance, "expected_minor": expected}
+        for user_id, balance, expected in rows
+    ]
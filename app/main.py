@@ -1,20 +1,17 @@
 # FastAPI Imports
-from fastapi import FastAPI, Depends, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Depends, Header, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 import uvicorn
 
 # SQLAlchemy Imports for Database Models
-from sqlalchemy import func
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
-
-# Firebase Admin Imports for Authentication
-import firebase_admin
-from firebase_admin import auth
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Pydantic Models
-from typing import List, Dict
+from typing import List, Dict, Optional
 import pandas as pd
 import joblib
 
@@ -22,7 +19,9 @@ import joblib
 from .db_config import (
     Base,
     get_db,
+    get_async_db,
     engine,
+    SessionLocal,
 )  # Import engine and SessionLocal from config.py
 from .models import (
     User,
@@ -38,29 +37,59 @@ from .schemas import (
     EventResponse,
     CreateRemark,
     RegisterUser,
+    UserLogin,
     BuyShareRequest,
     SellShareRequest,
+    BatchOrderRequest,
     UserProfile,
     UserProfileEdit,
     ChangePasswordRequest,
     EventDetailResponse
 )  # Assuming these are your Pydantic schemas
-from .helper import scrape_and_store_matches
+from .helper import scrape_and_store_matches, AI_BOT_USER_ID
+from .trading import (
+    MAX_BATCH_ORDERS,
+    execute_buy,
+    execute_sell,
+    submit_orders,
+    validate_order,
+)
+from .portfolio import get_portfolio
+from .sequencer import trade_sequencer
+from .depth import depth_book
+from .risk import risk_book
+from .rate_limit import RateLimitMiddleware
+from .token_verifier import TokenExpiredError, TokenVerificationError
+from .auth_providers import (
+    AuthProviderError,
+    AuthServiceError,
+    AuthUserNotFoundError,
+    LocalAuthProvider,
+    auth_provider,
+)
+from .auth_client import auth_client
+from . import trade_history, user_import, user_listing, user_stats
+from . import counters, idempotency, ledger, pricing
+from .ledger import InsufficientBalanceError, to_minor
 
 from .config import add_cors_middleware, start_scheduler
-from .firebase import initialize_firebase
 
 spread_value = 2
 # Create the tables
 Base.metadata.create_all(bind=engine)
 
 app = FastAPI()
+app.add_middleware(RateLimitMiddleware)  # Inside CORS, so 429/503 carry its headers
 add_cors_middleware(app)
 
 
 @app.on_event("startup")
 async def startup_event():
-    initialize_firebase()  # Initialize Firebase
+    auth_provider.initialize()  # Initialize Firebase (or the local stand-in)
+    with SessionLocal() as db:
+        depth_book.rebuild(db)  # Load the market depth of resting limit orders
+        risk_book.rebuild(db)  # Load the users' exposures for the risk limits
+    trade_sequencer.start()  # Lets scheduler jobs trade through the sequencer
     start_scheduler()  # Start scheduling tasks (like scraping)
 
 
@@ -96,8 +125,7 @@ def get_event_by_id(event_id: int, db: Session = Depends(get_db)):
             status_code=404, detail=f"Match for event ID {event_id} not found"
         )
     # Initialize variables to calculate percentages
-    total_yes_bets = db_event.total_yes_bets
-    total_no_bets = db_event.total_no_bets
+    total_yes_bets, total_no_bets = counters.get_totals(db, event_id)
 
     # Calculate yes/no percentages based on the current state
     if total_yes_bets + total_no_bets > 0:
@@ -153,53 +181,73 @@ def get_event_by_id(event_id: int, db: Session = Depends(get_db)):
 @app.get(
     "/events", response_model=Dict[str,List[EventResponse]]
 )  # Return a list of EventResponse objects
-async def get_events(db: Session = Depends(get_db)):
+async def get_events(db: AsyncSession = Depends(get_async_db)):
 
     current_time = func.now()
 
-    # Query the matches that have a bet_end_time greater than the current time
-    matches = db.query(Match).filter(Match.bet_end_time > current_time).all()
+    # Query the events of matches that have a bet_end_time greater than the current time
+    result = await db.execute(
+        select(Event, Match)
+        .join(Match, Event.match_id == Match.id)
+        .filter(Match.bet_end_time > current_time)
+    )
+    rows = result.all()
+    # Current totals of every listed event, from the counter cache
+    totals = await db.run_sync(
+        lambda session: counters.get_totals_many(session, [e.id for e, _ in rows])
+    )
+
     # If no matches, return an empty list instead of raising an error
     events = {}
-    for match in matches:
-        # Get all events for this match
-        match_events = db.query(Event).filter(Event.match_id == match.id).all()
-
-        # Add the events to the list, including the match_time from the related Match table
-        for event in match_events:
-            event_data = event.as_dict()
-            event_data["match_time"] = (
-                match.match_time
-            )  # Include match_time from the Match table
-            # Initialize variables to calculate percentages
-            total_yes_bets = event.total_yes_bets
-            total_no_bets = event.total_no_bets
-
-            # Calculate yes/no percentages based on the current state
-            if total_yes_bets + total_no_bets > 0:
-                yes_percentage = (
-                    total_yes_bets / (total_yes_bets + total_no_bets)
-                ) * 100
-            else:
-                yes_percentage = 50
-
-            event_data["yes_percentage"] = yes_percentage
-            event_data["team1"]= match.team1
-            event_data["team2"]= match.team2
-            buy_price= await get_share_price(event.id,"buy",db)
-            event_data["buy_yes_price"]=buy_price["yes_price"]
-            event_data["buy_no_price"]=buy_price["no_price"]
-
-            league=match.league
-            if league not in events:
-                events[league] = []  # Initialize the list for this league
-            events[league].append(event_data)
+    for event, match in rows:
+        # Add the event, including the match_time from the related Match table
+        event_data = event.as_dict()
+        event_data["match_time"] = (
+            match.match_time
+        )  # Include match_time from the Match table
+        # Initialize variables to calculate percentages
+        total_yes_bets, total_no_bets = totals[event.id]
+        event_data["total_yes_bets"] = total_yes_bets
+        event_data["total_no_bets"] = total_no_bets
+
+        # Calculate yes/no percentages based on the current state
+        if total_yes_bets + total_no_bets > 0:
+            yes_percentage = (
+                total_yes_bets / (total_yes_bets + total_no_bets)
+            ) * 100
+        else:
+            yes_percentage = 50
+
+        event_data["yes_percentage"] = yes_percentage
+        event_data["team1"]= match.team1
+        event_data["team2"]= match.team2
+        buy_price= await get_share_price(event.id,"buy",db)
+        event_data["buy_yes_price"]=buy_price["yes_price"]
+        event_data["buy_no_price"]=buy_price["no_price"]
+
+        league=match.league
+        if league not in events:
+            events[league] = []  # Initialize the list for this league
+        events[league].append(event_data)
 
     return events  # FastAPI will automatically serialize the events using the EventResponse Pydantic model
 
 
 @app.post("/modifyBalance", response_model=dict)
-def modify_balance(create_remark: CreateRemark, db: Session = Depends(get_db)):
+def modify_balance(
+    create_remark: CreateRemark,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: Session = Depends(get_db),
+):
+    # A retried request with the same Idempotency-Key gets the first response
+    payload = create_remark.model_dump(mode="json")
+    if idempotency_key:
+        replay = idempotency.lookup(
+            db, "/modifyBalance", create_remark.user_id, idempotency_key, payload
+        )
+        if replay is not None:
+            return replay
+
     # Check if the user exists
     user = db.query(User).filter(User.id == create_remark.user_id).first()
     if not user:
@@ -213,26 +261,43 @@ def modify_balance(create_remark: CreateRemark, db: Session = Depends(get_db)):
     )
 
     # Update user's balance based on the type (addBalance or subBalance)
+    amount_minor = to_minor(create_remark.amount)
     if create_remark.type == RemarkType.addbalance:
-        user.sweeps_points += create_remark.amount
+        ledger.credit(db, user.id, amount_minor, "remark")
     elif create_remark.type == RemarkType.subbalance:
-        if user.sweeps_points < create_remark.amount:
+        try:
+            ledger.debit(db, user.id, amount_minor, "remark")
+        except InsufficientBalanceError:
             raise HTTPException(
                 status_code=400, detail="Insufficient balance to subtract"
             )
-        user.sweeps_points -= create_remark.amount
-
-    # Add the new remark and update the user
-    db.add(new_remark)
-    db.commit()
 
-    # Return response
-    return {
+    response = {
         "message": "Remark added successfully",
         "user_id": create_remark.user_id,
         "amount": create_remark.amount,
     }
 
+    # Add the new remark and update the user, together with the stored response
+    db.add(new_remark)
+    try:
+        if idempotency_key:
+            idempotency.record(
+                db,
+                "/modifyBalance",
+                create_remark.user_id,
+                idempotency_key,
+                payload,
+                response,
+            )
+        db.commit()
+    except idempotency.DuplicateKeyError:
+        db.rollback()
+        raise idempotency.in_progress()
+
+    # Return response
+    return response
+
 
 @app.post("/ban_unban")
 def ban_unban_user(user_id: str, message: str, db: Session = Depends(get_db)):
@@ -263,50 +328,65 @@ def ban_unban_user(user_id: str, message: str, db: Session = Depends(get_db)):
 
 
 @app.get("/users/", response_model=List[UserOut])  # Define the response model
-def get_users(db: Session = Depends(get_db)):
-    # Query all users from the database
-    users = db.query(User).all()
-
-    # Convert each user to a dictionary using the `as_dict` method
-    users_list = [
-        {
-            key: value
-            for key, value in user.as_dict().items()
-            if key
-            in [
-                "id",
-                "email",
-                "first_name",
-                "last_name",
-                "mobile_number",
-                "country",
-                "created_at",
-                "sweeps_points",
-                "ban",
-            ]
-        }
-        for user in users
-    ]
+def get_users(
+    cursor: Optional[str] = None,
+    limit: int = user_listing.USER_PAGE_SIZE,
+    country: Optional[str] = None,
+    ban: Optional[bool] = None,
+    search: Optional[str] = None,
+    db: Session = Depends(get_db),
+):
+    """
+    One page of users, oldest first. The next page is requested with the
+    cursor from the X-Next-Cursor header, which is absent on the last page.
+    """
+    try:
+        users_list, next_cursor = user_listing.page(
+            db, cursor, limit, country=country, ban=ban, search=search
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return JSONResponse(content=users_list, headers=headers)
+
 
-    return JSONResponse(content=users_list)
+@app.get("/users/export")
+def export_users(
+    format: str = "csv",
+    country: Optional[str] = None,
+    ban: Optional[bool] = None,
+    search: Optional[str] = None,
+):
+    """Stream every user matching the filters as CSV or NDJSON."""
+    if format not in user_listing.EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"format must be one of {list(user_listing.EXPORT_FORMATS)}",
+        )
+    return StreamingResponse(
+        user_listing.export(engine, format, country=country, ban=ban, search=search),
+        media_type=user_listing.EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="users.{format}"'},
+    )
 
 
 @app.get("/users/{user_id}")  # Define the route
 def get_user_by_id(user_id: str, db: Session = Depends(get_db)):
     # Query the user by ID from the database
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id)
 
     # Check if the user exists
     if user is None:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # Calculate total bets placed by the user
-    bets_placed = db.query(Share).filter(Share.user_id == user_id).count()
+    # Trading totals kept by the trade path (cached)
+    summary = user_stats.get_summary(db, user_id)
 
     # Prepare the response data
     response_data = {
         "current_balance": user.sweeps_points,  # Assuming sweeps_points holds the current balance
-        "bets_placed": bets_placed,  # Calculated from the Bet table
+        **summary,  # bets_placed, volume, realized_pnl, last_trade_at
         "first_name": user.first_name,
         "last_name": user.last_name,
         "full_name": f"{user.first_name} {user.last_name}",  # Concatenate first and last name
@@ -323,11 +403,19 @@ def get_user_by_id(user_id: str, db: Session = Depends(get_db)):
     return JSONResponse(content=response_data)
 
 
+def auth_unavailable() -> HTTPException:
+    """The error for an identity provider that timed out or failed."""
+    return HTTPException(
+        status_code=503,
+        detail="Authentication service is unavailable, try again shortly.",
+    )
+
+
 @app.post("/register")
-async def register(user: RegisterUser, db: Session = Depends(get_db)):
+async def register(user: RegisterUser, db: AsyncSession = Depends(get_async_db)):
     try:
         # Create a user in Firebase
-        user_record = auth.create_user(email=user.email, password=user.password)
+        user_record = await auth_client.create_user(user.email, user.password)
 
         # Save user info in the local database
         db_user = User(
@@ -349,10 +437,12 @@ async def register(user: RegisterUser, db: Session = Depends(get_db)):
         )
 
         db.add(db_user)
-        db.commit()  # Commit the transaction to save the user
-        db.refresh(db_user)  # Refresh to get the updated instance
+        await db.commit()  # Commit the transaction to save the user
+        await db.refresh(db_user)  # Refresh to get the updated instance
 
         return {"message": "User registered successfully", "uid": user_record.uid}
+    except AuthServiceError:
+        raise auth_unavailable()
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
@@ -360,281 +450,216 @@ async def register(user: RegisterUser, db: Session = Depends(get_db)):
 security = HTTPBearer()
 
 
+@app.post("/api/admin/users/import")
+async def bulk_import_users(
+    request: Request,
+    format: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Register users in bulk from a streamed CSV (with a header row) or JSON
+    Lines body, one user per line with the fields of /register. The format
+    is taken from `format` or else the Content-Type.
+
+    Returns:
+        dict: How many users were imported and failed, and why each failed.
+    """
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "csv" if "csv" in content_type else "jsonl"
+    if format not in user_import.FORMATS:
+        raise HTTPException(
+            status_code=400, detail=f"format must be one of {user_import.FORMATS}"
+        )
+    return await user_import.import_users(db, request.stream(), format)
+
+
 @app.post("/login")
 async def login(token: HTTPAuthorizationCredentials = Depends(security)):
     try:
         # Verify the Firebase ID Token
-        decoded_token = auth.verify_id_token(token.credentials)
+        decoded_token = await auth_provider.verify_token_async(token.credentials)
         uid = decoded_token.get("uid")
 
-        # Firebase already checks expiration, so no need to manually check "exp"
+        # The verifier already checks expiration, so no need to manually check "exp"
         if not uid:
             raise HTTPException(status_code=400, detail="Token does not contain a UID")
 
         return {"message": "User authenticated", "uid": uid}
 
-    except auth.ExpiredIdTokenError:
+    except TokenExpiredError:
         raise HTTPException(status_code=403, detail="Token has expired")
-    except auth.InvalidIdTokenError:
+    except TokenVerificationError:
         raise HTTPException(status_code=403, detail="Invalid token")
     except Exception as e:
         raise HTTPException(status_code=403, detail=f"Forbidden: {str(e)}")
 
 
-@app.post("/api/market/buy-share")
-async def buy_share(request: BuyShareRequest, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == request.user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    if request.bet_type not in ["buy", "sell"]:
-        raise HTTPException(
-            status_code=400, detail="Invalid bet type. Must be 'buy' or 'sell'."
-        )
-    if request.outcome not in ["yes", "no"]:
-        raise HTTPException(
-            status_code=400, detail="Invalid outcome. Must be 'yes' or 'no'."
-        )
-
-    event = db.query(Event).filter(Event.id == request.event_id).first()
-    if not event:
-        raise HTTPException(status_code=404, detail="Event not found")
-
-    existing_shares = (
-        db.query(Share)
-        .filter(Share.user_id == user.id, Share.event_id == request.event_id)
-        .all()
-    )
-
-    for share in existing_shares:
-        if share.outcome != request.outcome:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Conflicting outcome detected. Existing position is {share.outcome}.",
-            )
+@app.post("/local_login")
+def local_login(credentials: UserLogin):
+    """
+    Sign in against the local auth stand-in (AUTH_PROVIDER=local) and get an
+    ID token for the other endpoints. With Firebase the client signs in with
+    the Firebase SDK instead, so this endpoint does not exist.
+    """
+    if not isinstance(auth_provider, LocalAuthProvider):
+        raise HTTPException(status_code=404, detail="Not Found")
+    try:
+        token = auth_provider.sign_in(credentials.email, credentials.password)
+    except AuthProviderError:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    return {"token": token}
 
-    opposing_shares = [
-        share
-        for share in existing_shares
-        if share.bet_type != request.bet_type and share.amount > 0
-    ]
-    remaining_shares = request.shareCount
-    total_profit_or_loss = 0
-
-    for share in opposing_shares:
-        trade_price = request.share_price
-        if share.amount >= remaining_shares:
-            trade_amount = remaining_shares
-            total_profit_or_loss += trade_amount * (
-                request.share_price / 100 - share.share_price / 100
-            )
-            share.amount -= remaining_shares
-            remaining_shares = 0
-            db.add(share)
-            break
-        else:
-            trade_amount = share.amount
-            total_profit_or_loss += trade_amount * (
-                request.share_price / 100 - share.share_price / 100
-            )
-            remaining_shares -= trade_amount
-            db.delete(share)
 
-    user.sweeps_points += total_profit_or_loss
+async def submit_trade(endpoint: str, request, execute, idempotency_key):
+    """
+    Run `execute(request, session)` through the trade sequencer and return
+    the endpoint's response, replaying the stored response for a repeated
+    Idempotency-Key instead of trading again.
+    """
+    payload = request.model_dump(mode="json")
+    if idempotency_key:
+        # Replays answered by this worker never reach the trade queue
+        replay = idempotency.cached(
+            endpoint, request.user_id, idempotency_key, payload
+        )
+        if replay is not None:
+            return replay
+
+    def trade(session):
+        total_profit_or_loss = execute(request, session)
+        return {
+            "message": "Trade executed successfully",
+            "profit_or_loss": round(total_profit_or_loss, 2),
+        }
 
-    if remaining_shares > 0:
-        total_cost = (request.share_price / 100) * remaining_shares
-        if user.sweeps_points < total_cost:
-            raise HTTPException(
-                status_code=400, detail="Insufficient balance for the trade."
-            )
-        user.sweeps_points -= total_cost
-
-        new_share = Share(
-            user_id=user.id,
-            event_id=request.event_id,
-            amount=remaining_shares,
-            bet_type=request.bet_type,
-            outcome=request.outcome,
-            share_price=request.share_price,
-            limit_price=request.limit_price,
+    try:
+        return await trade_sequencer.submit(
+            request.event_id,
+            lambda session: idempotency.run_once(
+                session,
+                endpoint,
+                request.user_id,
+                idempotency_key,
+                payload,
+                lambda: trade(session),
+            ),
         )
-        db.add(new_share)
+    except idempotency.DuplicateKeyError:
+        raise idempotency.in_progress()
 
-    if request.outcome == "yes":
-        if request.bet_type == "buy":
-            event.total_yes_bets += request.shareCount
-        else:
-            event.total_yes_bets -= request.shareCount
-    elif request.outcome == "no":
-        if request.bet_type == "buy":
-            event.total_no_bets += request.shareCount
-        else:
-            event.total_no_bets -= request.shareCount
 
-    db.commit()
-    return {
-        "message": "Trade executed successfully",
-        "profit_or_loss": round(total_profit_or_loss, 2),
-    }
+@app.post("/api/market/buy-share")
+async def buy_share(
+    request: BuyShareRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    # The trade logic is shared with the AI bot and works on a sync Session.
+    # The sequencer queues it behind earlier trades on the same event and
+    # runs it over the async connection together with concurrent trades,
+    # returning once their shared commit is durable.
+    return await submit_trade(
+        "/api/market/buy-share", request, execute_buy, idempotency_key
+    )
 
 
 @app.post("/api/market/sell-share")
-async def sell_share(request: SellShareRequest, db: Session = Depends(get_db)):
-    # Fetch user
-    user = db.query(User).filter(User.id == request.user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    # Validate bet_type and outcome
-    if request.bet_type != "sell":
-        raise HTTPException(
-            status_code=400, detail="Invalid bet type for selling. Must be 'sell'."
-        )
-    if request.outcome not in ["yes", "no"]:
-        raise HTTPException(
-            status_code=400, detail="Invalid outcome. Must be 'yes' or 'no'."
-        )
-
-    # Fetch event
-    event = db.query(Event).filter(Event.id == request.event_id).first()
-    if not event:
-        raise HTTPException(status_code=404, detail="Event not found")
-
-    # Fetch existing shares for the event
-    existing_shares = (
-        db.query(Share)
-        .filter(Share.user_id == user.id, Share.event_id == request.event_id)
-        .all()
+async def sell_share(
+    request: SellShareRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    # Sequenced per event and committed in a group commit, as in buy_share
+    return await submit_trade(
+        "/api/market/sell-share", request, execute_sell, idempotency_key
     )
 
-    # Check for conflicting outcomes
-    for share in existing_shares:
-        if share.outcome != request.outcome:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Conflicting outcome detected. Existing position is {share.outcome}.",
-            )
-
-    # Resolve opposing positions (e.g., buy existing sell positions)
-    opposing_shares = [
-        share
-        for share in existing_shares
-        if share.bet_type == "buy" and share.amount > 0
-    ]
-    remaining_shares = request.shareCount
-    total_profit_or_loss = 0  # Track profit/loss for opposing trades
-
-    for share in opposing_shares:
-        trade_price = (
-            request.share_price
-        )  # Use the current share price for profit/loss calculation
-        if share.amount >= remaining_shares:
-            # Close partially or fully opposing position
-            trade_amount = remaining_shares
-            total_profit_or_loss += trade_amount * (
-                share.share_price / 100 - request.share_price / 100
-            )
-            share.amount -= remaining_shares
-            remaining_shares = 0
-            db.add(share)
-            break
-        else:
-            # Fully close the opposing position
-            trade_amount = share.amount
-            total_profit_or_loss += trade_amount * (
-                share.share_price / 100 - request.share_price / 100
-            )
-            remaining_shares -= trade_amount
-            db.delete(share)
 
-    # Update user's balance based on profit/loss from opposing trades
-    user.sweeps_points += total_profit_or_loss
+@app.post("/api/market/orders/batch")
+async def batch_orders(request: BatchOrderRequest):
+    if not request.orders:
+        raise HTTPException(status_code=400, detail="No orders given.")
+    if len(request.orders) > MAX_BATCH_ORDERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BATCH_ORDERS} orders can be sent in one batch.",
+        )
 
-    # Handle remaining shares (opening or updating position)
-    if remaining_shares > 0:
-        # Deduct cost for new sell position
-        total_cost = (request.share_price / 100) * remaining_shares
-        if user.sweeps_points < total_cost:
-            raise HTTPException(
-                status_code=400, detail="Insufficient balance for the trade."
+    # Reject the whole batch before touching the database if any order is malformed
+    orders, errors = [], []
+    for index, order in enumerate(request.orders):
+        if order.action not in ["buy", "sell"]:
+            errors.append(
+                {"index": index, "detail": "Invalid action. Must be 'buy' or 'sell'."}
             )
-        user.sweeps_points -= total_cost
-
-        # Create a new sell position
-        new_share = Share(
-            user_id=user.id,
-            event_id=request.event_id,
-            amount=remaining_shares,
-            bet_type="sell",
-            outcome=request.outcome,
-            share_price=request.share_price,
-            limit_price=request.limit_price,
+            continue
+        fields = order.model_dump(exclude={"action"})
+        trade = (
+            BuyShareRequest(**fields)
+            if order.action == "buy"
+            else SellShareRequest(**fields)
         )
-        db.add(new_share)
-
-    # Update event totals
-    if request.outcome == "yes":
-        event.total_yes_bets -= request.shareCount
-    elif request.outcome == "no":
-        event.total_no_bets -= request.shareCount
-
-    # Commit transaction
-    db.commit()
+        detail = validate_order(trade)
+        if detail:
+            errors.append({"index": index, "detail": detail})
+        orders.append(trade)
+    if errors:
+        raise HTTPException(status_code=400, detail=errors)
+
+    # Sequenced per event like single trades; each order reports its own result
+    results = await submit_orders(orders)
     return {
-        "message": "Trade executed successfully",
-        "profit_or_loss": round(total_profit_or_loss, 2),
+        "executed": sum(1 for result in results if result["status"] == "executed"),
+        "results": results,
     }
 
 
 @app.get("/api/market/share-price")
-async def get_share_price(eventId: int, type: str, db: Session = Depends(get_db)):
+async def get_share_price(
+    eventId: int, type: str, db: AsyncSession = Depends(get_async_db)
+):
     # Validate the type parameter
     if type not in ["buy", "sell"]:
         raise HTTPException(
             status_code=400, detail="Invalid type. Must be 'buy' or 'sell'."
         )
 
-    # Retrieve the match details for the given event ID
-    match = db.query(Event).filter(Event.id == eventId).first()
-    if not match:
+    # Retrieve the current totals for the given event ID
+    totals = await db.run_sync(lambda session: counters.get_totals(session, eventId))
+    if totals is None:
         raise HTTPException(status_code=404, detail="Event not found.")
-
-    # Calculate the total shares bought for both outcomes
-    total_shares = match.total_yes_bets + match.total_no_bets
-
-    # Set a fixed spread value
-    spread_value = 2  # Fixed spread value
-
-    # Avoid division by zero if there are no shares bought yet
-    if total_shares == 0:
-        yes_price = 50  # Set a base price of 50 when no shares have been bought
-        no_price = 50
-    else:
-        # Calculate share price as a percentage of total shares bought for each outcome
-        yes_price = (match.total_yes_bets / total_shares) * 100
-        no_price = (match.total_no_bets / total_shares) * 100
-
-    # Adjust prices based on the type (buy or sell)
-    if type == "buy":
-        yes_price += spread_value
-        no_price += spread_value
-    elif type == "sell":
-        yes_price -= spread_value
-        no_price -= spread_value
-
-    # Ensure prices don't go below 0
-    yes_price = max(0, yes_price)
-    no_price = max(0, no_price)
+    yes_price, no_price = pricing.engine.quote(*totals, type)
 
     return {
         "eventId": eventId,
         "type": type,
-        "yes_price": round(yes_price, 2),
-        "no_price": round(no_price, 2),
+        "yes_price": yes_price,
+        "no_price": no_price,
     }
 
 
+@app.get("/api/market/{event_id}/depth")
+async def get_market_depth(
+    event_id: int, request: Request, db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Aggregated resting limit orders per price level for both outcomes and
+    sides, served from the in-memory depth book. Send the returned ETag as
+    If-None-Match to get a 304 while the book has not changed.
+    """
+    etag = depth_book.etag(event_id)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    # Cached totals double as a cheap existence check
+    totals = await db.run_sync(lambda session: counters.get_totals(session, event_id))
+    if totals is None:
+        raise HTTPException(status_code=404, detail="Event not found.")
+
+    snapshot = depth_book.snapshot(event_id)
+    etag = depth_book.etag(event_id, snapshot["version"])
+    return JSONResponse(content=snapshot, headers={"ETag": etag})
+
+
 @app.patch("/api/admin/user-profile/edit/{userId}")
 def edit_user_profile(
     userId: str, profile_data: UserProfileEdit, db: Session = Depends(get_db)
@@ -653,11 +678,15 @@ def edit_user_profile(
     if profile_data.email and profile_data.email != user.email:
         try:
             # Update email in Firebase Authentication
-            firebase_user = auth.get_user_by_email(user.email)
-            auth.update_user(firebase_user.uid, email=profile_data.email)
-        except auth.UserNotFoundError:
+            firebase_user = auth_client.call_sync("get_user_by_email", user.email)
+            auth_client.call_sync(
+                "update_user", firebase_user.uid, email=profile_data.email
+            )
+        except AuthServiceError:
+            raise auth_unavailable()
+        except AuthUserNotFoundError:
             raise HTTPException(status_code=404, detail="User not found in Firebase")
-        except firebase_admin.exceptions.FirebaseError as e:
+        except AuthProviderError as e:
             raise HTTPException(
                 status_code=400, detail=f"Error updating email in Firebase: {str(e)}"
             )
@@ -678,11 +707,11 @@ def edit_user_profile(
 
     # Adjust balance
     if profile_data.add_balance:
-        user.sweeps_points += profile_data.add_balance
+        ledger.credit(db, user.id, to_minor(profile_data.add_balance), "admin")
     if profile_data.subtract_balance:
-        if user.sweeps_points >= profile_data.subtract_balance:
-            user.sweeps_points -= profile_data.subtract_balance
-        else:
+        try:
+            ledger.debit(db, user.id, to_minor(profile_data.subtract_balance), "admin")
+        except InsufficientBalanceError:
             raise HTTPException(
                 status_code=400, detail="Insufficient balance for subtraction"
             )
@@ -699,10 +728,10 @@ def edit_user_profile(
 
 
 # Dependency to verify the user using Firebase token
-def get_current_user(token: str = Depends(HTTPBearer())):
+async def get_current_user(token: str = Depends(HTTPBearer())):
     try:
-        # Verify the Firebase token
-        decoded_token = auth.verify_id_token(token.credentials)
+        # Verify the Firebase token (repeat tokens are served from the cache)
+        decoded_token = await auth_provider.verify_token_async(token.credentials)
         uid = decoded_token["uid"]
         return uid
     except Exception as e:
@@ -726,8 +755,65 @@ async def get_user_profile(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # Return the user profile as a response
-    return user.as_dict()
+    # Return the user profile, with the trading summary, as a response
+    return {**user.as_dict(), **user_stats.get_summary(db, user_id)}
+
+
+@app.get("/api/user/{user_id}/portfolio")
+async def get_user_portfolio(
+    user_id: str,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: str = Depends(get_current_user),
+):
+    # Users can only see their own positions
+    if current_user != user_id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    if await db.get(User, user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # All open positions valued at current prices in one pass
+    portfolio = await db.run_sync(lambda session: get_portfolio(session, user_id))
+    return JSONResponse(content=portfolio)
+
+
+@app.get("/api/user/{user_id}/trades")
+async def get_user_trades(
+    user_id: str,
+    cursor: Optional[str] = None,
+    limit: int = trade_history.TRADE_PAGE_SIZE,
+    event_id: Optional[int] = None,
+    league: Optional[str] = None,
+    outcome: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: str = Depends(get_current_user),
+):
+    """
+    One page of the user's executed orders, newest first. The next page is
+    requested with the cursor from the X-Next-Cursor header, which is absent
+    on the last page.
+    """
+    # Users can only see their own trades
+    if current_user != user_id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    try:
+        trades, next_cursor = await db.run_sync(
+            lambda session: trade_history.page(
+                session,
+                user_id,
+                cursor,
+                limit,
+                event_id=event_id,
+                league=league,
+                outcome=outcome,
+            )
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return JSONResponse(content=trades, headers=headers)
 
 
 @app.patch("/api/user/profile/edit/{user_id}", response_model=UserProfileEdit)
@@ -794,13 +880,17 @@ async def change_password(
     # Update password in Firebase
     try:
         # Fetch user from Firebase by the user's ID
-        firebase_user = auth.get_user(user.id)
+        firebase_user = await auth_client.get_user(user.id)
 
         # Update the password in Firebase
-        auth.update_user(firebase_user.uid, password=password_data.new_password)
-    except auth.UserNotFoundError:
+        await auth_client.update_user(
+            firebase_user.uid, password=password_data.new_password
+        )
+    except AuthServiceError:
+        raise auth_unavailable()
+    except AuthUserNotFoundError:
         raise HTTPException(status_code=404, detail="User not found in Firebase")
-    except firebase_admin.exceptions.FirebaseError as e:
+    except AuthProviderError as e:
         raise HTTPException(
             status_code=400, detail=f"Error updating password in Firebase: {str(e)}"
         )
@@ -817,11 +907,11 @@ async def google_signup(
         # Get the Firebase token from the 'Authorization' header (Bearer token)
         id_token = authorization.credentials
         # Verify the Google ID token
-        decoded_token = auth.verify_id_token(id_token)
+        decoded_token = await auth_provider.verify_token_async(id_token)
         uid = decoded_token.get("uid")
 
         # Get the user's info from Firebase
-        user_record = auth.get_user(uid)
+        user_record = await auth_client.get_user(uid)
 
         # Get user's data (email, name, etc.)
         email = user_record.email
@@ -859,8 +949,10 @@ async def google_signup(
 
         return {"message": "User signed up successfully", "uid": uid}
 
-    except auth.InvalidIdTokenError:
+    except TokenVerificationError:
         raise HTTPException(status_code=400, detail="Invalid Google token")
+    except AuthServiceError:
+        raise auth_unavailable()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -872,14 +964,12 @@ def get_ai_bets(db: Session = Depends(get_db)):
     Returns a list of bets with team names, league, bet type, outcome, number of shares, and bet time.
     """
 
-    bot_user_id = "ts0Q2DAo9UVORtL2yKu6b3LPIcH3"  # AI bot user ID
-    
     # Query to fetch all bets made by the AI bot
     ai_bets = (
         db.query(Share)
         .join(Event, Share.event_id == Event.id)
         .join(Match, Event.match_id == Match.id)
-        .filter(Share.user_id == bot_user_id)
+        .filter(Share.user_id == AI_BOT_USER_ID)
         .all()
     )
 
@@ -2,6 +2,7 @@ from sqlalchemy import (
     Column,
     String,
     Integer,
+    BigInteger,
     DateTime,
     Float,
     Boolean,
@@ -9,10 +10,12 @@ from sqlalchemy import (
     JSON,
     func,
     Enum,
+    Index,
 )
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.mutable import MutableList
+from sqlalchemy.ext.hybrid import hybrid_property
 from enum import Enum as PyEnum
 from typing import List, Optional
 from datetime import datetime, timedelta
@@ -24,6 +27,10 @@ from .auth import (
 from .db_config import Base
 
 
+# Balances are stored as integers in hundredths of a Sweeps Point
+MINOR_UNITS = 100
+
+
 class UserRole(str, PyEnum):
     ADMIN = "admin"
     USER = "user"
@@ -54,12 +61,42 @@ class Event(Base):
     )  # Updated to Share
     match = relationship("Match", back_populates="events")
 
+    __table_args__ = (
+        # Events of a match, optionally only unresolved ones (listings, scheduler jobs)
+        Index("ix_events_match_id_resolved", "match_id", "resolved"),
+        # Just the unresolved events, for jobs that start from them (AI bot, results)
+        Index(
+            "ix_events_unresolved_match_id",
+            "match_id",
+            sqlite_where=resolved == False,
+            postgresql_where=resolved == False,
+        ),
+    )
+
     def as_dict(self):
         return {
             column.name: getattr(self, column.name) for column in self.__table__.columns
         }
 
 
+class EventCounterShard(Base):
+    """
+    One slice of an event's yes/no totals.
+
+    With EVENT_COUNTER_SHARDS set, trades add to a random shard of the event
+    instead of the events row, so concurrent trades on one hot market do not
+    queue on a single row lock. Totals are the events row plus the sum of
+    its shards; app.counters folds shards back into the events row.
+    """
+
+    __tablename__ = "event_counter_shards"
+
+    event_id = Column(Integer, ForeignKey("events.id"), primary_key=True)
+    shard = Column(Integer, primary_key=True)
+    yes_delta = Column(Integer, nullable=False, default=0)
+    no_delta = Column(Integer, nullable=False, default=0)
+
+
 # Database Models
 class Match(Base):
     __tablename__ = "matches"
@@ -73,6 +110,11 @@ class Match(Base):
 
     events = relationship("Event", back_populates="match", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_matches_bet_end_time", "bet_end_time"),  # Open-for-betting listings
+        Index("ix_matches_match_time", "match_time"),  # Result calculation job
+    )
+
     def as_dict(self):
         return {
             column.name: (
@@ -102,6 +144,95 @@ class Share(Base):
     user = relationship("User", back_populates="shares")
     event = relationship("Event", back_populates="shares")
 
+    __table_args__ = (
+        # A user's position in an event (trading)
+        Index("ix_shares_user_id_event_id", "user_id", "event_id"),
+        # All shares of an event (settlement, /events/results)
+        Index("ix_shares_event_id", "event_id"),
+        # Resting stop/limit orders only (execute_stop_orders)
+        Index(
+            "ix_shares_limit_price",
+            "limit_price",
+            sqlite_where=limit_price.isnot(None),
+            postgresql_where=limit_price.isnot(None),
+        ),
+    )
+
+
+class Position(Base):
+    """
+    A user's net position in an event, maintained by app.positions in the
+    same transaction as every trade. The Share rows remain the individual
+    lots; this row is their running total.
+    """
+
+    __tablename__ = "positions"
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    event_id = Column(Integer, ForeignKey("events.id"), primary_key=True)
+    outcome = Column(String, nullable=False)  # "yes" or "no"
+    net_shares = Column(Float, nullable=False, default=0)  # Buy lots > 0, sell lots < 0
+    avg_cost = Column(Float, nullable=False, default=0)  # Average price of open lots
+    realized_pnl_minor = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(
+        DateTime, server_default=func.now(), onupdate=func.now(), nullable=False
+    )
+
+    __table_args__ = (Index("ix_positions_event_id", "event_id"),)  # Settlement
+
+
+class Trade(Base):
+    """
+    One executed order, appended by app.trade_history and never updated.
+    Share rows are deleted as lots close; this is the permanent record.
+    """
+
+    __tablename__ = "trades"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    event_id = Column(Integer, ForeignKey("events.id"), nullable=False)
+    outcome = Column(String, nullable=False)  # "yes" or "no"
+    bet_type = Column(String, nullable=False)  # "buy" or "sell"
+    shares = Column(Float, nullable=False)
+    price = Column(Float, nullable=False)  # Execution price, 0-100
+    realized_pnl_minor = Column(BigInteger, nullable=False, default=0)
+    source = Column(String, nullable=False)  # "trade" or "stop_order"
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        # A user's history in (created_at, id) order. Every column a page
+        # returns is in the key, so pages are index-only scans (INCLUDE is
+        # Postgres-only, hence key columns).
+        Index(
+            "ix_trades_user_history",
+            "user_id",
+            "created_at",
+            "id",
+            "event_id",
+            "outcome",
+            "bet_type",
+            "shares",
+            "price",
+            "realized_pnl_minor",
+        ),
+    )
+
+
+class UserStats(Base):
+    """
+    Running trading totals per user, maintained by app.user_stats in the
+    same transaction as every trade and settlement.
+    """
+
+    __tablename__ = "user_stats"
+
+    user_id = Column(String, ForeignKey("users.id"), primary_key=True)
+    bets_placed = Column(Integer, nullable=False, default=0)  # Orders executed
+    volume_minor = Column(BigInteger, nullable=False, default=0)  # Shares x price
+    realized_pnl_minor = Column(BigInteger, nullable=False, default=0)
+    last_trade_at = Column(DateTime, nullable=True)
+
 
 # Define the Remarks model
 class Remarks(Base):
@@ -139,9 +270,9 @@ class User(Base):
 
     created_at = Column(DateTime, server_default=func.now(), nullable=False)
     role = Column(String, nullable=False, default=UserRole.USER.value)
-    sweeps_points = Column(
-        Float, default=5000.0
-    )  # Default starting balance of Sweeps Points
+    balance_minor = Column(
+        BigInteger, nullable=False, default=5000 * MINOR_UNITS
+    )  # Sweeps Points balance in minor units, changed only through app.ledger
     betting_points = Column(
         Float, default=5000.0
     )  # Default starting balance of Betting Points
@@ -161,6 +292,13 @@ class User(Base):
         "Remarks", back_populates="user"
     )  # New relationship for remarks
 
+    __table_args__ = (
+        # Keyset pagination of the admin user listing and export
+        Index("ix_users_created_at_id", "created_at", "id"),
+        # Case-insensitive email lookups (bulk import)
+        Index("ix_users_email_lower", func.lower(email)),
+    )
+
     def as_dict(self):
         return {
             "id": self.id,
@@ -181,6 +319,19 @@ class User(Base):
             "ban": self.ban,
         }
 
+    @hybrid_property
+    def sweeps_points(self) -> float:
+        return self.balance_minor / MINOR_UNITS
+
+    @sweeps_points.setter
+    def sweeps_points(self, value: float):
+        # Only for initial balances; movements go through app.ledger
+        self.balance_minor = int(round(value * MINOR_UNITS))
+
+    @sweeps_points.expression
+    def sweeps_points(cls):
+        return cls.balance_minor / float(MINOR_UNITS)
+
     @staticmethod
     def hash_password(password: str) -> str:
         return hash_password(password)
@@ -189,24 +340,47 @@ class User(Base):
     def verify_password(hashed_password: str, plain_password: str) -> bool:
         return verify_password(hashed_password, plain_password)
 
-    def update_points(self, amount: float, point_type: str, transaction_type: str):
-        """
-        Updates the user's points based on the share transaction.
-
-        :param amount: Amount to add or subtract from the balance.
-        :param point_type: Either "sweeps_points" or "betting_points".
-        :param transaction_type: Either "buy" or "sell".
-        """
-        if point_type not in ["sweeps_points", "betting_points"]:
-            raise ValueError(
-                "Invalid point type. Must be 'sweeps_points' or 'betting_points'."
-            )
 
-        if transaction_type == "buy":
-            if getattr(self, point_type) < amount:
-                raise ValueError(f"Insufficient {point_type} balance.")
-            setattr(self, point_type, getattr(self, point_type) - amount)
-        elif transaction_type == "sell":
-            setattr(self, point_type, getattr(self, point_type) + amount)
-        else:
-            raise ValueError("Invalid transaction type. Must be 'buy' or 'sell'.")
+class LedgerEntry(Base):
+    """Append-only record of every Sweeps Points movement."""
+
+    __tablename__ = "ledger_entries"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    amount_minor = Column(BigInteger, nullable=False)  # Signed: credits > 0
+    balance_after = Column(BigInteger, nullable=False)  # Balance once applied
+    kind = Column(String, nullable=False)  # e.g. "trade", "settlement", "admin"
+    reference = Column(String, nullable=True)  # e.g. "event:12"
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+    __table_args__ = (Index("ix_ledger_entries_user_id_id", "user_id", "id"),)
+
+
+class BalanceSnapshot(Base):
+    """A user's balance as of a ledger entry, so audits start from here."""
+
+    __tablename__ = "balance_snapshots"
+
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    user_id = Column(String, ForeignKey("users.id"), nullable=False)
+    balance_minor = Column(BigInteger, nullable=False)
+    last_entry_id = Column(BigInteger, nullable=False)  # 0 before any entry
+    taken_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+    __table_args__ = (Index("ix_balance_snapshots_user_id_id", "user_id", "id"),)
+
+
+class IdempotencyKey(Base):
+    """The stored response of a request sent with an Idempotency-Key header."""
+
+    __tablename__ = "idempotency_keys"
+
+    endpoint = Column(String, primary_key=True)  # e.g. "/api/market/buy-share"
+    user_id = Column(String, primary_key=True)  # The user the request acts for
+    key = Column(String, primary_key=True)  # The client's Idempotency-Key
+    request_hash = Column(String, nullable=False)  # SHA-256 of the request body
+    response = Column(JSON, nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+    __table_args__ = (Index("ix_idempotency_keys_created_at", "created_at"),)
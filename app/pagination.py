@@ -0,0 +1,83 @@
+"""
+Keyset pagination on (created_at, id).
+
+A cursor is the opaque, URL-safe encoding of the last row of a page; the
+next page is every row strictly after it in (created_at, id) order, which an
+index on those columns serves as a range scan however deep the page is.
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Tuple, Union
+
+from sqlalchemy import DateTime, String, literal, tuple_
+from sqlalchemy.sql import ColumnElement
+from sqlalchemy.types import TypeDecorator
+
+RowKey = Union[str, int]
+
+
+class CursorTimestamp(TypeDecorator):
+    """
+    A cursor timestamp bound as the column's own type: TIMESTAMP on Postgres.
+
+    SQLite has no timestamp type and compares the stored text. Server-default
+    timestamps are stored without microseconds, while SQLAlchemy's DateTime
+    always renders them, so an equal timestamp would compare greater and the
+    rows sharing it would be skipped. There the value is bound as the same
+    ISO text the column holds.
+    """
+
+    impl = DateTime
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "sqlite":
+            return dialect.type_descriptor(String())
+        return dialect.type_descriptor(DateTime())
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and dialect.name == "sqlite":
+            return value.isoformat(sep=" ")
+        return value
+
+    def process_literal_param(self, value, dialect):
+        return self.process_bind_param(value, dialect)
+
+
+def encode_cursor(created_at: datetime, row_id: RowKey) -> str:
+    """The cursor of the page after the row (created_at, row_id)."""
+    return base64.urlsafe_b64encode(
+        json.dumps([created_at.isoformat(), row_id]).encode()
+    ).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, RowKey]:
+    """
+    Raises:
+        ValueError: The cursor was not made by `encode_cursor`.
+    """
+    try:
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(row_id, (str, int)):
+            raise TypeError(row_id)
+        return datetime.fromisoformat(created_at), row_id
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def after_cursor(
+    created_at_column, id_column, cursor: str, descending: bool = False
+) -> ColumnElement:
+    """
+    The condition selecting the rows after `cursor`, in ascending or
+    descending (created_at, id) order.
+
+    Raises:
+        ValueError: The cursor is invalid.
+    """
+    created_at, row_id = decode_cursor(cursor)
+    key = tuple_(created_at_column, id_column)
+    bound = tuple_(literal(created_at, CursorTimestamp()), literal(row_id))
+    return key < bound if descending else key > bound
@@ -0,0 +1,120 @@
+"""
+Mark-to-market valuation of a user's open positions.
+
+The positions, their events' current totals and the resulting prices are
+all loaded and computed in bulk, so valuing thousands of positions costs
+two queries (one when the totals are cached) and a handful of array
+operations.
+"""
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import counters, pricing
+from .ledger import from_minor
+from .models import Event, Position, MINOR_UNITS
+
+
+def value_positions(outcome_is_yes, net_shares, avg_cost, yes_totals, no_totals):
+    """
+    Mark positions at the price that would close them: the sell price for
+    buy lots (net shares > 0) and the buy price for sell lots.
+
+    All arguments are arrays aligned by position.
+
+    Returns:
+        tuple: The (mark_price, market_value, unrealized_pnl) arrays, the
+        last two in Sweeps Points.
+    """
+    buy_yes, buy_no = pricing.engine.quote(yes_totals, no_totals, "buy")
+    sell_yes, sell_no = pricing.engine.quote(yes_totals, no_totals, "sell")
+
+    long = net_shares > 0
+    mark_price = np.where(
+        outcome_is_yes,
+        np.where(long, sell_yes, buy_yes),
+        np.where(long, sell_no, buy_no),
+    )
+    market_value = np.abs(net_shares) * mark_price / 100
+    unrealized_pnl = net_shares * (mark_price - avg_cost) / 100
+    return mark_price, market_value, unrealized_pnl
+
+
+def get_portfolio(db: Session, user_id: str) -> dict:
+    """
+    Value every open position of a user at current prices.
+
+    Returns:
+        dict: The positions with their mark price, market value and
+        unrealized/realized PnL, plus portfolio totals.
+    """
+    rows = db.execute(
+        select(
+            Position.event_id,
+            Event.question,
+            Position.outcome,
+            Position.net_shares,
+            Position.avg_cost,
+            Position.realized_pnl_minor,
+        )
+        .join(Event, Event.id == Position.event_id)
+        .where(Position.user_id == user_id, Position.net_shares != 0)
+        .order_by(Position.event_id)
+    ).all()
+
+    if not rows:
+        return {
+            "user_id": user_id,
+            "positions": [],
+            "totals": {"market_value": 0, "unrealized_pnl": 0, "realized_pnl": 0},
+        }
+
+    event_ids, questions, outcomes, net_shares, avg_cost, realized_minor = zip(*rows)
+    totals = counters.get_totals_many(db, event_ids)
+    yes_totals, no_totals = np.array(
+        [totals.get(event_id, (0, 0)) for event_id in event_ids], dtype=float
+    ).T
+
+    net_shares = np.array(net_shares, dtype=float)
+    avg_cost = np.array(avg_cost, dtype=float)
+    realized_pnl = np.array(realized_minor, dtype=float) / MINOR_UNITS
+    mark_price, market_value, unrealized_pnl = value_positions(
+        np.array(outcomes) == "yes", net_shares, avg_cost, yes_totals, no_totals
+    )
+
+    keys = [
+        "event_id",
+        "question",
+        "outcome",
+        "net_shares",
+        "avg_cost",
+        "mark_price",
+        "market_value",
+        "unrealized_pnl",
+        "realized_pnl",
+    ]
+    positions = [
+        dict(zip(keys, values))
+        for values in zip(
+            event_ids,
+            questions,
+            outcomes,
+            net_shares.tolist(),
+            np.round(avg_cost, 2).tolist(),
+            mark_price.tolist(),
+            np.round(market_value, 2).tolist(),
+            np.round(unrealized_pnl, 2).tolist(),
+            realized_pnl.tolist(),
+        )
+    ]
+
+    return {
+        "user_id": user_id,
+        "positions": positions,
+        "totals": {
+            "market_value": round(float(market_value.sum()), 2),
+            "unrealized_pnl": round(float(unrealized_pnl.sum()), 2),
+            "realized_pnl": from_minor(int(sum(realized_minor))),
+        },
+    }
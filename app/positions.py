@@ -0,0 +1,147 @@
+"""
+Net positions per user and event, kept in step with the Share lots.
+
+Every trade updates the user's `Position` row in the same transaction, so
+conflict checks, portfolio views and settlement read one row per user and
+event. The Share rows are only loaded when an order closes lots against
+them, since each lot carries its own price and limit price.
+"""
+
+from typing import List, Optional
+
+from sqlalchemy.orm import Session
+
+from .models import Position, Share
+
+
+def get_position(db: Session, user_id: str, event_id: int) -> Optional[Position]:
+    """The user's position in an event, or None if they never traded it."""
+    return db.get(Position, (user_id, event_id))
+
+
+def open_lots(db: Session, user_id: str, event_id: int, bet_type: str) -> List[Share]:
+    """The user's open lots of one bet type in an event, oldest first."""
+    return (
+        db.query(Share)
+        .filter(
+            Share.user_id == user_id,
+            Share.event_id == event_id,
+            Share.bet_type == bet_type,
+            Share.amount > 0,
+        )
+        .order_by(Share.id)
+        .all()
+    )
+
+
+def is_closing(position: Optional[Position], bet_type: str) -> bool:
+    """Whether an order of `bet_type` closes lots of the position."""
+    if position is None or not position.net_shares:
+        return False
+    return (position.net_shares > 0) != (bet_type == "buy")
+
+
+def apply_trade(
+    db: Session,
+    position: Optional[Position],
+    user_id: str,
+    event_id: int,
+    outcome: str,
+    bet_type: str,
+    shares: float,
+    price: float,
+    realized_minor: int,
+    lots_left: List[Share],
+) -> Position:
+    """
+    Fold an executed order into the user's position.
+
+    Args:
+        db (Session): The database session; nothing is committed.
+        position (Position): The current position, or None to open one.
+        user_id (str): The trading user.
+        event_id (int): The event traded on.
+        outcome (str): "yes" or "no".
+        bet_type (str): "buy" adds to the net shares, "sell" subtracts.
+        shares (float): The full order size.
+        price (float): The order price.
+        realized_minor (int): Profit or loss realised by closing lots.
+        lots_left (list): When the order closed lots, those still open after it.
+
+    Returns:
+        Position: The updated (or new) position.
+    """
+    if position is None:
+        position = Position(
+            user_id=user_id,
+            event_id=event_id,
+            outcome=outcome,
+            net_shares=0,
+            avg_cost=0,
+            realized_pnl_minor=0,
+        )
+        db.add(position)
+        # Make it visible to db.get for the next order in the same batch
+        db.flush([position])
+
+    held = position.net_shares
+    net = held + (shares if bet_type == "buy" else -shares)
+
+    if not held or (held > 0) == (bet_type == "buy"):
+        # Opening or adding to the position
+        position.avg_cost = (abs(held) * position.avg_cost + shares * price) / abs(net)
+    elif not net:
+        position.avg_cost = 0
+    elif (net > 0) == (held > 0):
+        # Partly closed: the average of the lots still open
+        open_amount = sum(lot.amount for lot in lots_left)
+        position.avg_cost = (
+            sum(lot.amount * lot.share_price for lot in lots_left) / open_amount
+            if open_amount
+            else 0
+        )
+    else:
+        # Closed and reversed: only the new lot is open
+        position.avg_cost = price
+
+    position.outcome = outcome
+    position.net_shares = net
+    position.realized_pnl_minor += realized_minor
+    return position
+
+
+def remove_lot(db: Session, share: Share):
+    """Take a lot that is being deleted out of its position."""
+    position = get_position(db, share.user_id, share.event_id)
+    if position is None:
+        return
+
+    remaining = abs(position.net_shares) - share.amount
+    position.avg_cost = (
+        (
+            abs(position.net_shares) * position.avg_cost
+            - share.amount * share.share_price
+        )
+        / remaining
+        if remaining > 0
+        else 0
+    )
+    position.net_shares -= share.amount if share.bet_type == "buy" else -share.amount
+
+
+def settlement_payout(position: Position, winning_outcome: str) -> float:
+    """
+    Sweeps Points a position pays out when the event resolves (negative for
+    a loss). Matches settling each of its lots separately.
+    """
+    shares = abs(position.net_shares)
+    won = position.outcome == winning_outcome
+    if position.net_shares > 0:
+        # Buy lots
+        if won:
+            return shares * (100 - position.avg_cost) / 100
+        return -shares * position.avg_cost / 100
+    # Sell lots
+    if won:
+        return shares * position.avg_cost / 100
+    return -shares * (100 - position.avg_cost) / 100
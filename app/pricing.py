@@ -0,0 +1,197 @@
+"""
+Share pricing engines.
+
+Every price in the app (quotes, listings, stop orders, the AI bot,
+portfolio valuation and trade execution) comes from the engine selected
+with PRICING_ENGINE:
+
+- "legacy" (default): price = share of the event's totals, plus/minus a
+  fixed spread. Orders execute at the price the client sends.
+- "lmsr": Hanson's logarithmic market scoring rule with liquidity
+  LMSR_LIQUIDITY. Orders execute at the exact cost of their size.
+- "cpmm": a constant-product market maker with LMSR's interface, seeded
+  with CPMM_LIQUIDITY shares of each outcome.
+
+An engine's only per-event state is the event's yes/no totals, which
+app.counters keeps in memory, so a quote or the cost of an N-share order
+is a constant-time formula. Prices are in cents of a Sweeps Point (a
+winning share pays 100), and all methods accept NumPy arrays of totals as
+well as single values.
+"""
+
+import os
+from abc import ABC, abstractmethod
+from typing import Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from . import counters
+
+
+class PricingEngine(ABC):
+    """Base class: quotes and order prices over an event's (yes, no) totals."""
+
+    name = ""
+    spread = 0.0  # Cents added to buy quotes and taken off sell quotes
+    prices_orders = True  # False: orders execute at the client's price
+
+    @abstractmethod
+    def quote(self, yes_total, no_total, bet_type: str):
+        """
+        Price of one share of each outcome, in cents.
+
+        Returns:
+            tuple: The (yes_price, no_price) pair, rounded to 2 decimals.
+        """
+
+    @abstractmethod
+    def order_price(self, yes_total, no_total, outcome: str, bet_type: str, shares):
+        """Average price in cents of a `bet_type` order for `shares` (> 0) shares."""
+
+
+class CostFunctionEngine(PricingEngine):
+    """A cost-function market maker: prices are differences of its cost."""
+
+    @abstractmethod
+    def cost_function(self, yes_total, no_total):
+        """Sweeps Points paid into the market to reach these totals."""
+
+    def cost(self, yes_total, no_total, outcome: str, shares):
+        """
+        Sweeps Points to buy `shares` of `outcome` (negative `shares` sells
+        and returns minus the proceeds), before the spread.
+        """
+        if outcome == "yes":
+            after = self.cost_function(yes_total + shares, no_total)
+        else:
+            after = self.cost_function(yes_total, no_total + shares)
+        return after - self.cost_function(yes_total, no_total)
+
+    def quote(self, yes_total, no_total, bet_type: str):
+        yes_total = np.asarray(yes_total, dtype=float)
+        no_total = np.asarray(no_total, dtype=float)
+        step = 1 if bet_type == "buy" else -1
+        spread = self.spread if bet_type == "buy" else -self.spread
+        yes_price = self.cost(yes_total, no_total, "yes", step) * step * 100 + spread
+        no_price = self.cost(yes_total, no_total, "no", step) * step * 100 + spread
+        return _rounded(np.maximum(0, yes_price)), _rounded(np.maximum(0, no_price))
+
+    def order_price(self, yes_total, no_total, outcome: str, bet_type: str, shares):
+        step = 1 if bet_type == "buy" else -1
+        spread = self.spread if bet_type == "buy" else -self.spread
+        paid = self.cost(yes_total, no_total, outcome, step * shares) * step
+        return round(max(0.0, float(paid) / shares * 100 + spread), 4)
+
+
+class LegacyEngine(PricingEngine):
+    """The original proportional price with a fixed spread."""
+
+    name = "legacy"
+    spread = float(os.getenv("PRICING_SPREAD", "2"))
+    prices_orders = False
+
+    def quote(self, yes_total, no_total, bet_type: str):
+        yes_total = np.asarray(yes_total, dtype=float)
+        no_total = np.asarray(no_total, dtype=float)
+        total_shares = yes_total + no_total
+
+        # Base price of 50 until shares have been bought
+        with np.errstate(divide="ignore", invalid="ignore"):
+            yes_price = np.where(
+                total_shares == 0, 50.0, yes_total / total_shares * 100
+            )
+            no_price = np.where(total_shares == 0, 50.0, no_total / total_shares * 100)
+
+        spread = self.spread if bet_type == "buy" else -self.spread
+        yes_price = np.maximum(0, yes_price + spread)
+        no_price = np.maximum(0, no_price + spread)
+        return _rounded(yes_price), _rounded(no_price)
+
+    def order_price(self, yes_total, no_total, outcome: str, bet_type: str, shares):
+        # No price impact: every share costs the current quote
+        yes_price, no_price = self.quote(yes_total, no_total, bet_type)
+        return yes_price if outcome == "yes" else no_price
+
+
+class LMSREngine(CostFunctionEngine):
+    """Logarithmic market scoring rule: C(q) = b * ln(e^(q_yes/b) + e^(q_no/b))."""
+
+    name = "lmsr"
+    spread = float(os.getenv("PRICING_SPREAD", "0"))
+
+    def __init__(self, liquidity: float = float(os.getenv("LMSR_LIQUIDITY", "100"))):
+        self.liquidity = liquidity
+
+    def cost_function(self, yes_total, no_total):
+        b = self.liquidity
+        return b * np.logaddexp(np.divide(yes_total, b), np.divide(no_total, b))
+
+
+class ConstantProductEngine(CostFunctionEngine):
+    """
+    Constant-product market maker. The pool starts with L shares of each
+    outcome and keeps reserve_yes * reserve_no = L^2; collateral paid in
+    mints one share of each outcome into the pool.
+    """
+
+    name = "cpmm"
+    spread = float(os.getenv("PRICING_SPREAD", "0"))
+
+    def __init__(self, liquidity: float = float(os.getenv("CPMM_LIQUIDITY", "100"))):
+        self.liquidity = liquidity
+
+    def cost_function(self, yes_total, no_total):
+        # Collateral C solves (L + C - q_yes) * (L + C - q_no) = L^2
+        yes_total = np.asarray(yes_total, dtype=float)
+        no_total = np.asarray(no_total, dtype=float)
+        pool = (
+            yes_total
+            + no_total
+            + np.sqrt((yes_total - no_total) ** 2 + 4 * self.liquidity**2)
+        ) / 2
+        return pool - self.liquidity
+
+
+ENGINES = {
+    engine.name: engine for engine in (LegacyEngine, LMSREngine, ConstantProductEngine)
+}
+
+PRICING_ENGINE = os.getenv("PRICING_ENGINE", "legacy")
+if PRICING_ENGINE not in ENGINES:
+    raise ValueError(
+        f"Unknown PRICING_ENGINE {PRICING_ENGINE!r}; expected one of {sorted(ENGINES)}"
+    )
+
+engine: PricingEngine = ENGINES[PRICING_ENGINE]()
+
+
+def _rounded(prices):
+    prices = np.round(prices, 2)
+    return float(prices) if prices.ndim == 0 else prices
+
+
+def quote_event(db: Session, event_id: int, bet_type: str) -> Optional[Tuple]:
+    """Current (yes_price, no_price) of an event, or None if it does not exist."""
+    totals = counters.get_totals(db, event_id)
+    if totals is None:
+        return None
+    return engine.quote(*totals, bet_type)
+
+
+def execution_price(
+    db: Session,
+    event_id: int,
+    outcome: str,
+    bet_type: str,
+    shares: float,
+    requested_price: float,
+) -> float:
+    """
+    The price an order executes at: the engine's average price for its size
+    on the event's current totals, or the client's price under "legacy".
+    """
+    if not engine.prices_orders:
+        return requested_price
+    yes_total, no_total = counters.get_totals(db, event_id) or (0, 0)
+    return engine.order_price(yes_total, no_total, outcome, bet_type, shares)
@@ -0,0 +1,271 @@
+"""
+Check that the hot queries are served by indexes.
+
+Every query registered with `hot_query` is run through EXPLAIN (EXPLAIN
+QUERY PLAN on SQLite) and any full table scan is reported. By default the
+queries are planned against an empty in-memory SQLite database built from
+the models, so the check is deterministic and needs no data.
+
+Usage:
+    python -m app.query_audit            # exits 1 when a query scans a table
+    python -m app.query_audit --database-url postgresql://...
+"""
+
+import argparse
+import re
+import sys
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql import Select
+
+from .db_config import Base
+from .models import (
+    Event,
+    EventCounterShard,
+    IdempotencyKey,
+    Match,
+    Position,
+    Share,
+    Trade,
+    User,
+)
+from .pagination import after_cursor, encode_cursor
+
+HOT_QUERIES: Dict[str, Callable[[], Select]] = {}
+
+
+def hot_query(name: str):
+    """Register a function building a hot query under `name`."""
+
+    def register(build: Callable[[], Select]):
+        HOT_QUERIES[name] = build
+        return build
+
+    return register
+
+
+@hot_query("trading: user position in event")
+def _position_shares():
+    return select(Share).where(Share.user_id == "user", Share.event_id == 1)
+
+
+@hot_query("trading: open lots to close")
+def _open_lots():
+    return (
+        select(Share)
+        .where(
+            Share.user_id == "user",
+            Share.event_id == 1,
+            Share.bet_type == "buy",
+            Share.amount > 0,
+        )
+        .order_by(Share.id)
+    )
+
+
+@hot_query("settlement: open positions of event")
+def _event_positions():
+    return select(Position).where(Position.event_id == 1, Position.net_shares != 0)
+
+
+@hot_query("users: open positions of user")
+def _user_positions():
+    return select(func.count()).where(
+        Position.user_id == "user", Position.net_shares != 0
+    )
+
+
+@hot_query("portfolio: open positions of user with events")
+def _portfolio_positions():
+    return (
+        select(Position, Event.question)
+        .join(Event, Event.id == Position.event_id)
+        .where(Position.user_id == "user", Position.net_shares != 0)
+        .order_by(Position.event_id)
+    )
+
+
+@hot_query("settlement: shares of event")
+def _event_shares():
+    return select(Share).where(Share.event_id == 1)
+
+
+@hot_query("events/results: bet count per event")
+def _event_share_count():
+    return select(func.count(Share.id)).where(Share.event_id == 1)
+
+
+@hot_query("stop orders: resting limit orders")
+def _limit_orders():
+    return select(Share).where(Share.limit_price.isnot(None))
+
+
+@hot_query("listing: events open for betting")
+def _open_events():
+    return (
+        select(Event, Match)
+        .join(Match, Event.match_id == Match.id)
+        .where(Match.bet_end_time > func.now())
+    )
+
+
+@hot_query("ai bot: unresolved events open for betting")
+def _bot_events():
+    return (
+        select(Event, Match)
+        .join(Match, Event.match_id == Match.id)
+        .where(Match.bet_end_time > func.now(), Event.resolved == False)
+    )
+
+
+@hot_query("scheduler: unresolved events of finished matches")
+def _finished_events():
+    return (
+        select(Event)
+        .join(Match)
+        .where(Match.match_time <= func.now(), Event.resolved == False)
+    )
+
+
+@hot_query("ai bets: a user's shares with match info")
+def _bot_shares():
+    return (
+        select(Share)
+        .join(Event, Share.event_id == Event.id)
+        .join(Match, Event.match_id == Match.id)
+        .where(Share.user_id == "user")
+    )
+
+
+@hot_query("pricing: counter shards of events")
+def _counter_shards():
+    return (
+        select(
+            EventCounterShard.event_id,
+            func.sum(EventCounterShard.yes_delta),
+            func.sum(EventCounterShard.no_delta),
+        )
+        .where(EventCounterShard.event_id.in_([1, 2]))
+        .group_by(EventCounterShard.event_id)
+    )
+
+
+@hot_query("idempotency: expired keys to purge")
+def _expired_idempotency_keys():
+    return select(IdempotencyKey.endpoint, IdempotencyKey.key).where(
+        IdempotencyKey.created_at < "2026-01-01"
+    )
+
+
+@hot_query("users: registered emails of an import chunk")
+def _registered_import_emails():
+    return select(func.lower(User.email)).where(
+        func.lower(User.email).in_(["a@example.com", "b@example.com"])
+    )
+
+
+@hot_query("users: admin listing page after cursor")
+def _user_listing_page():
+    return (
+        select(User.id, User.email, User.created_at)
+        .where(
+            after_cursor(
+                User.created_at, User.id, encode_cursor(datetime(2026, 1, 1), "uid")
+            )
+        )
+        .order_by(User.created_at, User.id)
+        .limit(101)
+    )
+
+
+@hot_query("history: user trade page with match info")
+def _user_trades_page():
+    return (
+        select(Trade.id, Trade.created_at, Trade.shares, Match.team1, Match.league)
+        .join(Event, Event.id == Trade.event_id)
+        .join(Match, Match.id == Event.match_id)
+        .where(
+            Trade.user_id == "uid",
+            after_cursor(
+                Trade.created_at,
+                Trade.id,
+                encode_cursor(datetime(2026, 1, 1), 1),
+                descending=True,
+            ),
+        )
+        .order_by(Trade.created_at.desc(), Trade.id.desc())
+        .limit(51)
+    )
+
+
+# "SCAN shares" is a full table scan; "SCAN shares USING INDEX ..." walks an
+# index and "SEARCH ..." is an index lookup.
+SQLITE_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+POSTGRES_FULL_SCAN = re.compile(r"Seq Scan on (\w+)")
+
+
+def explain(engine: Engine, stmt: Select) -> List[str]:
+    """Return the plan lines for `stmt` on `engine`."""
+    sql = str(
+        stmt.compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+    )
+    prefix = "EXPLAIN QUERY PLAN " if engine.dialect.name == "sqlite" else "EXPLAIN "
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(prefix + sql).all()
+    return [row[-1] for row in rows]
+
+
+def full_scans(engine: Engine, plan: List[str]) -> List[str]:
+    """Return the tables `plan` reads with a full table scan."""
+    pattern = (
+        SQLITE_FULL_SCAN if engine.dialect.name == "sqlite" else POSTGRES_FULL_SCAN
+    )
+    return [match.group(1) for line in plan if (match := pattern.search(line.strip()))]
+
+
+def audit(engine: Engine = None) -> Dict[str, List[str]]:
+    """
+    Plan every registered hot query.
+
+    Args:
+        engine (Engine): Database to plan against. Defaults to an empty
+            in-memory SQLite database with the current schema.
+
+    Returns:
+        dict: The tables fully scanned by each query; empty lists pass.
+    """
+    if engine is None:
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+
+    return {
+        name: full_scans(engine, explain(engine, build()))
+        for name, build in HOT_QUERIES.items()
+    }
+
+
+def assert_no_full_scans(engine: Engine = None):
+    """Raise AssertionError naming every hot query that scans a table."""
+    failures = {name: tables for name, tables in audit(engine).items() if tables}
+    assert not failures, f"Hot queries with full table scans: {failures}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audit hot query plans.")
+    parser.add_argument("--database-url", help="Plan against this database instead")
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url) if args.database_url else None
+    results = audit(engine)
+    for name, tables in results.items():
+        status = f"FULL SCAN of {', '.join(tables)}" if tables else "ok"
+        print(f"{status:<30} {name}")
+
+    sys.exit(1 if any(results.values()) else 0)
+
+
+if __name__ == "__main__":
+    main()
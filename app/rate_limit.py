@@ -0,0 +1,291 @@
+"""
+Rate limiting and load shedding for the trading endpoints.
+
+`RateLimitMiddleware` is a plain ASGI middleware that gives every client a
+token bucket per rate-limited route, keyed both by user ID and by IP
+address (whose buckets are RATE_LIMIT_IP_FACTOR times larger). A request
+needs a token from each of its buckets; when one is empty it is answered
+with 429 and a Retry-After header, without reaching the app or the
+database.
+
+The user ID is read from the Firebase ID token in the Authorization header
+(its claims are decoded, not verified: this only picks the bucket, the
+endpoints still authenticate) or else from the "user_id" field of a JSON
+body. Buckets are two floats in a dict; idle buckets that have refilled
+completely are dropped whenever the dict reaches RATE_LIMIT_MAX_BUCKETS.
+
+Writes (any method but GET, HEAD and OPTIONS) are also capped at
+WRITE_CONCURRENCY_LIMIT in flight per worker. Beyond that they get 503 with
+Retry-After straight away instead of queueing for the database.
+
+Limits are "rate:burst" in requests per second, configurable with
+RATE_LIMITS="path=rate:burst,path=rate:burst" (merged over the defaults);
+RATE_LIMIT_ENABLED=false turns the middleware off.
+"""
+
+import base64
+import json
+import math
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000"))
+WRITE_CONCURRENCY_LIMIT = int(os.getenv("WRITE_CONCURRENCY_LIMIT", "64"))
+# An IP's buckets are this many times larger than a user's, since several
+# users can share an address behind NAT
+RATE_LIMIT_IP_FACTOR = float(os.getenv("RATE_LIMIT_IP_FACTOR", "10"))
+# Take the client IP from X-Forwarded-For (only behind a trusted proxy)
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"
+
+DEFAULT_RATE_LIMITS = {
+    "/api/market/buy-share": (5.0, 10.0),
+    "/api/market/sell-share": (5.0, 10.0),
+    "/api/market/orders/batch": (1.0, 2.0),
+    "/api/market/share-price": (20.0, 40.0),
+    "/modifyBalance": (2.0, 5.0),
+}
+
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# Largest body read to find the user ID; larger bodies are limited by IP only
+MAX_INSPECTED_BODY = 64 * 1024
+
+
+def parse_rate_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """
+    Parse "path=rate:burst,..." into {path: (rate, burst)}.
+
+    Raises:
+        ValueError: A rate or burst is not a positive number.
+    """
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        path, _, values = item.partition("=")
+        rate, _, burst = values.partition(":")
+        limits[path.strip()] = (float(rate), float(burst or rate))
+    check_rate_limits(limits)
+    return limits
+
+
+def check_rate_limits(limits: Dict[str, Tuple[float, float]]):
+    """
+    Check that every bucket refills and can hold a token.
+
+    Raises:
+        ValueError: A rate or burst is not a positive number (a zero rate
+            would never refill its bucket).
+    """
+    for path, (rate, burst) in limits.items():
+        if not (rate > 0 and burst > 0):
+            raise ValueError(
+                f"Rate limit for {path!r} must have a positive rate and burst, "
+                f"got {rate:g}:{burst:g}"
+            )
+
+
+RATE_LIMITS = {
+    **DEFAULT_RATE_LIMITS,
+    **parse_rate_limits(os.getenv("RATE_LIMITS", "")),
+}
+
+
+class TokenBuckets:
+    """
+    Token buckets stored as [tokens, last refill time] per key. Keys are
+    (path, kind, identity); the path's (rate, burst) is scaled by the kind's
+    factor.
+    """
+
+    def __init__(
+        self,
+        limits: Dict[str, Tuple[float, float]],
+        max_buckets: int = RATE_LIMIT_MAX_BUCKETS,
+    ):
+        check_rate_limits(limits)
+        if not RATE_LIMIT_IP_FACTOR > 0:
+            raise ValueError(
+                f"RATE_LIMIT_IP_FACTOR must be positive, got {RATE_LIMIT_IP_FACTOR:g}"
+            )
+        self.limits = limits
+        self.factors = {"user": 1.0, "ip": RATE_LIMIT_IP_FACTOR}
+        self.max_buckets = max_buckets
+        self._buckets: Dict[tuple, list] = {}
+
+    def _limit(self, key: tuple) -> Tuple[float, float]:
+        rate, burst = self.limits.get(key[0], (0.0, 0.0))
+        factor = self.factors[key[1]]
+        return rate * factor, burst * factor
+
+    def _tokens(self, key: tuple, now: float) -> list:
+        rate, burst = self._limit(key)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                self._evict(now)
+            bucket = self._buckets[key] = [burst, now]
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        return bucket
+
+    def _evict(self, now: float):
+        # A bucket that has refilled to its burst is the same as a new one
+        for key in list(self._buckets):
+            rate, burst = self._limit(key)
+            tokens, last = self._buckets[key]
+            if tokens + (now - last) * rate >= burst:
+                del self._buckets[key]
+
+    def take(self, keys) -> float:
+        """
+        Take one token from every bucket in `keys`, or none if any is empty.
+
+        Returns:
+            float: 0 if the tokens were taken, else seconds until they would be.
+        """
+        now = time.monotonic()
+        buckets = [self._tokens(key, now) for key in keys]
+        wait = max(
+            (1 - bucket[0]) / self._limit(key)[0] for key, bucket in zip(keys, buckets)
+        )
+        if wait > 0:
+            return wait
+        for bucket in buckets:
+            bucket[0] -= 1
+        return 0.0
+
+
+def token_user_id(authorization: str) -> Optional[str]:
+    """The uid claim of a bearer JWT, decoded without verifying it."""
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or token.count(".") != 2:
+        return None
+    payload = token.split(".")[1]
+    try:
+        claims = json.loads(
+            base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+        )
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(claims, dict):
+        return None
+    return claims.get("user_id") or claims.get("sub")
+
+
+def body_user_id(body: bytes) -> Optional[str]:
+    try:
+        data = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    user_id = data.get("user_id") if isinstance(data, dict) else None
+    return str(user_id) if user_id is not None else None
+
+
+def client_ip(scope, headers) -> str:
+    if TRUST_FORWARDED_FOR and b"x-forwarded-for" in headers:
+        return headers[b"x-forwarded-for"].decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+async def buffer_body(receive):
+    """
+    Read the request body so it can be inspected, and return it with a
+    `receive` that replays it to the app.
+
+    Returns:
+        tuple: (body, receive); body is None when it exceeds MAX_INSPECTED_BODY.
+    """
+    messages, size = [], 0
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            break
+        size += len(message.get("body", b""))
+        if not message.get("more_body") or size > MAX_INSPECTED_BODY:
+            break
+
+    body = None
+    if size <= MAX_INSPECTED_BODY and messages[-1]["type"] == "http.request":
+        body = b"".join(message.get("body", b"") for message in messages)
+
+    async def replay():
+        if messages:
+            return messages.pop(0)
+        return await receive()
+
+    return body, replay
+
+
+async def send_error(send, status: int, detail: str, retry_after: float):
+    body = json.dumps({"detail": detail}).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+class RateLimitMiddleware:
+    """Per-route token buckets by user and IP, plus a cap on writes in flight."""
+
+    def __init__(
+        self,
+        app,
+        limits: Dict[str, Tuple[float, float]] = None,
+        write_concurrency: int = WRITE_CONCURRENCY_LIMIT,
+        enabled: bool = RATE_LIMIT_ENABLED,
+    ):
+        self.app = app
+        self.limits = RATE_LIMITS if limits is None else limits
+        self.write_concurrency = write_concurrency
+        self.enabled = enabled
+        self.buckets = TokenBuckets(self.limits)
+        self.writes_in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        limit = self.limits.get(path)
+        if limit is not None:
+            headers = dict(scope["headers"])
+            user_id = token_user_id(
+                headers.get(b"authorization", b"").decode("latin-1")
+            )
+            if user_id is None and scope["method"] not in READ_METHODS:
+                body, receive = await buffer_body(receive)
+                user_id = body_user_id(body) if body is not None else None
+
+            keys = [(path, "ip", client_ip(scope, headers))]
+            if user_id is not None:
+                keys.append((path, "user", user_id))
+            retry_after = self.buckets.take(keys)
+            if retry_after:
+                await send_error(send, 429, "Too many requests.", retry_after)
+                return
+
+        if scope["method"] in READ_METHODS:
+            await self.app(scope, receive, send)
+            return
+
+        if self.writes_in_flight >= self.write_concurrency:
+            await send_error(send, 503, "Server is busy, try again shortly.", 1)
+            return
+        self.writes_in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.writes_in_flight -= 1
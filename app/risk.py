@@ -0,0 +1,251 @@
+"""
+Pre-trade risk limits on each user's exposure per event, per league and in
+total.
+
+A position's exposure is the most it can lose at settlement, in Sweeps
+Points: what was paid for buy lots, and 100 minus the price for sell lots.
+`RiskBook` keeps every user's exposure per event plus the running sums per
+league and in total. It is loaded from the positions table at startup and
+then follows every write to a `Position` row (trades, stop orders,
+settlement), applied once the transaction commits. Changes not committed yet
+are overlaid per session, so orders later in the same batch or group commit
+count the ones before them.
+
+`check` projects the order onto the user's position and compares the
+increase against the limits using only these dictionaries, so it adds no
+queries to the trade path (apart from one league lookup the first time an
+event created after startup is traded). Orders that reduce exposure are
+always allowed. A limit of 0 disables it; all are disabled by default.
+Only commits made by this process are seen, like app.counters and
+app.depth.
+"""
+
+import logging
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+
+from .db_config import after_commit
+from .models import Event, Match, Position
+
+RISK_MAX_EVENT_EXPOSURE = float(os.getenv("RISK_MAX_EVENT_EXPOSURE", "0"))
+RISK_MAX_LEAGUE_EXPOSURE = float(os.getenv("RISK_MAX_LEAGUE_EXPOSURE", "0"))
+RISK_MAX_TOTAL_EXPOSURE = float(os.getenv("RISK_MAX_TOTAL_EXPOSURE", "0"))
+
+# Uncommitted exposures of this session: {user_id: {event_id: [(league, exposure)]}}
+PENDING_KEY = "pending_exposures"
+
+
+def exposure(net_shares: float, avg_cost: float) -> float:
+    """Most a position can lose at settlement, in Sweeps Points."""
+    if net_shares > 0:
+        return net_shares * avg_cost / 100
+    if net_shares < 0:
+        return -net_shares * (100 - avg_cost) / 100
+    return 0.0
+
+
+def projected_exposure(
+    position: Optional[Position], bet_type: str, shares: float, price: float
+) -> float:
+    """The position's exposure after an order of `bet_type` at `price`."""
+    held = position.net_shares if position is not None else 0
+    avg_cost = position.avg_cost if position is not None else 0
+    net = held + (shares if bet_type == "buy" else -shares)
+
+    if not net:
+        return 0.0
+    if not held or (held > 0) == (bet_type == "buy"):
+        # Opening or adding: same average cost as `positions.apply_trade`
+        return exposure(net, (abs(held) * avg_cost + shares * price) / abs(net))
+    if not net or (net > 0) == (held > 0):
+        # Partly or fully closed; the lots left are not loaded, so keep the
+        # current average (the exposure can only fall)
+        return exposure(net, avg_cost)
+    # Closed and reversed: only the new lot is open
+    return exposure(net, price)
+
+
+class RiskBook:
+    """Thread-safe exposure aggregates per user, event and league."""
+
+    def __init__(self):
+        self._events: Dict[Tuple[str, int], float] = {}
+        self._leagues: Dict[Tuple[str, str], float] = defaultdict(float)
+        self._totals: Dict[str, float] = defaultdict(float)
+        self._league_of: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def rebuild(self, db: Session):
+        """Load every event's league and every open position's exposure."""
+        leagues = dict(
+            db.execute(
+                select(Event.id, Match.league).join(Match, Event.match_id == Match.id)
+            ).all()
+        )
+        rows = db.execute(
+            select(
+                Position.user_id,
+                Position.event_id,
+                Position.net_shares,
+                Position.avg_cost,
+            ).where(Position.net_shares != 0)
+        ).all()
+
+        with self._lock:
+            self._league_of = leagues
+            self._events.clear()
+            self._leagues.clear()
+            self._totals.clear()
+        for user_id, event_id, net_shares, avg_cost in rows:
+            self.set(
+                user_id, event_id, leagues.get(event_id), exposure(net_shares, avg_cost)
+            )
+        logging.info(f"Risk book loaded: {len(rows)} open positions")
+
+    def league(self, db, event_id: int) -> Optional[str]:
+        """An event's league; `db` (a Session or Connection) is only used on a miss."""
+        if event_id not in self._league_of:
+            self._league_of[event_id] = db.execute(
+                select(Match.league)
+                .join(Event, Event.match_id == Match.id)
+                .where(Event.id == event_id)
+            ).scalar()
+        return self._league_of[event_id]
+
+    def set(self, user_id: str, event_id: int, league: Optional[str], value: float):
+        """Record the committed exposure of a user's position in an event."""
+        with self._lock:
+            delta = value - self._events.get((user_id, event_id), 0.0)
+            if value:
+                self._events[(user_id, event_id)] = value
+            else:
+                self._events.pop((user_id, event_id), None)
+            self._leagues[(user_id, league)] += delta
+            self._totals[user_id] += delta
+
+    def exposures(
+        self, db: Session, user_id: str, event_id: int, league: Optional[str]
+    ):
+        """
+        The user's exposure in an event, its league and in total, including
+        the session's uncommitted changes.
+
+        Returns:
+            tuple: (event, league, total) exposures in Sweeps Points.
+        """
+        event_value = self._events.get((user_id, event_id), 0.0)
+        league_value = self._leagues.get((user_id, league), 0.0)
+        total_value = self._totals.get(user_id, 0.0)
+
+        for pending_event, stack in (
+            db.info.get(PENDING_KEY, {}).get(user_id, {}).items()
+        ):
+            pending_league, value = stack[-1]
+            delta = value - self._events.get((user_id, pending_event), 0.0)
+            total_value += delta
+            if pending_league == league:
+                league_value += delta
+            if pending_event == event_id:
+                event_value = value
+        return event_value, league_value, total_value
+
+
+risk_book = RiskBook()
+
+
+def check(
+    db: Session,
+    user_id: str,
+    event_id: int,
+    position: Optional[Position],
+    bet_type: str,
+    shares: float,
+    price: float,
+) -> Optional[str]:
+    """
+    Check an order against the exposure limits.
+
+    Returns:
+        str: Why the order is rejected, or None if it is within the limits.
+    """
+    if not (
+        RISK_MAX_EVENT_EXPOSURE or RISK_MAX_LEAGUE_EXPOSURE or RISK_MAX_TOTAL_EXPOSURE
+    ):
+        return None
+
+    current = exposure(position.net_shares, position.avg_cost) if position else 0.0
+    increase = projected_exposure(position, bet_type, shares, price) - current
+    if increase <= 0:
+        return None
+
+    league = risk_book.league(db, event_id)
+    event_value, league_value, total_value = risk_book.exposures(
+        db, user_id, event_id, league
+    )
+    for name, value, limit in (
+        ("event", event_value, RISK_MAX_EVENT_EXPOSURE),
+        ("league", league_value, RISK_MAX_LEAGUE_EXPOSURE),
+        ("total", total_value, RISK_MAX_TOTAL_EXPOSURE),
+    ):
+        if limit and value + increase > limit:
+            return (
+                f"Order exceeds the {name} exposure limit of {limit:g} Sweeps Points "
+                f"(current exposure {value:.2f}, order adds {increase:.2f})."
+            )
+    return None
+
+
+class ExposureChange:
+    """After-commit callback recording a position's new exposure."""
+
+    def __init__(self, session: Session, user_id: str, event_id: int, league, value):
+        self.session = session
+        self.key = (user_id, event_id)
+        self.league = league
+        self.value = value
+        stack = (
+            session.info.setdefault(PENDING_KEY, {})
+            .setdefault(user_id, {})
+            .setdefault(event_id, [])
+        )
+        stack.append((league, value))
+
+    def __call__(self):
+        risk_book.set(*self.key, self.league, self.value)
+
+    def discard(self):
+        user_id, event_id = self.key
+        pending = self.session.info.get(PENDING_KEY, {}).get(user_id, {})
+        stack = pending.get(event_id)
+        if stack:
+            stack.pop()
+            if not stack:
+                del pending[event_id]
+
+
+@event.listens_for(Position, "after_insert")
+@event.listens_for(Position, "after_update")
+def _position_written(mapper, connection, position):
+    session = object_session(position)
+    league = risk_book.league(connection, position.event_id)
+    after_commit(
+        session,
+        ExposureChange(
+            session,
+            position.user_id,
+            position.event_id,
+            league,
+            exposure(position.net_shares, position.avg_cost),
+        ),
+    )
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _drop_pending_exposures(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(PENDING_KEY, None)
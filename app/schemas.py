@@ -151,6 +151,14 @@ class SellShareRequest(BaseModel):
     limit_price: Optional[float] = None  # Limit price (optional)
 
 
+class BatchOrder(BuyShareRequest):
+    action: str = "buy"  # "buy" as in /api/market/buy-share, "sell" as in sell-share
+
+
+class BatchOrderRequest(BaseModel):
+    orders: List[BatchOrder]
+
+
 class UserProfile(BaseModel):
     id: str
     email: str
@@ -168,6 +176,10 @@ class UserProfile(BaseModel):
     betting_points: float
     ban: bool
     created_at: str  # ISO format string for created_at
+    bets_placed: int = 0  # Orders executed
+    volume: float = 0.0  # Sweeps Points traded
+    realized_pnl: float = 0.0  # Sweeps Points realised by closing and settlement
+    last_trade_at: Optional[str] = None  # ISO format string, None before any trade
 
     @root_validator(pre=True)
     def format_datetime(cls, values):
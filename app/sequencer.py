@@ -0,0 +1,71 @@
+"""
+Per-event single-writer trade sequencing.
+
+Every trade is routed by its event id to one of TRADE_SEQUENCER_WORKERS
+actors. An actor is a `GroupCommitter` with its own queue, worker task and
+connection, and it runs its queue in arrival order, one batch at a time. So
+trades on the same event are strictly ordered by the application instead of
+racing for row locks, while events owned by different actors proceed in
+parallel.
+
+SQLite allows a single writer, and concurrent write transactions on it fail
+with "database is locked" rather than wait, so it always gets one actor.
+"""
+
+import asyncio
+import os
+from typing import Awaitable, List
+
+from sqlalchemy.engine import make_url
+
+from .db_config import DATABASE_URL
+from .group_commit import GroupCommitter, Work
+
+if make_url(DATABASE_URL).get_backend_name() == "sqlite":
+    TRADE_SEQUENCER_WORKERS = 1
+else:
+    TRADE_SEQUENCER_WORKERS = int(os.getenv("TRADE_SEQUENCER_WORKERS", "4"))
+
+
+class TradeSequencer:
+    """Routes work on an event to the single actor that owns the event."""
+
+    def __init__(self, workers: int = TRADE_SEQUENCER_WORKERS):
+        self.actors: List[GroupCommitter] = [
+            GroupCommitter(name=f"events-{index}") for index in range(max(1, workers))
+        ]
+        self.loop = None
+
+    def start(self):
+        """Attach to the running event loop, so other threads can submit work."""
+        self.loop = asyncio.get_running_loop()
+
+    def actor_for(self, event_id: int) -> GroupCommitter:
+        return self.actors[event_id % len(self.actors)]
+
+    async def submit(self, event_id: int, work: Work):
+        """
+        Queue `work(session)` behind earlier work on the same event and wait
+        until it is committed. See `GroupCommitter.submit`.
+        """
+        return await self.actor_for(event_id).submit(work)
+
+    def run_threadsafe(self, coroutine: Awaitable):
+        """
+        Run a coroutine that submits work on the sequencer's event loop, from
+        another thread (scheduler jobs), and wait for its result.
+
+        Raises:
+            RuntimeError: `start` has not been called.
+        """
+        if self.loop is None:
+            coroutine.close()
+            raise RuntimeError("The trade sequencer has not been started.")
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def submit_threadsafe(self, event_id: int, work: Work):
+        """`submit` from another thread: run `work` on the event's actor and wait."""
+        return self.run_threadsafe(self.submit(event_id, work))
+
+
+trade_sequencer = TradeSequencer()
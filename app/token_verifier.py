@@ -0,0 +1,193 @@
+"""
+Firebase ID-token verification without a network call per request.
+
+`firebase_admin.auth.verify_id_token` checks the RS256 signature against
+Google's public certificates on every call, inside whatever thread calls
+it. `TokenVerifier` does the same checks with PyJWT, but:
+
+- the certificates are fetched once and reused until the max-age of their
+  Cache-Control header runs out (or a token names a key id not seen yet);
+- a token that verified is remembered, by its SHA-256, until its own `exp`,
+  so repeat requests with the same token cost one hash and a dict lookup;
+- the signature checks that remain run on a small thread pool, so async
+  handlers never block the event loop on RSA.
+
+The decoded claims have "uid" set like firebase_admin's. Revocation is not
+checked, as with verify_id_token's default.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+import jwt
+import requests
+from cryptography.x509 import load_pem_x509_certificate
+
+FIREBASE_CERTS_URL = (
+    "https://www.googleapis.com/robot/v1/metadata/x509/"
+    "securetoken@system.gserviceaccount.com"
+)
+FIREBASE_CREDENTIALS = os.getenv("FIREBASE_CREDENTIALS", "firebase.json")
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "100000"))
+TOKEN_VERIFY_WORKERS = int(os.getenv("TOKEN_VERIFY_WORKERS", "4"))
+CERTS_FETCH_TIMEOUT = float(os.getenv("FIREBASE_CERTS_TIMEOUT_SECONDS", "5"))
+# Shortest wait between refetches triggered by unknown key ids
+CERTS_MIN_REFRESH = 60
+# Tolerated clock difference with Google's servers, in seconds
+CLOCK_SKEW = 10
+
+
+class TokenVerificationError(ValueError):
+    """Raised when an ID token is malformed, forged or for another project."""
+
+
+class TokenExpiredError(TokenVerificationError):
+    """Raised when an ID token is past its expiry time."""
+
+
+def firebase_project_id() -> str:
+    """The project tokens must be for: FIREBASE_PROJECT_ID or the credentials'."""
+    project_id = os.getenv("FIREBASE_PROJECT_ID")
+    if project_id:
+        return project_id
+    with open(FIREBASE_CREDENTIALS) as credentials:
+        return json.load(credentials)["project_id"]
+
+
+class PublicKeyCache:
+    """Google's token-signing keys by key id, cached for their HTTP max-age."""
+
+    def __init__(self, url: str = FIREBASE_CERTS_URL):
+        self.url = url
+        self._keys: Dict[str, object] = {}
+        self._expires = 0.0
+        self._fetched = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, kid: str):
+        """The public key for `kid`, refreshing the certificates if needed."""
+        if self._stale(kid):
+            with self._lock:
+                # Another thread may have refreshed while we waited
+                if self._stale(kid):
+                    self._refresh()
+        key = self._keys.get(kid)
+        if key is None:
+            raise TokenVerificationError(f"Unknown signing key id {kid!r}.")
+        return key
+
+    def _stale(self, kid: str) -> bool:
+        now = time.monotonic()
+        return now >= self._expires or (
+            kid not in self._keys and now - self._fetched >= CERTS_MIN_REFRESH
+        )
+
+    def _refresh(self):
+        response = requests.get(self.url, timeout=CERTS_FETCH_TIMEOUT)
+        response.raise_for_status()
+        match = re.search(r"max-age=(\d+)", response.headers.get("Cache-Control", ""))
+        self._keys = {
+            kid: load_pem_x509_certificate(pem.encode()).public_key()
+            for kid, pem in response.json().items()
+        }
+        self._fetched = time.monotonic()
+        self._expires = self._fetched + (int(match.group(1)) if match else 0)
+
+
+class TokenVerifier:
+    """Verifies Firebase ID tokens, caching keys and verified tokens."""
+
+    def __init__(
+        self,
+        project_id: Optional[str] = None,
+        keys: Optional[PublicKeyCache] = None,
+        cache_size: int = TOKEN_CACHE_SIZE,
+        workers: int = TOKEN_VERIFY_WORKERS,
+    ):
+        self._project_id = project_id
+        self.keys = keys or PublicKeyCache()
+        self.cache_size = cache_size
+        self._verified: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="token-verify"
+        )
+
+    @property
+    def project_id(self) -> str:
+        if self._project_id is None:
+            self._project_id = firebase_project_id()
+        return self._project_id
+
+    def cached(self, token: str) -> Optional[dict]:
+        """The claims of a token verified before and not expired yet."""
+        digest = hashlib.sha256(token.encode()).digest()
+        with self._lock:
+            entry = self._verified.get(digest)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                del self._verified[digest]
+                return None
+            self._verified.move_to_end(digest)
+            return entry[1]
+
+    def verify(self, token: str) -> dict:
+        """
+        Verify an ID token's signature and claims.
+
+        Returns:
+            dict: The token's claims, with "uid" set to its subject.
+
+        Raises:
+            TokenExpiredError: The token has expired.
+            TokenVerificationError: The token is invalid for any other reason.
+        """
+        claims = self.cached(token)
+        if claims is not None:
+            return claims
+
+        try:
+            header = jwt.get_unverified_header(token)
+            claims = jwt.decode(
+                token,
+                self.keys.get(header.get("kid")),
+                algorithms=["RS256"],
+                audience=self.project_id,
+                issuer=f"https://securetoken.google.com/{self.project_id}",
+                leeway=CLOCK_SKEW,
+                options={"require": ["exp", "iat", "sub"]},
+            )
+        except jwt.ExpiredSignatureError as e:
+            raise TokenExpiredError(str(e)) from e
+        except jwt.PyJWTError as e:
+            raise TokenVerificationError(str(e)) from e
+        if not claims["sub"] or claims.get("auth_time", 0) > time.time() + CLOCK_SKEW:
+            raise TokenVerificationError("Invalid subject or auth_time claim.")
+        claims["uid"] = claims["sub"]
+
+        digest = hashlib.sha256(token.encode()).digest()
+        with self._lock:
+            self._verified[digest] = (claims["exp"], claims)
+            while len(self._verified) > self.cache_size:
+                self._verified.popitem(last=False)
+        return claims
+
+    async def verify_async(self, token: str) -> dict:
+        """`verify` for async handlers: cache hits inline, the rest on the pool."""
+        claims = self.cached(token)
+        if claims is not None:
+            return claims
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.verify, token)
+
+
+token_verifier = TokenVerifier()
@@ -0,0 +1,141 @@
+"""
+Every user's executed orders, newest first.
+
+`record` appends a `Trade` row in the same transaction as each executed
+order; rows are never updated or deleted. A page of a user's history is one
+query: a range scan of ix_trades_user_history, which holds every trade
+column returned, so the trades table itself is not read, joined by primary
+key to the event and match of each row on the page. Pages are keyed on
+(created_at, id) like the user listing (see app.pagination).
+"""
+
+import os
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .ledger import from_minor
+from .models import Event, Match, Trade
+from .pagination import after_cursor, encode_cursor
+
+TRADE_PAGE_SIZE = int(os.getenv("TRADE_PAGE_SIZE", "50"))
+TRADE_PAGE_MAX_SIZE = int(os.getenv("TRADE_PAGE_MAX_SIZE", "500"))
+
+
+def record(
+    db: Session,
+    user_id: str,
+    event_id: int,
+    outcome: str,
+    bet_type: str,
+    shares: float,
+    price: float,
+    realized_minor: int = 0,
+    source: str = "trade",
+):
+    """Append an executed order to the history; nothing is committed."""
+    db.add(
+        Trade(
+            user_id=user_id,
+            event_id=event_id,
+            outcome=outcome,
+            bet_type=bet_type,
+            shares=shares,
+            price=price,
+            realized_pnl_minor=realized_minor,
+            source=source,
+        )
+    )
+
+
+def history_query(
+    user_id: str,
+    event_id: Optional[int] = None,
+    league: Optional[str] = None,
+    outcome: Optional[str] = None,
+):
+    """A user's filtered history with match info, newest first."""
+    stmt = (
+        select(
+            Trade.id,
+            Trade.created_at,
+            Trade.event_id,
+            Trade.outcome,
+            Trade.bet_type,
+            Trade.shares,
+            Trade.price,
+            Trade.realized_pnl_minor,
+            Match.team1,
+            Match.team2,
+            Match.league,
+            Match.match_time,
+        )
+        .join(Event, Event.id == Trade.event_id)
+        .join(Match, Match.id == Event.match_id)
+        .where(Trade.user_id == user_id)
+        .order_by(Trade.created_at.desc(), Trade.id.desc())
+    )
+    if event_id is not None:
+        stmt = stmt.where(Trade.event_id == event_id)
+    if league:
+        stmt = stmt.where(Match.league == league)
+    if outcome:
+        stmt = stmt.where(Trade.outcome == outcome)
+    return stmt
+
+
+def as_row(row) -> dict:
+    return {
+        "id": row.id,
+        "time": row.created_at.isoformat(),
+        "event_id": row.event_id,
+        "team1": row.team1,
+        "team2": row.team2,
+        "league": row.league,
+        "match_time": row.match_time.isoformat() if row.match_time else None,
+        "outcome": row.outcome,
+        "bet_type": row.bet_type,
+        "shares": row.shares,
+        "price": row.price,
+        "realized_pnl": from_minor(row.realized_pnl_minor),
+    }
+
+
+def page(
+    db: Session,
+    user_id: str,
+    cursor: Optional[str] = None,
+    limit: int = TRADE_PAGE_SIZE,
+    **filters,
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    One page of a user's trade history.
+
+    Args:
+        db (Session): The database session.
+        user_id (str): Whose trades.
+        cursor (str): The previous page's next cursor; None for the newest page.
+        limit (int): Page size, capped at TRADE_PAGE_MAX_SIZE.
+        **filters: event_id, league and outcome, see `history_query`.
+
+    Returns:
+        tuple: (rows, next cursor); the cursor is None on the last page.
+
+    Raises:
+        ValueError: The cursor is invalid.
+    """
+    limit = max(1, min(limit, TRADE_PAGE_MAX_SIZE))
+    stmt = history_query(user_id, **filters)
+    if cursor:
+        stmt = stmt.where(
+            after_cursor(Trade.created_at, Trade.id, cursor, descending=True)
+        )
+
+    # One row more than the page tells whether there is a next page
+    rows = db.execute(stmt.limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return [as_row(row) for row in rows], next_cursor
@@ -0,0 +1,488 @@
+from sqlalchemy.orm import Session
+from fastapi import HTTPException
+import asyncio
+import os
+from typing import Dict, List, Optional, Tuple, Union
+from . import counters, ledger, positions, pricing, risk, trade_history, user_stats
+from .db_config import savepoint
+from .ledger import InsufficientBalanceError, to_minor
+from .models import Event, Position, Share, User
+from .schemas import BuyShareRequest, SellShareRequest
+from .sequencer import trade_sequencer
+
+
+# Most orders accepted by one /api/market/orders/batch request
+MAX_BATCH_ORDERS = int(os.getenv("MAX_BATCH_ORDERS", "500"))
+
+# Default for the `position` argument: load it (None means there is none)
+NOT_LOADED = object()
+
+
+def execute_buy(
+    request: BuyShareRequest,
+    db: Session,
+    user: Optional[User] = None,
+    event: Optional[Event] = None,
+    position=NOT_LOADED,
+    source: str = "trade",
+):
+    """
+    Apply a buy order to the session without committing it.
+
+    Batch callers pass the user, event and the user's position on the event
+    they already loaded (None for no position) so the order costs no extra
+    queries unless it closes lots. `source` is recorded in the trade
+    history ("trade", or "stop_order" for filled stop orders).
+
+    Returns:
+        float: The profit or loss realised by closing opposing shares.
+    """
+    if user is None:
+        user = db.query(User).filter(User.id == request.user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    if request.bet_type not in ["buy", "sell"]:
+        raise HTTPException(
+            status_code=400, detail="Invalid bet type. Must be 'buy' or 'sell'."
+        )
+    if request.outcome not in ["yes", "no"]:
+        raise HTTPException(
+            status_code=400, detail="Invalid outcome. Must be 'yes' or 'no'."
+        )
+    if request.shareCount <= 0:
+        raise HTTPException(status_code=400, detail="Share count must be positive.")
+
+    if event is None:
+        event = db.query(Event).filter(Event.id == request.event_id).first()
+    if not event:
+        raise HTTPException(status_code=404, detail="Event not found")
+
+    # The pricing engine may set the execution price from the order's size
+    share_price = pricing.execution_price(
+        db,
+        request.event_id,
+        request.outcome,
+        request.bet_type,
+        request.shareCount,
+        request.share_price,
+    )
+
+    if position is NOT_LOADED:
+        position = positions.get_position(db, user.id, request.event_id)
+
+    if (
+        position is not None
+        and position.net_shares
+        and position.outcome != request.outcome
+    ):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Conflicting outcome detected. Existing position is {position.outcome}.",
+        )
+
+    risk_error = risk.check(
+        db,
+        user.id,
+        request.event_id,
+        position,
+        request.bet_type,
+        request.shareCount,
+        share_price,
+    )
+    if risk_error:
+        raise HTTPException(status_code=400, detail=risk_error)
+
+    # Only an order against the position's direction needs its lots
+    opposing_shares = (
+        positions.open_lots(
+            db,
+            user.id,
+            request.event_id,
+            "sell" if request.bet_type == "buy" else "buy",
+        )
+        if positions.is_closing(position, request.bet_type)
+        else []
+    )
+    remaining_shares = request.shareCount
+    total_profit_or_loss = 0
+    lots_left = []
+
+    for index, share in enumerate(opposing_shares):
+        if share.amount >= remaining_shares:
+            trade_amount = remaining_shares
+            total_profit_or_loss += trade_amount * (
+                share_price / 100 - share.share_price / 100
+            )
+            share.amount -= remaining_shares
+            remaining_shares = 0
+            db.add(share)
+            lots_left = opposing_shares[index:]
+            break
+        else:
+            trade_amount = share.amount
+            total_profit_or_loss += trade_amount * (
+                share_price / 100 - share.share_price / 100
+            )
+            remaining_shares -= trade_amount
+            db.delete(share)
+
+    reference = f"event:{request.event_id}"
+    if total_profit_or_loss:
+        ledger.credit(db, user.id, to_minor(total_profit_or_loss), "trade", reference)
+
+    if remaining_shares > 0:
+        total_cost = (share_price / 100) * remaining_shares
+        try:
+            ledger.debit(db, user.id, to_minor(total_cost), "trade", reference)
+        except InsufficientBalanceError:
+            raise HTTPException(
+                status_code=400, detail="Insufficient balance for the trade."
+            )
+
+        new_share = Share(
+            user_id=user.id,
+            event_id=request.event_id,
+            amount=remaining_shares,
+            bet_type=request.bet_type,
+            outcome=request.outcome,
+            share_price=share_price,
+            limit_price=request.limit_price,
+        )
+        db.add(new_share)
+
+    positions.apply_trade(
+        db,
+        position,
+        user.id,
+        request.event_id,
+        request.outcome,
+        request.bet_type,
+        request.shareCount,
+        share_price,
+        to_minor(total_profit_or_loss),
+        lots_left,
+    )
+    trade_history.record(
+        db,
+        user.id,
+        request.event_id,
+        request.outcome,
+        request.bet_type,
+        request.shareCount,
+        share_price,
+        to_minor(total_profit_or_loss),
+        source=source,
+    )
+    user_stats.record_trade(
+        db,
+        user.id,
+        request.shareCount,
+        share_price,
+        to_minor(total_profit_or_loss),
+    )
+
+    change = request.shareCount if request.bet_type == "buy" else -request.shareCount
+    if request.outcome == "yes":
+        counters.add_bets(db, event.id, yes=change)
+    else:
+        counters.add_bets(db, event.id, no=change)
+
+    return total_profit_or_loss
+
+
+def validate_order(order: Union[BuyShareRequest, SellShareRequest]) -> Optional[str]:
+    """
+    Check an order's fields without touching the database.
+
+    Returns:
+        str: Why the order would be rejected, or None if it is well formed.
+    """
+    if isinstance(order, SellShareRequest):
+        if order.bet_type != "sell":
+            return "Invalid bet type for selling. Must be 'sell'."
+    elif order.bet_type not in ["buy", "sell"]:
+        return "Invalid bet type. Must be 'buy' or 'sell'."
+    if order.outcome not in ["yes", "no"]:
+        return "Invalid outcome. Must be 'yes' or 'no'."
+    if order.shareCount <= 0:
+        return "Share count must be positive."
+    return None
+
+
+def execute_orders(orders: List[Union[BuyShareRequest, SellShareRequest]], db: Session):
+    """
+    Apply several orders to the session without committing it.
+
+    BuyShareRequest orders run through `execute_buy` and SellShareRequest
+    orders through `execute_sell`. Users, events and positions for every
+    order are loaded with one query each up front. Each order runs inside
+    its own savepoint so a rejected order (insufficient balance,
+    conflicting outcome, ...) does not undo the others.
+
+    Args:
+        orders (list): The orders to execute, in order.
+        db (Session): The database session; nothing is committed.
+
+    Returns:
+        list: One result dict per order, in the same order as `orders`.
+    """
+    user_ids = {order.user_id for order in orders}
+    event_ids = {order.event_id for order in orders}
+
+    users: Dict[str, User] = {
+        user.id: user for user in db.query(User).filter(User.id.in_(user_ids)).all()
+    }
+    events: Dict[int, Event] = {
+        event.id: event
+        for event in db.query(Event).filter(Event.id.in_(event_ids)).all()
+    }
+    positions_by_key: Dict[Tuple[str, int], Optional[Position]] = {
+        (order.user_id, order.event_id): None for order in orders
+    }
+    for position in (
+        db.query(Position)
+        .filter(Position.user_id.in_(user_ids), Position.event_id.in_(event_ids))
+        .all()
+    ):
+        key = (position.user_id, position.event_id)
+        if key in positions_by_key:
+            positions_by_key[key] = position
+
+    results = []
+    for order in orders:
+        key = (order.user_id, order.event_id)
+        try:
+            execute = (
+                execute_sell if isinstance(order, SellShareRequest) else execute_buy
+            )
+            with savepoint(db):
+                profit_or_loss = execute(
+                    order,
+                    db,
+                    user=users.get(order.user_id),
+                    event=events.get(order.event_id),
+                    position=positions_by_key[key],
+                )
+            results.append(
+                {
+                    "event_id": order.event_id,
+                    "status": "executed",
+                    "profit_or_loss": round(profit_or_loss, 2),
+                }
+            )
+        except HTTPException as e:
+            results.append(
+                {"event_id": order.event_id, "status": "rejected", "detail": e.detail}
+            )
+        # Pick up a position the order opened, or drop one a rejected order
+        # rolled back; existing positions come from the identity map.
+        positions_by_key[key] = positions.get_position(db, *key)
+
+    return results
+
+
+async def submit_orders(orders: List[Union[BuyShareRequest, SellShareRequest]]):
+    """
+    Execute several orders through the trade sequencer.
+
+    The orders are grouped by event and each group runs as one piece of work
+    on the actor that owns the event (see app.sequencer), so they are ordered
+    with every other trade on the event and committed in its group commit.
+    Orders on the same event keep their relative order.
+
+    Returns:
+        list: One result dict per order (see `execute_orders`), in the same
+            order as `orders`.
+    """
+    groups: Dict[int, List[int]] = {}
+    for index, order in enumerate(orders):
+        groups.setdefault(order.event_id, []).append(index)
+
+    group_results = await asyncio.gather(
+        *(
+            trade_sequencer.submit(
+                event_id,
+                lambda session, group=[orders[i] for i in indexes]: execute_orders(
+                    group, session
+                ),
+            )
+            for event_id, indexes in groups.items()
+        )
+    )
+    results = [None] * len(orders)
+    for indexes, group in zip(groups.values(), group_results):
+        for index, result in zip(indexes, group):
+            results[index] = result
+    return results
+
+
+def execute_sell(
+    request: SellShareRequest,
+    db: Session,
+    user: Optional[User] = None,
+    event: Optional[Event] = None,
+    position=NOT_LOADED,
+    source: str = "trade",
+):
+    """
+    Apply a sell order to the session without committing it.
+
+    Takes the same optional preloaded rows and `source` as `execute_buy`.
+
+    Returns:
+        float: The profit or loss realised by closing existing buy shares.
+    """
+    # Fetch user
+    if user is None:
+        user = db.query(User).filter(User.id == request.user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # Validate bet_type and outcome
+    if request.bet_type != "sell":
+        raise HTTPException(
+            status_code=400, detail="Invalid bet type for selling. Must be 'sell'."
+        )
+    if request.outcome not in ["yes", "no"]:
+        raise HTTPException(
+            status_code=400, detail="Invalid outcome. Must be 'yes' or 'no'."
+        )
+    if request.shareCount <= 0:
+        raise HTTPException(status_code=400, detail="Share count must be positive.")
+
+    # Fetch event
+    if event is None:
+        event = db.query(Event).filter(Event.id == request.event_id).first()
+    if not event:
+        raise HTTPException(status_code=404, detail="Event not found")
+
+    # The pricing engine may set the execution price from the order's size
+    share_price = pricing.execution_price(
+        db,
+        request.event_id,
+        request.outcome,
+        "sell",
+        request.shareCount,
+        request.share_price,
+    )
+
+    # Fetch the user's position in the event
+    if position is NOT_LOADED:
+        position = positions.get_position(db, user.id, request.event_id)
+
+    # Check for conflicting outcomes
+    if (
+        position is not None
+        and position.net_shares
+        and position.outcome != request.outcome
+    ):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Conflicting outcome detected. Existing position is {position.outcome}.",
+        )
+
+    # Check the exposure limits
+    risk_error = risk.check(
+        db, user.id, request.event_id, position, "sell", request.shareCount, share_price
+    )
+    if risk_error:
+        raise HTTPException(status_code=400, detail=risk_error)
+
+    # Resolve opposing positions (e.g., buy existing sell positions)
+    opposing_shares = (
+        positions.open_lots(db, user.id, request.event_id, "buy")
+        if positions.is_closing(position, "sell")
+        else []
+    )
+    remaining_shares = request.shareCount
+    total_profit_or_loss = 0  # Track profit/loss for opposing trades
+    lots_left = []
+
+    for index, share in enumerate(opposing_shares):
+        if share.amount >= remaining_shares:
+            # Close partially or fully opposing position
+            trade_amount = remaining_shares
+            total_profit_or_loss += trade_amount * (
+                share.share_price / 100 - share_price / 100
+            )
+            share.amount -= remaining_shares
+            remaining_shares = 0
+            db.add(share)
+            lots_left = opposing_shares[index:]
+            break
+        else:
+            # Fully close the opposing position
+            trade_amount = share.amount
+            total_profit_or_loss += trade_amount * (
+                share.share_price / 100 - share_price / 100
+            )
+            remaining_shares -= trade_amount
+            db.delete(share)
+
+    # Update user's balance based on profit/loss from opposing trades
+    reference = f"event:{request.event_id}"
+    if total_profit_or_loss:
+        ledger.credit(db, user.id, to_minor(total_profit_or_loss), "trade", reference)
+
+    # Handle remaining shares (opening or updating position)
+    if remaining_shares > 0:
+        # Deduct cost for new sell position
+        total_cost = (share_price / 100) * remaining_shares
+        try:
+            ledger.debit(db, user.id, to_minor(total_cost), "trade", reference)
+        except InsufficientBalanceError:
+            raise HTTPException(
+                status_code=400, detail="Insufficient balance for the trade."
+            )
+
+        # Create a new sell position
+        new_share = Share(
+            user_id=user.id,
+            event_id=request.event_id,
+            amount=remaining_shares,
+            bet_type="sell",
+            outcome=request.outcome,
+            share_price=share_price,
+            limit_price=request.limit_price,
+        )
+        db.add(new_share)
+
+    positions.apply_trade(
+        db,
+        position,
+        user.id,
+        request.event_id,
+        request.outcome,
+        "sell",
+        request.shareCount,
+        share_price,
+        to_minor(total_profit_or_loss),
+        lots_left,
+    )
+    trade_history.record(
+        db,
+        user.id,
+        request.event_id,
+        request.outcome,
+        "sell",
+        request.shareCount,
+        share_price,
+        to_minor(total_profit_or_loss),
+        source=source,
+    )
+    user_stats.record_trade(
+        db,
+        user.id,
+        request.shareCount,
+        share_price,
+        to_minor(total_profit_or_loss),
+    )
+
+    # Update event totals
+    if request.outcome == "yes":
+        counters.add_bets(db, event.id, yes=-request.shareCount)
+    else:
+        counters.add_bets(db, event.id, no=-request.shareCount)
+
+    return total_profit_or_loss
@@ -0,0 +1,233 @@
+"""
+Train the team match-up model from the team stats spreadsheet.
+
+This is the pipeline from ai_model.ipynb as a reproducible command. Every
+candidate model is a per-team win-rate regressor, which is what
+`predict_team_win_probability` expects, and candidates are compared on how
+well their normalised win rates predict head-to-head match-ups.
+
+Usage:
+    python -m app.training --data app/team_stats_data.xlsx --workers 8
+"""
+
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+
+features = [
+    "ADJ OE", "ADJ DE", "EFG", "EFG D", "FT RATE", "FT RATE D",
+    "TOV%", "TOV% D", "O REB%", "OP OREB%", "2P %", "2P % D.", "3P %", "3P % D."
+]
+
+# Hand-exported artifacts the API has always loaded
+LEGACY_MODEL_PATH = "app/team_matchup_predictor.pkl"
+LEGACY_SCALER_PATH = "app/scaler.pkl"
+
+ARTIFACTS_DIR = os.getenv("MODEL_ARTIFACTS_DIR", "app/artifacts")
+
+PARAM_GRID = {
+    "n_estimators": [50, 100, 200, 400],
+    "learning_rate": [0.01, 0.05, 0.1, 0.2],
+    "max_depth": [2, 3, 4],
+    "subsample": [0.7, 1.0],
+}
+
+RANDOM_STATE = 42
+
+
+def load_dataset(path: str):
+    """
+    Load team stats and compute each team's win rate.
+
+    Returns:
+        tuple: The feature matrix X and win-rate vector y as arrays.
+    """
+    data = pd.read_excel(path)
+    data["win_rate"] = data["WINS"] / data["GAMES"]
+    return data[features].to_numpy(dtype=float), data["win_rate"].to_numpy(dtype=float)
+
+
+def pairwise_dataset(win_rates: np.ndarray):
+    """
+    Build every team-vs-team match-up without looping over combinations.
+
+    Returns:
+        tuple: Index arrays (i, j) of the two teams and a boolean label that
+        is True when team i has the higher win rate. Ties are dropped.
+    """
+    i, j = np.triu_indices(len(win_rates), k=1)
+    keep = win_rates[i] != win_rates[j]
+    i, j = i[keep], j[keep]
+    return i, j, win_rates[i] > win_rates[j]
+
+
+def matchup_scores(
+    predicted_rates: np.ndarray, i: np.ndarray, j: np.ndarray, labels: np.ndarray
+):
+    """
+    Score predicted win rates on the match-ups the way the API uses them.
+
+    Returns:
+        dict: Pairwise log loss and accuracy of p_i = r_i / (r_i + r_j).
+    """
+    rates = np.clip(predicted_rates, 1e-6, None)
+    prob = np.clip(rates[i] / (rates[i] + rates[j]), 1e-6, 1 - 1e-6)
+    log_loss = -np.mean(np.where(labels, np.log(prob), np.log(1 - prob)))
+    accuracy = np.mean((prob > 0.5) == labels)
+    return {"log_loss": float(log_loss), "accuracy": float(accuracy)}
+
+
+def evaluate_candidate(params: dict, X_train, y_train, X_test, y_test):
+    """Fit one candidate on the training teams and score it on test match-ups."""
+    model = GradientBoostingRegressor(random_state=RANDOM_STATE, **params)
+    model.fit(X_train, y_train)
+
+    i, j, labels = pairwise_dataset(y_test)
+    scores = matchup_scores(model.predict(X_test), i, j, labels)
+    scores["mse"] = float(np.mean((model.predict(X_test) - y_test) ** 2))
+    return params, scores
+
+
+def search(X: np.ndarray, y: np.ndarray, workers: int = None):
+    """
+    Run the hyperparameter grid across a process pool.
+
+    Returns:
+        list: (params, scores) for every candidate, best log loss first.
+    """
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=RANDOM_STATE
+    )
+    scaler = StandardScaler().fit(X_train)
+    X_train_scaled = scaler.transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+
+    keys = list(PARAM_GRID)
+    candidates = [
+        dict(zip(keys, values)) for values in itertools.product(*PARAM_GRID.values())
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(
+                evaluate_candidate,
+                params,
+                X_train_scaled,
+                y_train,
+                X_test_scaled,
+                y_test,
+            )
+            for params in candidates
+        ]
+        results = [future.result() for future in futures]
+
+    return sorted(results, key=lambda result: result[1]["log_loss"])
+
+
+def save_artifacts(model, scaler, metadata: dict, output_dir: str = ARTIFACTS_DIR):
+    """
+    Write a new artifact version and point LATEST at it.
+
+    Returns:
+        str: The version name, a UTC timestamp.
+    """
+    version = datetime.utcnow().strftime("%Y%m%d%H%M%S")
+    version_dir = os.path.join(output_dir, version)
+    os.makedirs(version_dir, exist_ok=True)
+
+    joblib.dump(model, os.path.join(version_dir, "team_matchup_predictor.pkl"))
+    joblib.dump(scaler, os.path.join(version_dir, "scaler.pkl"))
+    with open(os.path.join(version_dir, "metadata.json"), "w") as f:
+        json.dump({"version": version, **metadata}, f, indent=2)
+
+    with open(os.path.join(output_dir, "LATEST"), "w") as f:
+        f.write(version)
+    return version
+
+
+def load_artifacts(version: str = None, artifacts_dir: str = ARTIFACTS_DIR):
+    """
+    Load the model and scaler the API predicts with.
+
+    `version` defaults to the MODEL_VERSION environment variable. "latest"
+    resolves through the LATEST pointer written by `save_artifacts`; with no
+    version set the hand-exported pickles in app/ are used.
+
+    Returns:
+        tuple: The (model, scaler) pair.
+    """
+    version = version or os.getenv("MODEL_VERSION")
+    if not version:
+        return joblib.load(LEGACY_MODEL_PATH), joblib.load(LEGACY_SCALER_PATH)
+
+    if version == "latest":
+        with open(os.path.join(artifacts_dir, "LATEST")) as f:
+            version = f.read().strip()
+
+    version_dir = os.path.join(artifacts_dir, version)
+    return (
+        joblib.load(os.path.join(version_dir, "team_matchup_predictor.pkl")),
+        joblib.load(os.path.join(version_dir, "scaler.pkl")),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the team match-up model.")
+    parser.add_argument("--data", default="app/team_stats_data.xlsx")
+    parser.add_argument("--output", default=ARTIFACTS_DIR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    X, y = load_dataset(args.data)
+
+    started = time.perf_counter()
+    results = search(X, y, workers=args.workers)
+    best_params, best_scores = results[0]
+    logging.info(
+        f"Evaluated {len(results)} candidates in {time.perf_counter() - started:.2f}s; "
+        f"best {best_params} -> {best_scores}"
+    )
+
+    # Refit the winning configuration on every team for the shipped model
+    scaler = StandardScaler().fit(X)
+    model = GradientBoostingRegressor(random_state=RANDOM_STATE, **best_params)
+    model.fit(scaler.transform(X), y)
+
+    with open(args.data, "rb") as f:
+        data_sha256 = hashlib.sha256(f.read()).hexdigest()
+
+    version = save_artifacts(
+        model,
+        scaler,
+        {
+            "created_at": datetime.utcnow().isoformat(),
+            "data": args.data,
+            "data_sha256": data_sha256,
+            "features": features,
+            "params": best_params,
+            "scores": best_scores,
+            "sklearn_version": sklearn.__version__,
+            "random_state": RANDOM_STATE,
+        },
+        args.output,
+    )
+    logging.info(f"Saved model version {version} to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
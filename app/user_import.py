@@ -0,0 +1,283 @@
+"""
+Bulk registration of users from a streamed CSV or JSON Lines body.
+
+Each record has the fields of a /register request (email and password are
+required). Records are validated as they are read and imported in chunks of
+USER_IMPORT_CHUNK_SIZE: one query finds emails that are already registered,
+one batch call creates the identity records (`import_users` on the auth
+provider, which for Firebase is its bulk import API), and one multi-row
+INSERT adds the local `User` rows, committed per chunk. Only one chunk is
+held in memory, so the size of the import is bounded by time, not memory.
+Emails are compared case-insensitively and stored lowercased. A repeated
+email is caught within its chunk; in a later chunk, the first one is
+already registered.
+
+A record that fails (invalid, duplicate, rejected by the provider) is
+reported with its line number and skipped; the rest of the import goes on.
+If the local insert of a chunk hits a concurrent registration, its rows are
+inserted one at a time and the identities of the rows that still fail are
+deleted again, so no identity is left without a local user.
+"""
+
+import codecs
+import csv
+import json
+import os
+from typing import AsyncIterator, List, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .auth_client import auth_client
+from .auth_providers import IMPORT_BATCH_SIZE, AuthProviderError, new_uid
+from .ledger import to_minor
+from .models import User
+from .schemas import RegisterUser
+
+USER_IMPORT_CHUNK_SIZE = min(
+    int(os.getenv("USER_IMPORT_CHUNK_SIZE", str(IMPORT_BATCH_SIZE))),
+    IMPORT_BATCH_SIZE,
+)
+# Errors listed in the report; the rest are only counted
+USER_IMPORT_MAX_ERRORS = int(os.getenv("USER_IMPORT_MAX_ERRORS", "1000"))
+# Same opening balances as /register
+STARTING_POINTS = 1000.0
+MIN_PASSWORD_LENGTH = 6
+
+FORMATS = ("csv", "jsonl")
+
+
+class ImportReport:
+    """Counts of imported and failed records, and the first errors."""
+
+    def __init__(self, max_errors: int = USER_IMPORT_MAX_ERRORS):
+        self.imported = 0
+        self.failed = 0
+        self.max_errors = max_errors
+        self.errors: List[dict] = []
+
+    def error(self, line: int, email, reason: str):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "email": email, "error": reason})
+
+    def as_dict(self) -> dict:
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "errors_truncated": self.failed > len(self.errors),
+        }
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split a stream of UTF-8 bytes into lines, without reading it all."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_records(
+    lines: AsyncIterator[str], format: str
+) -> AsyncIterator[Tuple[int, object]]:
+    """
+    Parse one record per line: CSV under a header row, or JSON objects.
+
+    Returns:
+        AsyncIterator: (line number, dict) per record, or (line number, str)
+            with the reason a line could not be parsed.
+    """
+    header = None
+    number = 0
+    async for line in lines:
+        number += 1
+        if not line.strip():
+            continue
+        if format == "jsonl":
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield number, "Expected a JSON object."
+                continue
+            yield number, record
+        elif header is None:
+            header = [name.strip() for name in next(csv.reader([line]))]
+        else:
+            values = next(csv.reader([line]))
+            if len(values) != len(header):
+                yield number, f"Expected {len(header)} fields, got {len(values)}."
+                continue
+            # Empty cells are missing values, like absent JSON keys
+            yield number, {
+                name: value for name, value in zip(header, values) if value != ""
+            }
+
+
+def user_row(uid: str, user: RegisterUser) -> dict:
+    """The `users` row /register would create for `user`."""
+    return {
+        "id": uid,
+        "email": user.email,
+        "name": user.name or "",
+        "first_name": user.first_name or "",
+        "last_name": user.last_name or "",
+        "mobile_number": user.mobile_number or "",
+        "address": user.address or "",
+        "city": user.city or "",
+        "state": user.state or "",
+        "zip_postal": user.zip_postal or "",
+        "country": user.country or "",
+        "role": user.role or "USER",
+        "balance_minor": to_minor(STARTING_POINTS),
+        "betting_points": STARTING_POINTS,
+        "ban": False,
+    }
+
+
+async def import_chunk(
+    db: AsyncSession, rows: List[Tuple[int, RegisterUser]], report: ImportReport
+):
+    """
+    Create the identities and local users of one chunk of valid records.
+
+    An identity whose local user is not created is deleted again, also when
+    the insert fails with an unexpected error (which is then re-raised).
+    """
+    registered = set(
+        await db.scalars(
+            select(func.lower(User.email)).where(
+                func.lower(User.email).in_([user.email for _, user in rows])
+            )
+        )
+    )
+    candidates = []
+    for line, user in rows:
+        if user.email in registered:
+            report.error(line, user.email, "Email is already registered.")
+        else:
+            candidates.append((line, new_uid(), user))
+    if not candidates:
+        return
+
+    try:
+        rejected = await auth_client.import_users(
+            [
+                {
+                    "uid": uid,
+                    "email": user.email,
+                    "password": user.password,
+                    "display_name": user.name,
+                }
+                for _, uid, user in candidates
+            ]
+        )
+    except AuthProviderError as e:
+        for line, _, user in candidates:
+            report.error(line, user.email, f"Identity provider error: {e}")
+        return
+
+    created = []
+    for index, (line, uid, user) in enumerate(candidates):
+        if index in rejected:
+            report.error(line, user.email, rejected[index])
+        else:
+            created.append((line, uid, user))
+    if not created:
+        return
+
+    try:
+        await db.execute(
+            insert(User), [user_row(uid, user) for _, uid, user in created]
+        )
+        await db.commit()
+        report.imported += len(created)
+        return
+    except IntegrityError:
+        await db.rollback()
+    except Exception:
+        # No local user was created, so no identity may outlive the chunk
+        await db.rollback()
+        await auth_client.delete_users([uid for _, uid, _ in created])
+        raise
+
+    # Some of the emails were registered since the check: insert one by one
+    orphans = []
+    for index, (line, uid, user) in enumerate(created):
+        try:
+            await db.execute(insert(User), [user_row(uid, user)])
+            await db.commit()
+            report.imported += 1
+        except IntegrityError:
+            await db.rollback()
+            orphans.append(uid)
+            report.error(line, user.email, "Email is already registered.")
+        except Exception:
+            await db.rollback()
+            await auth_client.delete_users(
+                orphans + [uid for _, uid, _ in created[index:]]
+            )
+            raise
+    if orphans:
+        await auth_client.delete_users(orphans)
+
+
+async def import_users(
+    db: AsyncSession, chunks: AsyncIterator[bytes], format: str
+) -> dict:
+    """
+    Import every record of a CSV or JSON Lines stream.
+
+    Args:
+        db (AsyncSession): The database session; each chunk is committed.
+        chunks (AsyncIterator): The request body.
+        format (str): "csv" (with a header row) or "jsonl".
+
+    Returns:
+        dict: The import report: counts and per-line errors.
+    """
+    report = ImportReport()
+    pending: List[Tuple[int, RegisterUser]] = []
+    seen = set()  # Emails in `pending`
+
+    async for line, record in iter_records(iter_lines(chunks), format):
+        if isinstance(record, str):
+            report.error(line, None, record)
+            continue
+        try:
+            user = RegisterUser.model_validate(record)
+        except ValidationError as e:
+            report.error(line, record.get("email"), str(e.errors()[0]["msg"]))
+            continue
+        if len(user.password) < MIN_PASSWORD_LENGTH:
+            report.error(
+                line,
+                user.email,
+                f"Password must be at least {MIN_PASSWORD_LENGTH} characters long.",
+            )
+            continue
+        user.email = user.email.lower()
+        if user.email in seen:
+            report.error(line, user.email, "Email appears earlier in the import.")
+            continue
+        seen.add(user.email)
+
+        pending.append((line, user))
+        if len(pending) >= USER_IMPORT_CHUNK_SIZE:
+            await import_chunk(db, pending, report)
+            pending = []
+            seen = set()
+    if pending:
+        await import_chunk(db, pending, report)
+    return report.as_dict()
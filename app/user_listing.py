@@ -0,0 +1,165 @@
+"""
+Admin user listing: keyset pages and a streamed export.
+
+Users are ordered by (created_at, id), which ix_users_created_at_id covers.
+A page is requested with the opaque cursor returned in the X-Next-Cursor
+header of the previous page (see app.pagination), so every page is an index
+range scan no matter how deep it is, and users created meanwhile neither
+shift nor repeat rows. Only the listed columns are
+selected; no ORM objects are built.
+
+The export walks the same ordering over a server-side cursor, fetching
+EXPORT_BATCH_SIZE rows at a time and writing them out as CSV or NDJSON as
+they arrive, so its memory use does not depend on the number of users.
+
+Filters: exact country, ban status, and a case-insensitive substring match
+of `search` on email, first and last name.
+"""
+
+import csv
+import io
+import json
+import os
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import or_, select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import Select
+
+from .ledger import from_minor
+from .models import User
+from .pagination import after_cursor, encode_cursor
+
+USER_PAGE_SIZE = int(os.getenv("USER_PAGE_SIZE", "100"))
+USER_PAGE_MAX_SIZE = int(os.getenv("USER_PAGE_MAX_SIZE", "1000"))
+EXPORT_BATCH_SIZE = int(os.getenv("USER_EXPORT_BATCH_SIZE", "1000"))
+
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+FIELDS = [
+    "id",
+    "email",
+    "first_name",
+    "last_name",
+    "mobile_number",
+    "country",
+    "created_at",
+    "sweeps_points",
+    "ban",
+]
+
+
+def like_escape(text: str) -> str:
+    """`text` with LIKE's wildcards escaped, so it only matches literally."""
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def listing_query(
+    country: Optional[str] = None,
+    ban: Optional[bool] = None,
+    search: Optional[str] = None,
+) -> Select:
+    """The filtered listing in keyset order."""
+    stmt = select(
+        User.id,
+        User.email,
+        User.first_name,
+        User.last_name,
+        User.mobile_number,
+        User.country,
+        User.created_at,
+        User.balance_minor,
+        User.ban,
+    ).order_by(User.created_at, User.id)
+    if country:
+        stmt = stmt.where(User.country == country)
+    if ban is not None:
+        stmt = stmt.where(User.ban == ban)
+    if search:
+        pattern = f"%{like_escape(search)}%"
+        stmt = stmt.where(
+            or_(
+                User.email.ilike(pattern, escape="\\"),
+                User.first_name.ilike(pattern, escape="\\"),
+                User.last_name.ilike(pattern, escape="\\"),
+            )
+        )
+    return stmt
+
+
+def as_row(row) -> dict:
+    """The listing fields of a result row, JSON-ready."""
+    return {
+        "id": row.id,
+        "email": row.email,
+        "first_name": row.first_name,
+        "last_name": row.last_name,
+        "mobile_number": row.mobile_number,
+        "country": row.country,
+        "created_at": row.created_at.isoformat() if row.created_at else None,
+        "sweeps_points": from_minor(row.balance_minor),
+        "ban": row.ban,
+    }
+
+
+def page(
+    db: Session,
+    cursor: Optional[str] = None,
+    limit: int = USER_PAGE_SIZE,
+    **filters,
+) -> Tuple[List[dict], Optional[str]]:
+    """
+    One page of the listing.
+
+    Args:
+        db (Session): The database session.
+        cursor (str): The previous page's next cursor; None for the first page.
+        limit (int): Page size, capped at USER_PAGE_MAX_SIZE.
+        **filters: country, ban and search, see `listing_query`.
+
+    Returns:
+        tuple: (rows, next cursor); the cursor is None on the last page.
+
+    Raises:
+        ValueError: The cursor is invalid.
+    """
+    limit = max(1, min(limit, USER_PAGE_MAX_SIZE))
+    stmt = listing_query(**filters)
+    if cursor:
+        stmt = stmt.where(after_cursor(User.created_at, User.id, cursor))
+
+    # One row more than the page tells whether there is a next page
+    rows = db.execute(stmt.limit(limit + 1)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return [as_row(row) for row in rows], next_cursor
+
+
+def export(engine: Engine, format: str, **filters) -> Iterator[str]:
+    """
+    Stream the whole filtered listing as CSV (with a header row) or NDJSON.
+
+    Returns:
+        Iterator: Text chunks of up to EXPORT_BATCH_SIZE rows each.
+    """
+    with engine.connect() as connection:
+        result = connection.execution_options(
+            stream_results=True, yield_per=EXPORT_BATCH_SIZE
+        ).execute(listing_query(**filters))
+
+        if format == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+            writer.writeheader()
+            yield buffer.getvalue()
+            for batch in result.partitions():
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows(as_row(row) for row in batch)
+                yield buffer.getvalue()
+        else:
+            for batch in result.partitions():
+                yield "".join(json.dumps(as_row(row)) + "\n" for row in batch)
@@ -0,0 +1,187 @@
+"""
+Per-user trading summary: orders placed, volume, realized PnL and the time
+of the last trade.
+
+The totals live in the user_stats table and are never recounted. Every
+executed order (trades, batch orders, stop orders) and every settlement adds
+to the user's row with one atomic upsert in the same transaction, so the
+summary is exactly as durable as the trades behind it.
+
+`get_summary` serves it from a per-process LRU cache that reads through to
+the table with one primary-key lookup. Commits from this process invalidate
+the user's entry; commits from other workers show up once the entry expires
+(USER_STATS_TTL_SECONDS).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .counters import UPSERTS
+from .db_config import after_commit
+from .ledger import from_minor, to_minor
+from .models import UserStats
+
+USER_STATS_TTL = float(os.getenv("USER_STATS_TTL_SECONDS", "30"))
+USER_STATS_CACHE_SIZE = int(os.getenv("USER_STATS_CACHE_SIZE", "100000"))
+
+EMPTY_SUMMARY = {
+    "bets_placed": 0,
+    "volume": 0.0,
+    "realized_pnl": 0.0,
+    "last_trade_at": None,
+}
+
+
+class SummaryCache:
+    """
+    Thread-safe LRU of user summaries with a time-to-live.
+
+    A read that raced an invalidation does not store what it read: every
+    invalidation bumps `generation`, and `put` is given the generation seen
+    before the read.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.generation = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user_id: str, summary: dict, generation: int):
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[user_id] = (time.monotonic() + self.ttl, summary)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_ids: Iterable[str]):
+        with self._lock:
+            self.generation += 1
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+
+summary_cache = SummaryCache(USER_STATS_CACHE_SIZE, USER_STATS_TTL)
+
+
+def _add(db: Session, rows: list):
+    """Add each row's counts to its user's totals, creating missing rows."""
+    if not rows:
+        return
+    upsert = UPSERTS[db.get_bind().dialect.name](UserStats)
+    db.execute(
+        upsert.on_conflict_do_update(
+            index_elements=["user_id"],
+            set_={
+                "bets_placed": UserStats.bets_placed + upsert.excluded.bets_placed,
+                "volume_minor": UserStats.volume_minor + upsert.excluded.volume_minor,
+                "realized_pnl_minor": UserStats.realized_pnl_minor
+                + upsert.excluded.realized_pnl_minor,
+                "last_trade_at": func.coalesce(
+                    upsert.excluded.last_trade_at, UserStats.last_trade_at
+                ),
+            },
+        ),
+        rows,
+    )
+    user_ids = [row["user_id"] for row in rows]
+    after_commit(db, lambda: summary_cache.invalidate(user_ids))
+
+
+def record_trade(
+    db: Session, user_id: str, shares: float, price: float, realized_minor: int = 0
+):
+    """
+    Count an executed order inside the current transaction.
+
+    Args:
+        db (Session): The database session; nothing is committed.
+        user_id (str): The trading user.
+        shares (float): The order size.
+        price (float): The execution price, 0-100.
+        realized_minor (int): Profit or loss realised by closing lots.
+    """
+    _add(
+        db,
+        [
+            {
+                "user_id": user_id,
+                "bets_placed": 1,
+                "volume_minor": to_minor(shares * price / 100),
+                "realized_pnl_minor": realized_minor,
+                "last_trade_at": datetime.utcnow(),
+            }
+        ],
+    )
+
+
+def record_settlement(db: Session, payouts_minor: Dict[str, int]):
+    """Add settlement payouts (negative for losses) to the users' realized PnL."""
+    _add(
+        db,
+        [
+            {
+                "user_id": user_id,
+                "bets_placed": 0,
+                "volume_minor": 0,
+                "realized_pnl_minor": payout,
+                "last_trade_at": None,
+            }
+            for user_id, payout in payouts_minor.items()
+        ],
+    )
+
+
+def get_summary(db: Session, user_id: str) -> dict:
+    """
+    A user's summary, from the cache or one primary-key lookup.
+
+    Returns:
+        dict: bets_placed, volume and realized_pnl (in Sweeps Points), and
+            last_trade_at (ISO 8601, or None before the first trade).
+    """
+    summary = summary_cache.get(user_id)
+    if summary is not None:
+        return summary
+
+    generation = summary_cache.generation
+    stats = db.get(UserStats, user_id)
+    if stats is None:
+        summary = dict(EMPTY_SUMMARY)
+    else:
+        summary = {
+            "bets_placed": stats.bets_placed,
+            "volume": from_minor(stats.volume_minor),
+            "realized_pnl": from_minor(stats.realized_pnl_minor),
+            "last_trade_at": (
+                stats.last_trade_at.isoformat() if stats.last_trade_at else None
+            ),
+        }
+    summary_cache.put(user_id, summary, generation)
+    return summary
@@ -0,0 +1,78 @@
+"""
+Measure how request throughput scales with the number of in-flight requests.
+
+Drives the async read endpoints with a fixed number of concurrent clients
+and reports requests per second for each concurrency level. With the async
+database layer the numbers should keep rising with concurrency instead of
+flattening at the single-request rate.
+
+Usage (against a running server):
+    uvicorn app.main:app --port 8000
+    python -m benchmarks.async_db --url http://127.0.0.1:8000 --event-id 1
+
+Without --url the app is driven in-process through httpx's ASGI transport.
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+import httpx
+
+
+async def worker(client: httpx.AsyncClient, paths, deadline: float, counts: list):
+    i = 0
+    while time.perf_counter() < deadline:
+        response = await client.get(paths[i % len(paths)])
+        response.raise_for_status()
+        counts[0] += 1
+        i += 1
+
+
+async def measure(client: httpx.AsyncClient, paths, concurrency: int, duration: float):
+    counts = [0]
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(
+        *(worker(client, paths, deadline, counts) for _ in range(concurrency))
+    )
+    return counts[0] / (time.perf_counter() - started)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", help="Base URL of a running server")
+    parser.add_argument("--event-id", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per level")
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64]
+    )
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    paths = [
+        f"/api/market/share-price?eventId={args.event_id}&type=buy",
+        "/events",
+    ]
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=30)
+    else:
+        from app.main import app
+
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=30
+        )
+
+    async with client:
+        baseline = None
+        print(f"{'in-flight':>10} {'req/s':>10} {'speedup':>8}")
+        for concurrency in args.concurrency:
+            rate = await measure(client, paths, concurrency, args.duration)
+            baseline = baseline or rate
+            print(f"{concurrency:>10} {rate:>10.1f} {rate / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,82 @@
+"""
+Measure trade-counter throughput on a single hot event.
+
+Runs a number of worker threads that each increment the same event's yes
+total and commit, as every trade does, and reports commits per second for
+the in-place counter and for sharded counters. On Postgres the sharded
+numbers should keep rising with the worker count, while the in-place
+counter flattens because every worker queues on the same row lock. SQLite
+allows only one writer at a time, so both modes flatten there.
+
+Usage:
+    DATABASE_URL=postgresql://... python -m benchmarks.event_counters --event-id 1
+"""
+
+import argparse
+import threading
+import time
+
+from app import counters
+from app.db_config import SessionLocal
+
+
+def worker(event_id: int, shards: int, deadline: float, counts: list, index: int):
+    db = SessionLocal()
+    try:
+        while time.perf_counter() < deadline:
+            counters.add_bets(db, event_id, yes=1, shards=shards)
+            db.commit()
+            counts[index] += 1
+    finally:
+        db.close()
+
+
+def measure(event_id: int, shards: int, workers: int, duration: float):
+    counts = [0] * workers
+    started = time.perf_counter()
+    deadline = started + duration
+    threads = [
+        threading.Thread(target=worker, args=(event_id, shards, deadline, counts, i))
+        for i in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--event-id", type=int, default=1)
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per level")
+    parser.add_argument("--shards", type=int, nargs="+", default=[0, 16])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    before = counters.get_totals(db, args.event_id)
+    db.close()
+    if before is None:
+        parser.error(f"Event {args.event_id} not found")
+
+    print(f"{'shards':>6} {'workers':>8} {'trades/s':>10} {'speedup':>8}")
+    for shards in args.shards:
+        baseline = None
+        for workers in args.workers:
+            rate = measure(args.event_id, shards, workers, args.duration)
+            baseline = baseline or rate
+            print(f"{shards:>6} {workers:>8} {rate:>10.1f} {rate / baseline:>7.2f}x")
+
+    # Leave the event's totals as they were
+    db = SessionLocal()
+    counters.compact(db)
+    counters.totals_cache.clear()
+    yes, _ = counters.get_totals(db, args.event_id)
+    counters.add_bets(db, args.event_id, yes=before[0] - yes, shards=0)
+    db.commit()
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
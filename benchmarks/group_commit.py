@@ -0,0 +1,93 @@
+"""
+Measure trade throughput and latency with and without group commit.
+
+Sends buy-share orders from a number of concurrent clients through the app
+in-process and reports trades per second and latency percentiles for each
+group-commit setting. Clients are spread over the given events, so with
+several events and TRADE_SEQUENCER_WORKERS > 1 (Postgres) the per-event
+actors commit in parallel. Each order buys one share at a price of 1, so the
+user needs a balance of at least 0.01 per trade sent.
+
+Usage:
+    python -m benchmarks.group_commit --user-id <uid> --event-ids 1 2 3 4
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+
+import httpx
+import numpy as np
+
+from app.sequencer import trade_sequencer
+from app.main import app
+
+
+async def client_loop(client, body, deadline: float, latencies: list):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.post("/api/market/buy-share", json=body)
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+
+
+async def measure(client, bodies, clients: int, duration: float):
+    latencies = []
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(
+        *(
+            client_loop(client, bodies[i % len(bodies)], deadline, latencies)
+            for i in range(clients)
+        )
+    )
+    return len(latencies) / (time.perf_counter() - started), np.array(latencies)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--user-id", required=True)
+    parser.add_argument("--event-ids", type=int, nargs="+", default=[1])
+    parser.add_argument("--clients", type=int, default=64)
+    parser.add_argument(
+        "--duration", type=float, default=5.0, help="Seconds per setting"
+    )
+    parser.add_argument(
+        "--settings",
+        nargs="+",
+        default=["1:0", "256:1", "256:2", "256:5"],
+        help="max_batch:max_wait_ms pairs; 1:0 commits every trade on its own",
+    )
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    bodies = [
+        {
+            "user_id": args.user_id,
+            "event_id": event_id,
+            "outcome": "yes",
+            "bet_type": "buy",
+            "shareCount": 1,
+            "share_price": 1,
+        }
+        for event_id in args.event_ids
+    ]
+
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60
+    ) as client:
+        print(f"{'batch:wait':>10} {'trades/s':>10} {'p50 ms':>8} {'p99 ms':>8}")
+        for setting in args.settings:
+            max_batch, max_wait_ms = setting.split(":")
+            for actor in trade_sequencer.actors:
+                actor.max_batch = int(max_batch)
+                actor.max_wait = float(max_wait_ms) / 1000
+
+            rate, latencies = await measure(client, bodies, args.clients, args.duration)
+            p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+            print(f"{setting:>10} {rate:>10.1f} {p50:>8.1f} {p99:>8.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,110 @@
+import asyncio
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from alembic import command
+from alembic.config import Config
+
+from app import db_config
+from app.counters import totals_cache
+from app.depth import depth_book
+from app.idempotency import response_cache
+from app.ledger import to_minor
+from app.models import Event, Match, User
+from app.risk import risk_book
+from app.user_stats import summary_cache
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def migrate(engine):
+    """Create the tables and run every migration, as on a fresh deployment."""
+    db_config.Base.metadata.create_all(bind=engine)
+    config = Config()
+    config.set_main_option("script_location", str(ROOT / "alembic"))
+    # alembic/env.py migrates app.db_config.engine
+    configured = db_config.engine
+    db_config.engine = engine
+    try:
+        command.upgrade(config, "head")
+    finally:
+        db_config.engine = configured
+
+
+@pytest.fixture
+def engines(tmp_path):
+    """
+    A migrated SQLite database in a temp directory. The app's session
+    factories (and so the trade sequencer) are bound to it, and the
+    per-process caches start empty.
+    """
+    engine, async_engine = db_config.build_engines(f"sqlite:///{tmp_path}/app.db")
+    migrate(engine)
+
+    sync_bind = db_config.SessionLocal.kw["bind"]
+    async_bind = db_config.AsyncSessionLocal.kw["bind"]
+    db_config.SessionLocal.configure(bind=engine)
+    db_config.AsyncSessionLocal.configure(bind=async_engine)
+
+    totals_cache.clear()
+    summary_cache.clear()
+    response_cache.clear()
+    with db_config.SessionLocal() as db:
+        depth_book.rebuild(db)
+        risk_book.rebuild(db)
+    try:
+        yield engine, async_engine
+    finally:
+        db_config.SessionLocal.configure(bind=sync_bind)
+        db_config.AsyncSessionLocal.configure(bind=async_bind)
+        engine.dispose()
+        asyncio.run(async_engine.dispose())
+
+
+@pytest.fixture
+def db(engines):
+    with db_config.SessionLocal() as session:
+        yield session
+
+
+@pytest.fixture
+def make_user(db):
+    """Create a committed user with a balance in Sweeps Points."""
+    count = 0
+
+    def make(balance: float = 1000.0, **fields) -> User:
+        nonlocal count
+        count += 1
+        user = User(
+            id=f"user-{count}",
+            email=f"user{count}@example.com",
+            balance_minor=to_minor(balance),
+            **fields,
+        )
+        db.add(user)
+        db.commit()
+        return user
+
+    return make
+
+
+@pytest.fixture
+def make_event(db):
+    """Create a committed open event on an upcoming match."""
+
+    def make(league: str = "Test League") -> Event:
+        match = Match(
+            team1="Home",
+            team2="Away",
+            league=league,
+            match_time=datetime.utcnow() + timedelta(days=1),
+        )
+        db.add(match)
+        db.flush()
+        event = Event(match_id=match.id, question="Will Home win?")
+        db.add(event)
+        db.commit()
+        return event
+
+    return make
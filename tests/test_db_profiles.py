@@ -0,0 +1,69 @@
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+
+from app import db_config
+
+POSTGRES_URL = os.getenv("DATABASE_URL", "")
+
+# Values PRAGMA reads back for each of db_config.SQLITE_PRAGMAS
+SYNCHRONOUS = {"OFF": 0, "NORMAL": 1, "FULL": 2, "EXTRA": 3}
+TEMP_STORE = {"DEFAULT": 0, "FILE": 1, "MEMORY": 2}
+
+
+def expected_pragmas():
+    pragmas = db_config.SQLITE_PRAGMAS
+    return {
+        "journal_mode": pragmas["journal_mode"].lower(),
+        "synchronous": SYNCHRONOUS[pragmas["synchronous"].upper()],
+        "busy_timeout": pragmas["busy_timeout"],
+        "mmap_size": pragmas["mmap_size"],
+        "cache_size": pragmas["cache_size"],
+        "temp_store": TEMP_STORE[pragmas["temp_store"].upper()],
+    }
+
+
+def read_pragmas(connection):
+    return {
+        name: connection.execute(text(f"PRAGMA {name}")).scalar()
+        for name in db_config.SQLITE_PRAGMAS
+    }
+
+
+def test_sqlite_profile_sets_pragmas(tmp_path):
+    engine, async_engine = db_config.build_engines(f"sqlite:///{tmp_path}/profile.db")
+    try:
+        with engine.connect() as connection:
+            assert read_pragmas(connection) == expected_pragmas()
+
+        async def read_async():
+            async with async_engine.connect() as connection:
+                return await connection.run_sync(read_pragmas)
+
+        assert asyncio.run(read_async()) == expected_pragmas()
+    finally:
+        engine.dispose()
+        asyncio.run(async_engine.dispose())
+
+
+@pytest.mark.skipif(
+    not POSTGRES_URL or make_url(POSTGRES_URL).get_backend_name() != "postgresql",
+    reason="DATABASE_URL does not point at Postgres",
+)
+def test_postgres_profile_sizes_the_pool():
+    engine, async_engine = db_config.build_engines(POSTGRES_URL)
+    try:
+        pool_options = db_config.POSTGRES_POOL
+        for pool in (engine.pool, async_engine.sync_engine.pool):
+            assert pool.size() == pool_options["pool_size"]
+            assert pool._max_overflow == pool_options["max_overflow"]
+            assert pool._timeout == pool_options["pool_timeout"]
+            assert pool._recycle == pool_options["pool_recycle"]
+            assert pool._pre_ping is True
+        assert async_engine.url.drivername == "postgresql+asyncpg"
+    finally:
+        engine.dispose()
+        asyncio.run(async_engine.dispose())
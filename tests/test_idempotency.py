@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from app import idempotency, main
+from app.idempotency import IDEMPOTENCY_TTL, DuplicateKeyError, response_cache
+from app.ledger import to_minor
+from app.models import IdempotencyKey, Trade, User
+from app.schemas import BuyShareRequest
+from app.trading import execute_buy
+
+ENDPOINT = "/api/market/buy-share"
+PAYLOAD = {"user_id": "user-1", "shareCount": 10}
+RESPONSE = {"message": "Trade executed successfully", "profit_or_loss": 0}
+
+
+class Work:
+    """A response factory that counts how often it ran."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return dict(RESPONSE, call=self.calls)
+
+
+def test_run_once_replays_the_stored_response(db, make_user):
+    user, work = make_user(), Work()
+
+    first = idempotency.run_once(db, ENDPOINT, user.id, "key-1", PAYLOAD, work)
+    db.commit()
+    # Answered from the table, then from the cache once committed
+    response_cache.clear()
+    from_table = idempotency.run_once(db, ENDPOINT, user.id, "key-1", PAYLOAD, work)
+    from_cache = idempotency.run_once(db, ENDPOINT, user.id, "key-1", PAYLOAD, work)
+
+    assert first == from_table == from_cache == dict(RESPONSE, call=1)
+    assert work.calls == 1
+    assert idempotency.cached(ENDPOINT, user.id, "key-1", PAYLOAD) == first
+
+
+def test_run_once_without_a_key_always_runs(db, make_user):
+    user, work = make_user(), Work()
+
+    idempotency.run_once(db, ENDPOINT, user.id, None, PAYLOAD, work)
+    idempotency.run_once(db, ENDPOINT, user.id, None, PAYLOAD, work)
+
+    assert work.calls == 2
+    assert db.query(IdempotencyKey).count() == 0
+
+
+def test_keys_are_scoped_by_user_and_endpoint(db, make_user):
+    user, other, work = make_user(), make_user(), Work()
+
+    idempotency.run_once(db, ENDPOINT, user.id, "key-1", PAYLOAD, work)
+    idempotency.run_once(db, ENDPOINT, other.id, "key-1", PAYLOAD, work)
+    idempotency.run_once(db, "/modifyBalance", user.id, "key-1", PAYLOAD, work)
+    db.commit()
+
+    assert work.calls == 3
+
+
+def test_reused_key_with_another_body_is_rejected(db, make_user):
+    user, work = make_user(), Work()
+    idempotency.run_once(db, ENDPOINT, user.id, "key-1", PAYLOAD, work)
+    db.commit()
+    other_payload = dict(PAYLOAD, shareCount=11)
+
+    for clear_cache in (False, True):
+        if clear_cache:
+            response_cache.clear()
+        with pytest.raises(HTTPException) as error:
+            idempotency.run_once(db, ENDPOINT, user.id, "key-1", other_payload, work)
+        assert error.value.status_code == 422
+    assert work.calls == 1
+
+
+def test_recording_a_taken_key_raises_duplicate_key(db, make_user):
+    user = make_user()
+    idempotency.record(db, ENDPOINT, user.id, "key-1", PAYLOAD, RESPONSE)
+    db.commit()
+
+    with pytest.raises(DuplicateKeyError):
+        idempotency.record(db, ENDPOINT, user.id, "key-1", PAYLOAD, RESPONSE)
+    db.rollback()
+
+    assert db.query(IdempotencyKey).count() == 1
+
+
+def test_expired_key_is_deleted_and_free_again(db, make_user):
+    user, work = make_user(), Work()
+    idempotency.run_once(db, ENDPOINT, user.id, "key-1", PAYLOAD, work)
+    db.commit()
+    row = db.get(IdempotencyKey, (ENDPOINT, user.id, "key-1"))
+    row.created_at = datetime.utcnow() - timedelta(seconds=IDEMPOTENCY_TTL + 60)
+    db.commit()
+    response_cache.clear()
+
+    assert idempotency.lookup(db, ENDPOINT, user.id, "key-1", PAYLOAD) is None
+    db.commit()
+    assert db.get(IdempotencyKey, (ENDPOINT, user.id, "key-1")) is None
+
+    response = idempotency.run_once(db, ENDPOINT, user.id, "key-1", PAYLOAD, work)
+    db.commit()
+    assert response == dict(RESPONSE, call=2)
+
+
+def test_racing_duplicate_gets_409_and_does_not_trade(
+    db, make_user, make_event, monkeypatch
+):
+    user, event = make_user(1000), make_event()
+    request = BuyShareRequest(
+        user_id=user.id,
+        event_id=event.id,
+        outcome="yes",
+        bet_type="buy",
+        shareCount=10,
+        share_price=40,
+    )
+    payload = request.model_dump(mode="json")
+    # The first attempt commits its response after the replay looked it up
+    idempotency.record(db, ENDPOINT, user.id, "key-1", payload, RESPONSE)
+    db.commit()
+    response_cache.clear()
+    monkeypatch.setattr(idempotency, "lookup", lambda *args: None)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(main.submit_trade(ENDPOINT, request, execute_buy, "key-1"))
+
+    assert error.value.status_code == 409
+    db.expire_all()
+    assert db.get(User, user.id).balance_minor == to_minor(1000)
+    assert db.query(Trade).count() == 0
@@ -0,0 +1,97 @@
+import pytest
+from sqlalchemy import update
+
+from app import ledger
+from app.ledger import InsufficientBalanceError, from_minor, to_minor
+from app.models import BalanceSnapshot, LedgerEntry, User
+
+
+def entries(db, user):
+    return db.query(LedgerEntry).filter(LedgerEntry.user_id == user.id).all()
+
+
+@pytest.mark.parametrize(
+    "amount, minor",
+    [(0, 0), (1.234, 123), (0.005, 1), (0.015, 2), (-0.005, -1), (12.5, 1250)],
+)
+def test_to_minor_rounds_half_up(amount, minor):
+    assert to_minor(amount) == minor
+
+
+def test_from_minor_reverses_to_minor():
+    assert from_minor(to_minor(12.34)) == 12.34
+
+
+def test_post_moves_the_balance_and_records_an_entry(db, make_user):
+    user = make_user(10)
+
+    assert ledger.credit(db, user.id, 250, "deposit", "test:1") == 1250
+    assert ledger.debit(db, user.id, 1000, "trade") == 250
+    db.commit()
+
+    # The loaded User is kept in step with the UPDATE ... RETURNING
+    assert user.balance_minor == 250
+    credit, debit = sorted(entries(db, user), key=lambda entry: entry.id)
+    assert (credit.amount_minor, credit.balance_after) == (250, 1250)
+    assert (credit.kind, credit.reference) == ("deposit", "test:1")
+    assert (debit.amount_minor, debit.balance_after) == (-1000, 250)
+
+
+def test_debit_past_the_balance_is_rejected_without_writes(db, make_user):
+    user = make_user(1)
+
+    with pytest.raises(InsufficientBalanceError):
+        ledger.debit(db, user.id, 101, "trade")
+    db.commit()
+
+    db.expire_all()
+    assert db.get(User, user.id).balance_minor == 100
+    assert entries(db, user) == []
+
+
+def test_debit_may_overdraw_when_allowed(db, make_user):
+    user = make_user(1)
+
+    assert ledger.debit(db, user.id, 150, "fee", allow_overdraft=True) == -50
+    db.commit()
+
+    assert [entry.balance_after for entry in entries(db, user)] == [-50]
+
+
+def test_post_to_an_unknown_user_raises(db):
+    with pytest.raises(ValueError, match="not found") as error:
+        ledger.debit(db, "nobody", 1, "trade")
+    assert not isinstance(error.value, InsufficientBalanceError)
+
+
+def test_audit_passes_after_a_snapshot_and_later_entries(db, make_user):
+    first, second = make_user(10), make_user(20)
+    ledger.credit(db, first.id, 500, "deposit")
+    db.commit()
+
+    assert ledger.take_snapshots(db) == 2
+    # Nothing moved since, so nothing new to snapshot
+    assert ledger.take_snapshots(db) == 0
+
+    ledger.debit(db, first.id, 300, "trade")
+    ledger.credit(db, second.id, 75, "settlement")
+    db.commit()
+
+    assert ledger.audit_balances(db) == []
+    assert ledger.take_snapshots(db) == 2
+    assert db.query(BalanceSnapshot).count() == 4
+    assert ledger.audit_balances(db) == []
+
+
+def test_audit_flags_a_balance_changed_outside_the_ledger(db, make_user):
+    user, other = make_user(10), make_user(20)
+    ledger.take_snapshots(db)
+    ledger.credit(db, user.id, 100, "deposit")
+    db.commit()
+
+    db.execute(update(User).where(User.id == user.id).values(balance_minor=5000))
+    db.commit()
+
+    assert ledger.audit_balances(db) == [
+        {"user_id": user.id, "balance_minor": 5000, "expected_minor": 1100}
+    ]
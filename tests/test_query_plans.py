@@ -0,0 +1,9 @@
+from app.query_audit import HOT_QUERIES, assert_no_full_scans
+
+
+def test_hot_queries_are_registered():
+    assert HOT_QUERIES
+
+
+def test_hot_queries_use_indexes():
+    assert_no_full_scans()
@@ -0,0 +1,178 @@
+import asyncio
+import base64
+import json
+
+import pytest
+
+from app.rate_limit import RATE_LIMIT_IP_FACTOR, RateLimitMiddleware, TokenBuckets
+
+PATH = "/api/market/buy-share"
+# A token every 20 seconds (2 for an IP), so no bucket refills during a test
+LIMITS = {PATH: (0.05, 2.0)}
+
+
+class EchoApp:
+    """
+    An ASGI app that answers 200 with the request body it received. Writes
+    wait for `release` when it is set.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.release = None
+
+    async def __call__(self, scope, receive, send):
+        self.calls += 1
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        if self.release is not None and scope["method"] != "GET":
+            await self.release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": body})
+
+
+async def request(app, method="POST", path=PATH, body=b"", headers=(), ip="10.0.0.1"):
+    """Send one request through `app`; returns (status, headers, body)."""
+    chunks = [body[:3], body[3:]] if body else [b""]
+    messages = [
+        {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+        for i, chunk in enumerate(chunks)
+    ]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "method": method,
+        "path": path,
+        "headers": list(headers),
+        "client": (ip, 1234),
+    }
+    await app(scope, receive, send)
+    start, response = sent
+    return start["status"], dict(start["headers"]), response["body"]
+
+
+def bearer(user_id):
+    claims = base64.urlsafe_b64encode(json.dumps({"user_id": user_id}).encode())
+    return (b"authorization", b"Bearer header." + claims.rstrip(b"=") + b".signature")
+
+
+def trade(user_id):
+    return json.dumps({"user_id": user_id, "shareCount": 1}).encode()
+
+
+def statuses(app, requests):
+    async def run():
+        return [(await request(app, **kwargs))[0] for kwargs in requests]
+
+    return asyncio.run(run())
+
+
+def test_empty_bucket_gets_429_with_retry_after():
+    app = EchoApp()
+    middleware = RateLimitMiddleware(app, limits=LIMITS)
+
+    async def run():
+        ok = [await request(middleware, headers=[bearer("u1")]) for _ in range(2)]
+        return ok, await request(middleware, headers=[bearer("u1")])
+
+    ok, (status, headers, body) = asyncio.run(run())
+
+    assert [response[0] for response in ok] == [200, 200]
+    assert status == 429
+    assert headers[b"retry-after"] == b"20"
+    assert json.loads(body) == {"detail": "Too many requests."}
+    assert app.calls == 2
+
+
+def test_unlimited_paths_and_disabled_middleware_pass_through():
+    app = EchoApp()
+    assert (
+        statuses(RateLimitMiddleware(app, limits=LIMITS), [{"path": "/other"}] * 5)
+        == [200] * 5
+    )
+    assert (
+        statuses(
+            RateLimitMiddleware(app, limits=LIMITS, enabled=False),
+            [{"headers": [bearer("u1")]}] * 5,
+        )
+        == [200] * 5
+    )
+
+
+def test_users_and_ips_have_separate_buckets():
+    middleware = RateLimitMiddleware(EchoApp(), limits=LIMITS)
+    ip_burst = int(LIMITS[PATH][1] * RATE_LIMIT_IP_FACTOR)
+
+    # u1's bucket is empty, u2's on the same IP is not
+    assert statuses(middleware, [{"headers": [bearer("u1")]}] * 3) == [200, 200, 429]
+    assert statuses(middleware, [{"headers": [bearer("u2")]}]) == [200]
+    # Another IP does not refill u1's bucket
+    assert statuses(middleware, [{"headers": [bearer("u1")], "ip": "10.0.0.2"}]) == [
+        429
+    ]
+
+    # Many users behind one IP share its larger bucket
+    used = 2 + 1  # u1 and u2 above, 429s take no token
+    users = [{"headers": [bearer(f"user-{n}")]} for n in range(ip_burst - used + 1)]
+    assert statuses(middleware, users) == [200] * (ip_burst - used) + [429]
+    assert statuses(middleware, [{"headers": [bearer("new")], "ip": "10.0.0.3"}]) == [
+        200
+    ]
+
+
+def test_body_user_id_is_used_and_replayed_to_the_app():
+    app = EchoApp()
+    middleware = RateLimitMiddleware(app, limits=LIMITS)
+    body = trade("u1")
+
+    async def run():
+        return [await request(middleware, body=body) for _ in range(3)]
+
+    responses = asyncio.run(run())
+
+    assert [status for status, _, _ in responses] == [200, 200, 429]
+    # The app still reads the whole body the middleware inspected
+    assert [echo for _, _, echo in responses[:2]] == [body, body]
+    assert (PATH, "user", "u1") in middleware.buckets._buckets
+    # Another user's body on the same IP has its own bucket
+    assert statuses(middleware, [{"body": trade("u2")}]) == [200]
+
+
+def test_writes_beyond_the_concurrency_limit_get_503():
+    app = EchoApp()
+    middleware = RateLimitMiddleware(app, limits=LIMITS, write_concurrency=1)
+
+    async def run():
+        app.release = asyncio.Event()
+        first = asyncio.create_task(request(middleware, path="/other", body=b"{}"))
+        while middleware.writes_in_flight < 1:
+            await asyncio.sleep(0)
+        busy = await request(middleware, path="/other", body=b"{}")
+        read = await request(middleware, method="GET", path="/other")
+        app.release.set()
+        return busy, read, await first
+
+    (status, headers, _), read, first = asyncio.run(run())
+
+    assert (status, headers[b"retry-after"]) == (503, b"1")
+    assert read[0] == 200
+    assert first[0] == 200
+    assert middleware.writes_in_flight == 0
+
+
+def test_zero_rate_is_rejected():
+    with pytest.raises(ValueError):
+        TokenBuckets({PATH: (0.0, 2.0)})
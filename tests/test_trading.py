@@ -0,0 +1,159 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import inspect, text
+
+from app import counters
+from app.db_config import savepoint
+from app.ledger import to_minor
+from app.models import LedgerEntry, Position, Share, Trade, User
+from app.schemas import BuyShareRequest, SellShareRequest
+from app.trading import execute_buy, execute_orders, execute_sell, submit_orders
+
+
+def buy(user, event, shares, price, outcome="yes"):
+    return BuyShareRequest(
+        user_id=user.id,
+        event_id=event.id,
+        outcome=outcome,
+        bet_type="buy",
+        shareCount=shares,
+        share_price=price,
+    )
+
+
+def sell(user, event, shares, price, outcome="yes"):
+    return SellShareRequest(
+        user_id=user.id,
+        event_id=event.id,
+        outcome=outcome,
+        bet_type="sell",
+        shareCount=shares,
+        share_price=price,
+    )
+
+
+def balance(db, user):
+    db.expire_all()
+    return db.get(User, user.id).balance_minor
+
+
+def test_migrations_ran(engines):
+    engine, _ = engines
+    assert "alembic_version" in inspect(engine).get_table_names()
+    with engine.connect() as connection:
+        assert connection.execute(
+            text("SELECT version_num FROM alembic_version")
+        ).scalar()
+
+
+def test_buy_debits_the_balance_and_opens_a_position(db, make_user, make_event):
+    user, event = make_user(1000), make_event()
+
+    assert execute_buy(buy(user, event, 10, 40), db) == 0
+    db.commit()
+
+    assert balance(db, user) == to_minor(1000 - 4)
+    position = db.get(Position, (user.id, event.id))
+    assert (position.outcome, position.net_shares, position.avg_cost) == ("yes", 10, 40)
+    [lot] = db.query(Share).filter(Share.user_id == user.id).all()
+    assert (lot.amount, lot.bet_type, lot.share_price) == (10, "buy", 40)
+    [entry] = db.query(LedgerEntry).filter(LedgerEntry.user_id == user.id).all()
+    assert entry.amount_minor == -to_minor(4)
+    assert db.query(Trade).filter(Trade.user_id == user.id).count() == 1
+    assert counters.get_totals(db, event.id) == (10, 0)
+
+
+def test_sell_closes_lots_and_realises_pnl(db, make_user, make_event):
+    user, event = make_user(1000), make_event()
+    execute_buy(buy(user, event, 10, 40), db)
+    db.commit()
+    before = balance(db, user)
+
+    profit = execute_sell(sell(user, event, 4, 60), db)
+    db.commit()
+
+    # Closing a buy lot realises (lot price - sell price) per share
+    assert profit == pytest.approx(4 * (0.40 - 0.60))
+    assert balance(db, user) - before == to_minor(-0.8)
+    position = db.get(Position, (user.id, event.id))
+    assert position.net_shares == 6
+    assert position.realized_pnl_minor == to_minor(-0.8)
+    [lot] = db.query(Share).filter(Share.user_id == user.id).all()
+    assert lot.amount == 6
+    trade = db.query(Trade).order_by(Trade.id.desc()).first()
+    assert (trade.bet_type, trade.realized_pnl_minor) == ("sell", to_minor(-0.8))
+    assert counters.get_totals(db, event.id) == (6, 0)
+
+
+def test_insufficient_balance_rejects_without_partial_writes(db, make_user, make_event):
+    user, event = make_user(10), make_event()
+
+    with pytest.raises(HTTPException) as error:
+        with savepoint(db):
+            execute_buy(buy(user, event, 100, 50), db)
+    db.commit()
+
+    assert error.value.status_code == 400
+    assert balance(db, user) == to_minor(10)
+    assert db.query(Share).count() == 0
+    assert db.query(Position).count() == 0
+    assert db.query(LedgerEntry).count() == 0
+    assert db.query(Trade).count() == 0
+    assert counters.get_totals(db, event.id) == (0, 0)
+
+
+def test_batch_rolls_back_only_the_rejected_order(db, make_user, make_event):
+    user, other = make_user(100), make_user(100)
+    event = make_event()
+    orders = [
+        buy(user, event, 10, 50),
+        buy(other, event, 1000, 50),  # Costs 500 of 100
+        buy(other, event, 4, 50),
+    ]
+
+    results = execute_orders(orders, db)
+    db.commit()
+
+    assert [result["status"] for result in results] == [
+        "executed",
+        "rejected",
+        "executed",
+    ]
+    assert results[1]["detail"] == "Insufficient balance for the trade."
+    assert balance(db, user) == to_minor(95)
+    assert balance(db, other) == to_minor(98)
+    assert db.get(Position, (other.id, event.id)).net_shares == 4
+    assert db.query(Trade).count() == 2
+    assert counters.get_totals(db, event.id) == (14, 0)
+
+
+def test_submit_orders_runs_each_event_on_the_sequencer(db, make_user, make_event):
+    user = make_user(1000)
+    first, second = make_event(), make_event()
+    orders = [
+        buy(user, first, 10, 50),
+        buy(user, second, 5, 20),
+        sell(user, first, 2, 50),
+        buy(user, second, 0, 20),
+    ]
+
+    results = asyncio.run(submit_orders(orders))
+
+    assert [result["event_id"] for result in results] == [
+        first.id,
+        second.id,
+        first.id,
+        second.id,
+    ]
+    assert [result["status"] for result in results] == [
+        "executed",
+        "executed",
+        "executed",
+        "rejected",
+    ]
+    # Committed by the sequencer's group commit
+    assert balance(db, user) == to_minor(1000 - 5 - 1)
+    assert db.get(Position, (user.id, first.id)).net_shares == 8
+    assert db.get(Position, (user.id, second.id)).net_shares == 5
@@ -0,0 +1,26 @@
+import pytest
+
+from app import user_listing
+
+
+@pytest.mark.parametrize(
+    "search, expected",
+    [
+        ("100%", ["Sale"]),
+        ("a_b", ["Under"]),
+        ("back\\slash", ["Slash"]),
+        ("ALICE", ["Alice"]),
+        ("%", ["Sale"]),
+        ("_", ["Under"]),
+    ],
+)
+def test_search_matches_wildcards_literally(db, make_user, search, expected):
+    make_user(first_name="Alice", last_name="Plain")
+    make_user(first_name="Sale", last_name="100% off")
+    make_user(first_name="Under", last_name="a_b")
+    make_user(first_name="Slash", last_name="back\\slash")
+    make_user(first_name="Near", last_name="100 off axb backslash")
+
+    rows, _ = user_listing.page(db, search=search)
+
+    assert [row["first_name"] for row in rows] == expected